@@ -1,4 +1,12 @@
-from .main import preprocess_markdown_file, compile_markdown_to_pdf
+from .main import preprocess_markdown_file, compile_markdown_to_pdf, compile_markdown_string
+from .batch import compile_markdown_files, BatchItem
+from .async_compile import preprocess_markdown_file_async, compile_markdown_to_pdf_async, compile_markdown_string_async
+from .watch import DocumentWatcher
+from .compile_result import CompileResult, StageTiming
+from .build_cache import BuildCache
+from .pandoc_blocks import PandocBlockCache
+from .embed_cache import EmbedCache
+from .tex_engines import ENGINES, EngineTimings
 from .constants import templates  # Import templates from constants
 
-__all__ = ['preprocess_markdown_file', 'compile_markdown_to_pdf', 'templates']
+__all__ = ['preprocess_markdown_file', 'compile_markdown_to_pdf', 'compile_markdown_string', 'preprocess_markdown_file_async', 'compile_markdown_to_pdf_async', 'compile_markdown_string_async', 'compile_markdown_files', 'BatchItem', 'DocumentWatcher', 'CompileResult', 'StageTiming', 'BuildCache', 'PandocBlockCache', 'EmbedCache', 'ENGINES', 'EngineTimings', 'templates']
@@ -0,0 +1,458 @@
+import os
+import sys
+import time
+import signal
+import shutil
+import asyncio
+import functools
+import subprocess
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Tuple
+from .main import resolve_template, write_markdown
+from .python_evaluation import evaluate_python_in_markdown_string
+from .dataframe_rendering import DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT, pandoc_table_args
+from .latex_passes import MAX_PASSES, discard_attempt, engine_candidates, pdf_path_for, plan_latex_passes
+from .compile_result import CompileResult
+from .build_cache import BuildCache
+from .embed_cache import EmbedCache
+from .format_cache import FormatCache
+from .pandoc_blocks import PandocBlockCache, convert_markdown_to_latex_by_blocks
+from .sandbox import SandboxPool
+from .tex_engines import DEFAULT_ENGINE, ENGINES, EngineTimings, TexEngine, requested_engine
+from .workspace import Workspace, default_workspace_pool
+from .build_dirs import BuildDirectories
+
+# Async counterparts of the compile pipeline for services running on an event loop.
+# pandoc and pdflatex are awaited as child processes; embedded Python, being arbitrary
+# user code, still runs synchronously, on an executor (or a sandbox worker).
+
+
+async def run_process(
+    command: List[str],
+    input: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None
+) -> subprocess.CompletedProcess:
+    """
+    Run a command to completion without blocking the event loop, like
+    `subprocess.run(check=True, capture_output=True, text=True)`.
+
+    The child runs in its own process group. If the awaiting task is cancelled, the whole
+    group (e.g. pdflatex and anything it spawned) is killed and reaped before the
+    cancellation propagates.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = await process.communicate(input.encode('utf-8') if input is not None else None)
+    except BaseException:
+        if process.returncode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+        raise
+
+    completed = subprocess.CompletedProcess(
+        command, process.returncode,
+        stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace')
+    )
+    completed.check_returncode()
+    return completed
+
+
+async def run_latex_passes_async(
+    tex_file: str,
+    output_dir: str,
+    max_passes: int = MAX_PASSES,
+    result: Optional[CompileResult] = None,
+    format_name: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    engine: TexEngine = ENGINES[DEFAULT_ENGINE],
+    tex_source: Optional[str] = None
+) -> Tuple[str, str, int]:
+    """`run_latex_passes`, awaiting each TeX pass."""
+    passes = 0
+    stderr = ""
+    for command in plan_latex_passes(tex_file, output_dir, max_passes, format_name, engine, tex_source):
+        timer = result.stage(f"tex_pass_{passes + 1}") if result is not None else nullcontext()
+        with timer:
+            completed = await run_process(command, env=env)
+        passes += 1
+        stderr = completed.stderr
+    return pdf_path_for(tex_file, output_dir), stderr, passes
+
+
+async def typeset_async(
+    tex_file: str,
+    output_dir: str,
+    template_content: Optional[str],
+    result: CompileResult,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None,
+    format_cache: Optional[FormatCache] = None,
+    executor: Optional[Executor] = None
+) -> Tuple[str, str, int]:
+    """`typeset`, awaiting each TeX pass; format dumps and timing records run on `executor`."""
+    candidates, timings = await _in_executor(executor, engine_candidates, engine, template_content, engine_timings)
+    with open(tex_file, 'r', encoding='utf-8') as f:
+        tex_source = f.read()
+
+    for attempt, tex_engine in enumerate(candidates):
+        if attempt:
+            discard_attempt(tex_file, output_dir, tex_source)
+        started = time.perf_counter()
+        try:
+            pdf_path, stderr, passes = await _typeset_with_format_async(
+                tex_file, output_dir, tex_source, template_content, result, tex_engine, format_cache, executor
+            )
+        except (OSError, subprocess.CalledProcessError):
+            if timings is None:
+                raise
+            await _in_executor(executor, timings.record_failure, timings.key(template_content), tex_engine.name)
+            if attempt == len(candidates) - 1:
+                raise
+            continue
+        if timings is not None:
+            await _in_executor(
+                executor, timings.record, timings.key(template_content), tex_engine.name, time.perf_counter() - started
+            )
+        result.engine = tex_engine.name
+        return pdf_path, stderr, passes
+
+
+async def _typeset_with_format_async(
+    tex_file: str,
+    output_dir: str,
+    tex_source: str,
+    template_content: Optional[str],
+    result: CompileResult,
+    engine: TexEngine,
+    format_cache: Optional[FormatCache],
+    executor: Optional[Executor]
+) -> Tuple[str, str, int]:
+    format_name = None
+    if format_cache is not None and engine.formats:
+        with result.stage("format"):
+            format_name = await _in_executor(executor, format_cache.apply, tex_file, template_content, engine.name)
+    try:
+        return await _run_checked_async(
+            tex_file, output_dir, result, format_name, format_cache.env if format_name else None, engine, tex_source
+        )
+    except (OSError, subprocess.CalledProcessError):
+        if format_name is None:
+            raise
+    discard_attempt(tex_file, output_dir, tex_source)
+    built = await _run_checked_async(tex_file, output_dir, result, None, None, engine, tex_source)
+    await _in_executor(executor, format_cache.mark_failed, format_name)
+    return built
+
+
+async def _run_checked_async(
+    tex_file: str,
+    output_dir: str,
+    result: CompileResult,
+    format_name: Optional[str],
+    env: Optional[Dict[str, str]],
+    engine: TexEngine,
+    tex_source: str
+) -> Tuple[str, str, int]:
+    pdf_path, stderr, passes = await run_latex_passes_async(
+        tex_file, output_dir, result=result, format_name=format_name, env=env, engine=engine, tex_source=tex_source
+    )
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF was not generated at: {pdf_path}")
+    return pdf_path, stderr, passes
+
+
+def _cache_lookup(
+    cache: BuildCache,
+    evaluated_content: str,
+    template_content: Optional[str],
+    engine: Optional[str]
+) -> Tuple[str, Optional[str]]:
+    # The key probes the TeX engine's version (a subprocess) on first use
+    cache_key = cache.key(evaluated_content, template_content, requested_engine(engine, template_content))
+    return cache_key, cache.get(cache_key)
+
+
+@asynccontextmanager
+async def _use_build_dir(
+    build_dirs: Optional[BuildDirectories],
+    source_file: str,
+    template_content: Optional[str],
+    executor: Optional[Executor]
+) -> AsyncIterator[Optional[str]]:
+    # `build_dirs.use`, with its locking, reset and eviction run on `executor`
+    if build_dirs is None:
+        yield None
+        return
+    holder = build_dirs.use(source_file, template_content)
+    build_dir = await _in_executor(executor, holder.__enter__)
+    try:
+        yield build_dir
+    except BaseException:
+        if not await _in_executor(executor, holder.__exit__, *sys.exc_info()):
+            raise
+    else:
+        await _in_executor(executor, holder.__exit__, None, None, None)
+
+
+async def _in_executor(executor: Optional[Executor], fn: Any, *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+async def evaluate_markdown_async(
+    markdown_content: str,
+    result: CompileResult,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    executor: Optional[Executor] = None
+) -> str:
+    """
+    Evaluate the embedded Python on `executor` (the loop's default one if None). Cancelling
+    stops waiting for it; use a `sandbox` so a runaway document is also bounded in time.
+    With `jobs` > 1 every evaluation forks a worker pool of its own, so concurrent builds
+    never render each other's EMBEDs.
+    """
+    evaluate = sandbox.evaluate if sandbox is not None else evaluate_python_in_markdown_string
+    with result.stage("evaluate"):
+        return await _in_executor(
+            executor, evaluate, markdown_content, embed_cache=embed_cache, jobs=jobs,
+            max_rows=max_rows, table_format=table_format, result=result
+        )
+
+
+async def preprocess_markdown_file_async(
+    source_file: str,
+    result: Optional[CompileResult] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    executor: Optional[Executor] = None,
+    workspace: Optional[Workspace] = None
+) -> str:
+    """`preprocess_markdown_file` for event loops; returns the path of the evaluated Markdown."""
+    if result is None:
+        result = CompileResult()
+
+    with result.stage("read"):
+        with open(source_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+
+    evaluated_content = await evaluate_markdown_async(
+        markdown_content, result, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows,
+        table_format=table_format, sandbox=sandbox, executor=executor
+    )
+
+    with result.stage("write_markdown"):
+        if workspace is not None:
+            return write_markdown(workspace, evaluated_content)
+        pool = default_workspace_pool()
+        workspace = pool.acquire()
+        try:
+            temp_md_path = write_markdown(workspace, evaluated_content)
+        except BaseException:
+            pool.release(workspace)
+            raise
+        pool.hand_off(workspace)
+    return temp_md_path
+
+
+async def _render_pdf(
+    evaluated_content: str,
+    template_content: Optional[str],
+    scratch_dir: str,
+    output_dir: Optional[str],
+    result: CompileResult,
+    block_cache: Optional[PandocBlockCache],
+    format_cache: Optional[FormatCache],
+    engine: Optional[str],
+    engine_timings: Optional[EngineTimings],
+    tex_limiter: Optional[AsyncContextManager],
+    executor: Optional[Executor]
+) -> str:
+    # pandoc from stdin into `scratch_dir`, then TeX into `output_dir` (default: the same); returns the PDF path
+    tex_path = os.path.join(scratch_dir, "document.tex")
+    template_path = None
+    if template_content:
+        template_path = os.path.join(scratch_dir, "template.latex")
+        with open(template_path, 'w', encoding='utf-8') as f:
+            f.write(template_content)
+
+    with result.stage("pandoc"):
+        stderr = None
+        if block_cache is not None:
+            # The block cache converts blocks with blocking pandoc calls of its own
+            stderr = await _in_executor(
+                executor, convert_markdown_to_latex_by_blocks, evaluated_content, tex_path, block_cache, template_path
+            )
+        if stderr is None:
+            pandoc_cmd = ['pandoc', '-f', 'markdown', '-t', 'latex', '-s', '-o', tex_path]
+            if template_path:
+                pandoc_cmd.append(f'--template={template_path}')
+            pandoc_cmd += pandoc_table_args(evaluated_content)
+            stderr = (await run_process(pandoc_cmd, input=evaluated_content)).stderr
+        result.stderr['pandoc'] = stderr
+
+    # Every TeX process of this build (format dump included) runs under one limiter slot
+    async with tex_limiter if tex_limiter is not None else nullcontext():
+        pdf_path, result.stderr['pdflatex'], result.tex_passes = await typeset_async(
+            tex_path, output_dir or scratch_dir, template_content, result,
+            engine, engine_timings, format_cache, executor
+        )
+    return pdf_path
+
+
+async def compile_markdown_to_pdf_async(
+    source_file_name_without_extension: str,
+    preprocessed_source_file: str,
+    template_content: Optional[str] = None,
+    output_pdf: Optional[str] = None,
+    return_binary: bool = False,
+    result: Optional[CompileResult] = None,
+    cache: Optional[BuildCache] = None,
+    block_cache: Optional[PandocBlockCache] = None,
+    format_cache: Optional[FormatCache] = None,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None,
+    build_dirs: Optional[BuildDirectories] = None,
+    tex_limiter: Optional[AsyncContextManager] = None,
+    executor: Optional[Executor] = None,
+    workspace: Optional[Workspace] = None
+) -> CompileResult:
+    """
+    `compile_markdown_to_pdf` for event loops: pandoc and pdflatex are awaited, and at most
+    as many builds run TeX at once as `tex_limiter` (e.g. an `asyncio.Semaphore`) admits.
+    Cancelling the task kills the running pandoc/pdflatex and removes the scratch files
+    (those in `workspace` are left for its owner to release); a persistent build directory
+    from `build_dirs` has its TeX state reset.
+    """
+    if not preprocessed_source_file.endswith('.md'):
+        raise ValueError("The source file must be a Markdown (.md) file.")
+
+    if result is None:
+        result = CompileResult()
+
+    with open(preprocessed_source_file, 'r', encoding='utf-8') as f:
+        evaluated_content = f.read()
+
+    pdf_path = None
+    if cache is not None:
+        with result.stage("cache_lookup"):
+            cache_key, pdf_path = await _in_executor(
+                executor, _cache_lookup, cache, evaluated_content, template_content, engine
+            )
+        result.cache_hit = pdf_path is not None
+
+    scratch = (
+        nullcontext(workspace) if workspace is not None
+        else default_workspace_pool().workspace(handed_off_file=preprocessed_source_file)
+    )
+    persistent = _use_build_dir(
+        build_dirs if pdf_path is None else None, source_file_name_without_extension, template_content, executor
+    )
+    with scratch as build_space:
+        async with persistent as build_dir:
+            if pdf_path is None:
+                pdf_path = await _render_pdf(
+                    evaluated_content, template_content, build_space.path, build_dir, result,
+                    block_cache, format_cache, engine, engine_timings, tex_limiter, executor
+                )
+                if cache is not None:
+                    with result.stage("cache_store"):
+                        await _in_executor(executor, cache.put, cache_key, pdf_path)
+
+        if return_binary:
+            with result.stage("return"):
+                with open(pdf_path, 'rb') as pdf_file:
+                    result.pdf_bytes = pdf_file.read()
+            result.output_size = len(result.pdf_bytes)
+            return result
+
+        with result.stage("move"):
+            if output_pdf is None:
+                pdf_basename = os.path.splitext(os.path.basename(source_file_name_without_extension))[0] + ".pdf"
+                output_pdf = os.path.join(os.getcwd(), pdf_basename)
+            if os.path.exists(output_pdf):
+                os.remove(output_pdf)
+            if result.cache_hit:
+                shutil.copyfile(pdf_path, output_pdf)
+            else:
+                shutil.move(pdf_path, output_pdf)
+        result.pdf_path = output_pdf
+        result.output_size = os.path.getsize(output_pdf)
+        return result
+
+
+async def compile_markdown_string_async(
+    markdown_content: str,
+    template: Optional[str] = None,
+    result: Optional[CompileResult] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    cache: Optional[BuildCache] = None,
+    block_cache: Optional[PandocBlockCache] = None,
+    format_cache: Optional[FormatCache] = None,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None,
+    tex_limiter: Optional[AsyncContextManager] = None,
+    executor: Optional[Executor] = None
+) -> bytes:
+    """
+    `compile_markdown_string` for event loops: evaluates the embedded Python on `executor`
+    (or `sandbox`), then awaits pandoc and pdflatex. `tex_limiter` bounds concurrent TeX
+    jobs across every build sharing it; cancelling kills the child processes.
+    """
+    if result is None:
+        result = CompileResult()
+
+    evaluated_content = await evaluate_markdown_async(
+        markdown_content, result, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows,
+        table_format=table_format, sandbox=sandbox, executor=executor
+    )
+    template_content = resolve_template(template)
+
+    cache_key = None
+    if cache is not None:
+        with result.stage("cache_lookup"):
+            cache_key, cached_pdf = await _in_executor(
+                executor, _cache_lookup, cache, evaluated_content, template_content, engine
+            )
+        if cached_pdf is not None:
+            result.cache_hit = True
+            with result.stage("return"):
+                with open(cached_pdf, 'rb') as pdf_file:
+                    result.pdf_bytes = pdf_file.read()
+            result.output_size = len(result.pdf_bytes)
+            return result.pdf_bytes
+
+    with default_workspace_pool().workspace() as scratch:
+        pdf_path = await _render_pdf(
+            evaluated_content, template_content, scratch.path, None, result,
+            block_cache, format_cache, engine, engine_timings, tex_limiter, executor
+        )
+        if cache is not None:
+            with result.stage("cache_store"):
+                await _in_executor(executor, cache.put, cache_key, pdf_path)
+
+        with result.stage("return"):
+            with open(pdf_path, 'rb') as pdf_file:
+                result.pdf_bytes = pdf_file.read()
+        result.output_size = len(result.pdf_bytes)
+        return result.pdf_bytes
@@ -0,0 +1,180 @@
+import os
+import glob
+import json
+import time
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from .main import compile_markdown_to_pdf, evaluate_markdown_file, write_markdown
+from .compile_result import CompileResult
+from .embed_cache import EmbedCache
+from .dataframe_rendering import DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT
+from .python_evaluation import preload_document_libraries
+from .sandbox import SandboxPool
+from .workspace import default_workspace_pool
+
+
+@dataclass
+class BatchItem:
+    """Outcome of one document in a batch build."""
+    source_file: str
+    output_pdf: str
+    ok: bool = False
+    error: Optional[str] = None
+    wall_time: float = 0.0
+    result: CompileResult = field(default_factory=CompileResult)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'source_file': self.source_file,
+            'output_pdf': self.output_pdf,
+            'ok': self.ok,
+            'error': self.error,
+            'wall_time': round(self.wall_time, 4),
+            'output_size': self.result.output_size,
+            'tex_passes': self.result.tex_passes,
+            'engine': self.result.engine,
+            'cache_hit': self.result.cache_hit,
+            'stale_embeds': self.result.stale_embeds,
+            'stages': {s.name: round(s.wall_time, 4) for s in self.result.stages},
+        }
+
+
+def expand_sources(patterns: Iterable[str]) -> List[str]:
+    """Expand file names and glob patterns into a de-duplicated, ordered list of Markdown files."""
+    sources: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in sources:
+                sources.append(path)
+    return sources
+
+
+def _evaluate(
+    source_file: str,
+    embed_cache: Optional[EmbedCache],
+    max_rows: Optional[int],
+    table_format: str,
+    sandbox: Optional[SandboxPool] = None,
+    jobs: int = 1
+) -> Tuple[str, CompileResult]:
+    # Runs in a worker process (or, with a sandbox, a thread handing it to a sandbox worker):
+    # executes the document's code blocks in isolation
+    result = CompileResult()
+    evaluated_content = evaluate_markdown_file(
+        source_file, result=result, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows,
+        table_format=table_format, sandbox=sandbox
+    )
+    return evaluated_content, result
+
+
+def _compile(item: BatchItem, evaluated_content: str, template_content: Optional[str], compile_options: Dict[str, Any]) -> None:
+    # Runs on a compiler thread: the document's files only exist while it is being typeset,
+    # so there are never more workspaces than compiler threads
+    with default_workspace_pool().workspace() as workspace:
+        with item.result.stage("write_markdown"):
+            md_path = write_markdown(workspace, evaluated_content)
+        compile_markdown_to_pdf(
+            source_file_name_without_extension=item.source_file,
+            preprocessed_source_file=md_path,
+            template_content=template_content,
+            output_pdf=item.output_pdf,
+            result=item.result,
+            workspace=workspace,
+            **compile_options
+        )
+
+
+def compile_markdown_files(
+    source_files: Iterable[str],
+    output_dir: Optional[str] = None,
+    template_content: Optional[str] = None,
+    workers: Optional[int] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    jobs: int = 1,
+    **compile_options: Any
+) -> List[BatchItem]:
+    """
+    Compile many Markdown files to PDF with a bounded number of workers.
+
+    Embedded Python is evaluated on a process pool (each document gets a fresh namespace)
+    while pandoc and pdflatex run on a thread pool, so one document's evaluation overlaps
+    another's TeX passes. With a `sandbox`, evaluation runs on its bounded, pre-forked workers
+    instead, so a runaway document times out rather than holding up the batch. PDFs are
+    written to `output_dir` (default: the working directory). Failures are recorded per file
+    rather than aborting the batch.
+    """
+    sources = expand_sources(source_files)
+    workers = max(1, workers or os.cpu_count() or 1)
+    output_dir = output_dir or os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+
+    items: List[BatchItem] = []
+    seen: Set[str] = set()
+    for source in sources:
+        pdf_name = os.path.splitext(os.path.basename(source))[0] + ".pdf"
+        if pdf_name in seen:
+            raise ValueError(f"Two source files would both be written to {pdf_name}: rename one of them.")
+        seen.add(pdf_name)
+        items.append(BatchItem(source_file=source, output_pdf=os.path.join(output_dir, pdf_name)))
+
+    if sandbox is not None:
+        # The sandbox's workers already have everything loaded; threads just wait on them
+        evaluators: Executor = ThreadPoolExecutor(max_workers=sandbox.workers)
+    elif "fork" in multiprocessing.get_all_start_methods():
+        # Fork keeps pandas & friends warm in the workers where the platform allows it
+        preload_document_libraries()
+        evaluators = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    else:
+        evaluators = ProcessPoolExecutor(max_workers=workers)
+
+    started: Dict[int, float] = {}
+    with evaluators, ThreadPoolExecutor(max_workers=workers) as compilers:
+        pending: Dict[Future, Tuple[str, int]] = {}
+        for index, item in enumerate(items):
+            started[index] = time.perf_counter()
+            future = evaluators.submit(_evaluate, item.source_file, embed_cache, max_rows, table_format, sandbox, jobs)
+            pending[future] = ("evaluate", index)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index = pending.pop(future)
+                item = items[index]
+                try:
+                    if stage == "evaluate":
+                        # Hand the evaluated document straight to the TeX side
+                        evaluated_content, item.result = future.result()
+                        compile_future = compilers.submit(_compile, item, evaluated_content, template_content, compile_options)
+                        pending[compile_future] = ("compile", index)
+                        continue
+                    future.result()
+                    item.ok = True
+                except Exception as exc:
+                    item.error = f"{type(exc).__name__}: {exc}"
+                item.wall_time = time.perf_counter() - started[index]
+
+    return items
+
+
+def format_summary(items: List[BatchItem]) -> str:
+    """One line per document plus a totals line, for printing after a batch run."""
+    lines = []
+    for item in items:
+        if item.ok:
+            lines.append(f"OK      {item.source_file} -> {item.output_pdf} ({item.wall_time:.2f}s, {item.result.output_size} bytes)")
+        else:
+            lines.append(f"FAILED  {item.source_file}: {item.error}")
+    failed = sum(1 for item in items if not item.ok)
+    lines.append(f"{len(items) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
+
+
+def write_summary(items: List[BatchItem], path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([item.to_dict() for item in items], f, indent=2)
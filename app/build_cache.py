@@ -0,0 +1,187 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    """Base directory for all md2ltx caches ($MD2LTX_CACHE_DIR, else $XDG_CACHE_HOME/md2ltx)."""
+    if os.environ.get('MD2LTX_CACHE_DIR'):
+        return os.environ['MD2LTX_CACHE_DIR']
+    xdg = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(xdg, 'md2ltx')
+
+
+@lru_cache(maxsize=None)
+def tool_version(executable: str) -> str:
+    """First line of `<executable> --version`, or 'unavailable' if it can't be run."""
+    try:
+        completed = subprocess.run(
+            [executable, '--version'],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+        lines = completed.stdout.strip().splitlines()
+        return lines[0] if lines else 'unknown'
+    except (OSError, subprocess.CalledProcessError):
+        return 'unavailable'
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write to a sibling temp file and rename it into place so readers never see partial files."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def _locked(lock_path: str) -> Iterator[None]:
+    # An exclusive lock on `lock_path`, waited for, across threads and processes
+    with open(lock_path, 'a', encoding='utf-8') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def evict_lru(directory: str, max_bytes: int, suffix: str) -> int:
+    """
+    Delete the least recently used `*suffix` files in `directory` (oldest mtime first)
+    until their total size is at most `max_bytes`. Returns the number of bytes freed.
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+    return freed
+
+
+class BuildCache:
+    """
+    Content-addressed store of finished PDFs.
+
+    Entries are keyed by a hash of the evaluated Markdown, the template text, the TeX
+    engine and the pandoc/TeX versions, so any change to the inputs or the toolchain
+    produces a new key. Access time is tracked through the file mtime; once the cache
+    grows past `max_bytes` the least recently used PDFs are evicted.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = os.path.join(directory or default_cache_dir(), 'pdf')
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._stats_path = os.path.join(self.directory, 'stats.json')
+
+    def key(self, evaluated_content: str, template_content: Optional[str] = None, engine: str = 'pdflatex') -> str:
+        sha = hashlib.sha256()
+        for part in (
+            evaluated_content,
+            template_content or '',
+            engine,
+            tool_version('pandoc'),
+            tool_version(engine)
+        ):
+            sha.update(part.encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached PDF path for `key` (marking it recently used), or None on a miss."""
+        path = self._entry_path(key)
+        if os.path.exists(path):
+            os.utime(path, None)
+            self._record('hits')
+            return path
+        self._record('misses')
+        return None
+
+    def put(self, key: str, pdf_path: str) -> str:
+        """Copy a freshly built PDF into the cache and evict old entries if over the size cap."""
+        path = self._entry_path(key)
+        with open(pdf_path, 'rb') as f:
+            atomic_write(path, f.read())
+        self.evict()
+        return path
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in `max_bytes`; returns bytes freed."""
+        freed = evict_lru(self.directory, self.max_bytes, '.pdf')
+        if freed:
+            self._record('evictions')
+        return freed
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _load_stats(self) -> Dict[str, int]:
+        try:
+            with open(self._stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _record(self, counter: str) -> None:
+        # Builds in other threads and processes update the same counters
+        with _locked(self._stats_path + '.lock'):
+            stats = self._load_stats()
+            stats[counter] = stats.get(counter, 0) + 1
+            atomic_write(self._stats_path, json.dumps(stats).encode('utf-8'))
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters plus the current number of entries and their total size."""
+        stats = self._load_stats()
+        sizes = [
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory) if name.endswith('.pdf')
+        ]
+        return {
+            'hits': stats.get('hits', 0),
+            'misses': stats.get('misses', 0),
+            'evictions': stats.get('evictions', 0),
+            'entries': len(sizes),
+            'bytes': sum(sizes),
+            'max_bytes': self.max_bytes
+        }
@@ -0,0 +1,152 @@
+import os
+import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+from .build_cache import default_cache_dir
+from .latex_passes import AUX_EXTENSIONS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Held by the build using a directory, across threads and processes
+LOCK_FILE = '.lock'
+
+
+def _try_lock(lock_path: str) -> Optional[IO[str]]:
+    # An exclusive, non-blocking lock on `lock_path`, released by closing the returned file
+    try:
+        handle = open(lock_path, 'a', encoding='utf-8')
+    except OSError:
+        return None
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        # The directory may have been evicted between opening and locking
+        if os.fstat(handle.fileno()).st_ino != os.stat(lock_path).st_ino:
+            raise FileNotFoundError(lock_path)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for root, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return size
+
+
+class BuildDirectories:
+    """
+    Persistent TeX output directories, one per document and template.
+
+    TeX writes its auxiliary files (.aux, .toc, ...) into the document's directory and
+    finds them there on the next build, so a rebuild whose labels and headings didn't
+    change settles in a single pass instead of starting from a draft pass (see
+    latex_passes). One build, in any process, uses a document's directory at a time, and a
+    build that fails has its auxiliary files removed so the next one starts clean. Like the
+    caches, the least recently used directories are evicted once they hold more than
+    `max_bytes`.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = os.path.join(directory or default_cache_dir(), 'builds')
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source_file: str, template_content: Optional[str] = None) -> str:
+        sha = hashlib.sha256()
+        sha.update(os.path.abspath(source_file).encode('utf-8'))
+        sha.update(b'\0')
+        sha.update((template_content or '').encode('utf-8'))
+        return sha.hexdigest()[:32]
+
+    def path_for(self, source_file: str, template_content: Optional[str] = None) -> str:
+        """The build directory of `source_file` built with `template_content`, created on first use."""
+        path = os.path.join(self.directory, self.key(source_file, template_content))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @contextmanager
+    def use(self, source_file: str, template_content: Optional[str] = None) -> Iterator[Optional[str]]:
+        """
+        Hold the document's build directory for one build and yield its path, or None if
+        another build of the same document holds it (that build then keeps to its scratch
+        space rather than waiting).
+        """
+        path = self.path_for(source_file, template_content)
+        lock = _try_lock(os.path.join(path, LOCK_FILE))
+        if lock is None:
+            yield None
+            return
+        try:
+            os.utime(path, None)
+            yield path
+        except BaseException:
+            self.reset(path)
+            raise
+        finally:
+            lock.close()
+        self.evict()
+
+    @staticmethod
+    def reset(path: str) -> None:
+        """Forget a document's TeX state: remove its auxiliary files and log."""
+        for name in os.listdir(path):
+            if name.endswith(AUX_EXTENSIONS + ('.log',)):
+                os.remove(os.path.join(path, name))
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used directories (oldest mtime first) until the rest hold
+        at most `max_bytes`, skipping any a build is using. Returns the number of bytes freed.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if os.path.isdir(path):
+                entries.append((mtime, _tree_size(path), path))
+
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            lock = _try_lock(os.path.join(path, LOCK_FILE))
+            if lock is None:
+                continue
+            try:
+                # Moved aside first, so a build starting now gets a fresh directory at `path`
+                doomed = os.path.join(self.directory, f".evicted-{os.path.basename(path)}-{os.getpid()}")
+                os.replace(path, doomed)
+                shutil.rmtree(doomed, ignore_errors=True)
+            except OSError:
+                continue
+            finally:
+                lock.close()
+            total -= size
+            freed += size
+        return freed
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
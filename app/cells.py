@@ -0,0 +1,295 @@
+import ast
+import hashlib
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .compile_result import CompileResult
+
+# Stands for "every name": a star import can bind anything
+ALL_NAMES = "*"
+
+
+class _NameCollector(ast.NodeVisitor):
+    """Names a cell binds at module level, and every name it reads anywhere."""
+
+    def __init__(self):
+        self.defines: Set[str] = set()
+        self.references: Set[str] = set()
+        self._depth = 0
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.references.add(node.id)
+        elif self._depth == 0:
+            self.defines.add(node.id)
+
+    def _visit_scope(self, node: ast.AST) -> None:
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        if self._depth == 0:
+            self.defines.add(node.name)
+        # Decorators and defaults run at definition time, in the enclosing scope
+        for expr in node.decorator_list + node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            self.visit(expr)
+        self._depth += 1
+        for statement in node.body:
+            self.visit(statement)
+        self._depth -= 1
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        if self._depth == 0:
+            self.defines.add(node.name)
+        for expr in node.decorator_list + node.bases + [keyword.value for keyword in node.keywords]:
+            self.visit(expr)
+        self._depth += 1
+        for statement in node.body:
+            self.visit(statement)
+        self._depth -= 1
+
+    visit_Lambda = _visit_scope
+    visit_ListComp = _visit_scope
+    visit_SetComp = _visit_scope
+    visit_DictComp = _visit_scope
+    visit_GeneratorExp = _visit_scope
+
+    def visit_Global(self, node: ast.Global) -> None:
+        # `global x` inside a function lets it rebind a module-level name
+        self.defines.update(node.names)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        if self._depth == 0:
+            for alias in node.names:
+                self.defines.add(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if self._depth == 0:
+            for alias in node.names:
+                self.defines.add(ALL_NAMES if alias.name == "*" else alias.asname or alias.name)
+
+
+@dataclass
+class Cell:
+    """
+    One [START]...[END] code block: its dedented source, the Markdown line it starts on,
+    the module-level names it binds and the names it reads. `code` is None when the
+    block doesn't parse.
+    """
+    source: str
+    line: int
+    digest: str
+    defines: Set[str] = field(default_factory=set)
+    references: Set[str] = field(default_factory=set)
+    code: Optional[CodeType] = None
+    syntax_error: Optional[SyntaxError] = None
+
+    @property
+    def filename(self) -> str:
+        # Keyed by content, so a compiled cell can be reused wherever the block moves
+        return f"<md2ltx cell {self.digest[:16]}>"
+
+
+def make_cell(source: str, line: int, compiled: Optional[Dict[str, Cell]] = None) -> Cell:
+    """Analyse and compile one block, reusing the work from `compiled` (keyed by digest) when possible."""
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    if compiled is not None and digest in compiled:
+        previous = compiled[digest]
+        return Cell(source, line, digest, previous.defines, previous.references, previous.code, previous.syntax_error)
+
+    cell = Cell(source, line, digest)
+    try:
+        tree = ast.parse(source, filename=cell.filename)
+        cell.code = compile(tree, cell.filename, "exec")
+    except SyntaxError as exc:
+        cell.syntax_error = exc
+        return cell
+    collector = _NameCollector()
+    collector.visit(tree)
+    cell.defines, cell.references = collector.defines, collector.references
+    return cell
+
+
+# A cell's identity across builds: its digest and how many identical cells come before it
+CellId = Tuple[str, int]
+
+
+def cell_ids(cells: List[Cell]) -> List[CellId]:
+    """Identify each cell by content, telling identical blocks (e.g. two `import math`) apart by position."""
+    seen: Dict[str, int] = {}
+    ids = []
+    for cell in cells:
+        ids.append((cell.digest, seen.get(cell.digest, 0)))
+        seen[cell.digest] = seen.get(cell.digest, 0) + 1
+    return ids
+
+
+def _upstream(cells: List[Cell]) -> Tuple[List[Dict[str, Optional[CellId]]], Dict[str, CellId]]:
+    """
+    For each cell, the id of the last earlier cell binding each name it reads or binds;
+    and for each name, the id of the last cell binding it.
+    """
+    last_definer: Dict[str, CellId] = {}
+    upstream = []
+    for cell, cell_id in zip(cells, cell_ids(cells)):
+        upstream.append({name: last_definer.get(name) for name in cell.references | cell.defines})
+        for name in cell.defines:
+            last_definer[name] = cell_id
+    return upstream, last_definer
+
+
+def cells_to_run(cells: List[Cell], previous: List[Cell], executed: Set[CellId]) -> List[bool]:
+    """
+    Decide which cells must run, given the cells (`previous`) whose execution produced the
+    current namespace and the ids (see `cell_ids`) of those that ran successfully (`executed`).
+
+    A cell runs if it is new or changed, if it failed last time, if the cells it takes its
+    names from are no longer the same ones (blocks were removed or reordered), or if an
+    earlier cell that runs binds a name it reads or rebinds. An earlier cell binding the
+    same name as a cell that runs runs too, so `df = df[...]` never sees its own previous
+    output. Everything else keeps the namespace state it left behind.
+    """
+    upstream, last_definer = _upstream(cells)
+    previous_upstream, previous_last_definer = _upstream(previous)
+    ids = cell_ids(cells)
+    upstream_by_id = dict(zip(cell_ids(previous), previous_upstream))
+
+    run = []
+    for cell_id, names in zip(ids, upstream):
+        run.append(cell_id not in executed or upstream_by_id.get(cell_id) != names)
+    # The namespace must end up holding each name's value from the cell that binds it last
+    for i, (cell, cell_id) in enumerate(zip(cells, ids)):
+        if any(last_definer[name] == cell_id and previous_last_definer.get(name) != cell_id
+               for name in cell.defines):
+            run[i] = True
+
+    while True:
+        changed_names: Set[str] = set()
+        for i, cell in enumerate(cells):
+            if run[i] or ALL_NAMES in changed_names or (cell.references | cell.defines) & changed_names:
+                run[i] = True
+                changed_names |= cell.defines
+
+        rebinders = [i for i, cell in enumerate(cells) if not run[i] and any(
+            run[j] and cells[j].defines & cell.defines for j in range(i + 1, len(cells))
+        )]
+        if not rebinders:
+            return run
+        for i in rebinders:
+            run[i] = True
+
+
+def stale_names(cells: List[Cell], ran: List[bool], previous: List[Cell]) -> Set[str]:
+    """
+    Names whose value may differ from the previous build: everything bound by a cell that
+    ran or was removed, plus every name bound by a cell that reads a stale name (functions
+    look up other functions at call time, so staleness spreads in both directions of the
+    document).
+    """
+    current = set(cell_ids(cells))
+    stale: Set[str] = set()
+    for cell, cell_id in zip(previous, cell_ids(previous)):
+        if cell_id not in current:
+            stale |= cell.defines
+    for cell, did_run in zip(cells, ran):
+        if did_run:
+            stale |= cell.defines
+    spreading = True
+    while spreading:
+        spreading = False
+        for cell in cells:
+            if cell.defines - stale and (ALL_NAMES in stale or cell.references & stale):
+                stale |= cell.defines
+                spreading = True
+    return stale
+
+
+def execute_cells(
+    cells: List[Cell],
+    env: Dict[str, Any],
+    previous: Optional[List[Cell]] = None,
+    executed: Optional[Set[CellId]] = None,
+    result: Optional[CompileResult] = None
+) -> Tuple[List[bool], List["CellError"]]:
+    """
+    Execute `cells` in document order into the shared namespace `env`, skipping cells that
+    `cells_to_run` says are unaffected since `previous`. Names bound only by removed cells
+    are dropped from `env`. A cell that fails doesn't stop the ones after it, just as a
+    failing block doesn't affect functions defined in other blocks.
+
+    Returns which cells were due to run and the errors raised; `executed` is updated in
+    place with the ids of cells that completed without error. Each `exec` is recorded
+    as a span on `result` when one is given.
+    """
+    previous = previous or []
+    if executed is None:
+        executed = set()
+
+    # Forget removed cells: their names leave the namespace, and they must run if they return
+    kept_names = set().union(*(cell.defines for cell in cells))
+    for cell in previous:
+        for name in cell.defines - kept_names:
+            env.pop(name, None)
+    ids = cell_ids(cells)
+    executed.intersection_update(ids)
+
+    ran = cells_to_run(cells, previous, executed)
+    errors = []
+    bound_earlier: Set[str] = set()
+    for cell, cell_id, run in zip(cells, ids, ran):
+        if not run:
+            bound_earlier |= cell.defines
+            continue
+        # Names no earlier cell binds start out unbound, as they would in a fresh run. Those
+        # the cell only reads are put back afterwards for the later cells that bind them.
+        hidden = {}
+        for name in (cell.references | cell.defines) & kept_names - bound_earlier:
+            if name in env:
+                value = env.pop(name)
+                if name not in cell.defines:
+                    hidden[name] = value
+        bound_earlier |= cell.defines
+        # A cell that fails must run again next time
+        executed.discard(cell_id)
+        try:
+            if cell.code is None:
+                errors.append(CellError(cell, cell.syntax_error))
+                continue
+            timer = result.span(f"exec block (line {cell.line})", "exec", line=cell.line) if result is not None else nullcontext()
+            try:
+                with timer:
+                    exec(cell.code, env, env)
+            except Exception as exc:
+                errors.append(CellError(cell, exc))
+                continue
+            executed.add(cell_id)
+        finally:
+            for name, value in hidden.items():
+                env.setdefault(name, value)
+    return ran, errors
+
+
+class CellError(Exception):
+    """A code block that failed to compile or raised while executing."""
+
+    def __init__(self, cell: Cell, error: BaseException):
+        super().__init__(str(error))
+        self.cell = cell
+        self.error = error
+
+    @property
+    def source_line(self) -> Optional[int]:
+        """The Markdown line the error was raised from, if it can be traced to this cell."""
+        cell_line = None
+        if isinstance(self.error, SyntaxError):
+            cell_line = self.error.lineno
+        traceback = self.error.__traceback__
+        while traceback is not None:
+            if traceback.tb_frame.f_code.co_filename == self.cell.filename:
+                cell_line = traceback.tb_lineno
+            traceback = traceback.tb_next
+        return self.cell.line + cell_line - 1 if cell_line else None
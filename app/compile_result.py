@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus any child processes (pandoc, pdflatex) it has waited on."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+@dataclass
+class StageTiming:
+    """Wall-clock and CPU time spent in one pipeline stage."""
+    name: str
+    wall_time: float
+    cpu_time: float
+
+
+@dataclass
+class Span:
+    """
+    One timed piece of work for profiling: a stage, a code block `exec`, an EMBED call...
+    `start` is a `time.perf_counter()` reading, comparable across processes on one machine.
+    """
+    name: str
+    category: str
+    start: float
+    duration: float
+    pid: int
+    tid: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CompileResult:
+    """
+    Outcome of a build: where the PDF went (or its bytes), how large it is,
+    the stderr of each external tool and the time spent in every stage.
+
+    `str(result)` gives the same summary the CLI has always printed, and a
+    result from `return_binary=True` still unpacks as `(pdf_bytes, message)`.
+    """
+    pdf_path: Optional[str] = None
+    pdf_bytes: Optional[bytes] = None
+    output_size: int = 0
+    tex_passes: int = 0
+    # The TeX engine that built the PDF (None for a cache hit)
+    engine: Optional[str] = None
+    cache_hit: bool = False
+    stderr: Dict[str, str] = field(default_factory=dict)
+    stages: List[StageTiming] = field(default_factory=list)
+    # EMBED functions that missed their deadline and were rendered from an earlier result
+    stale_embeds: List[str] = field(default_factory=list)
+    # Every stage plus finer-grained work inside them, for `--profile`
+    spans: List[Span] = field(default_factory=list)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and record it as a stage, even if it raises."""
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_seconds()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            self.stages.append(StageTiming(name=name, wall_time=wall_time, cpu_time=_cpu_seconds() - cpu_start))
+            self.spans.append(Span(name, "stage", wall_start, wall_time, os.getpid(), threading.get_ident()))
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        """Time the enclosed block as a profiling span; unlike a stage it isn't part of the totals."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, category, start, time.perf_counter() - start, os.getpid(), threading.get_ident(), args))
+
+    @property
+    def wall_time(self) -> float:
+        return sum(s.wall_time for s in self.stages)
+
+    @property
+    def cpu_time(self) -> float:
+        return sum(s.cpu_time for s in self.stages)
+
+    def timings(self) -> str:
+        """Render the per-stage timings as a small aligned table."""
+        width = max([len(s.name) for s in self.stages] + [len("total")])
+        lines = [f"{s.name:<{width}}  wall {s.wall_time:8.3f}s  cpu {s.cpu_time:8.3f}s" for s in self.stages]
+        lines.append(f"{'total':<{width}}  wall {self.wall_time:8.3f}s  cpu {self.cpu_time:8.3f}s")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        if self.pdf_path is None and self.pdf_bytes is not None:
+            location = f"PDF generated in memory ({len(self.pdf_bytes)} bytes)"
+        else:
+            location = f"PDF generated at: {self.pdf_path}"
+        summary = (
+            f"{location}\n"
+            f"Pandoc stderr: {self.stderr.get('pandoc', '')}\n"
+            f"Pdflatex stderr: {self.stderr.get('pdflatex', '')}"
+        )
+        if self.engine not in (None, "pdflatex"):
+            summary += f"\nTeX engine: {self.engine}"
+        if self.stale_embeds:
+            summary += f"\nStale EMBED results (refreshing in the background): {', '.join(self.stale_embeds)}"
+        return summary
+
+    def __iter__(self):
+        # Backwards compatibility with the old `(pdf_data, message)` tuple
+        return iter((self.pdf_bytes, str(self)))
@@ -42,11 +42,45 @@ A command-line tool for converting Markdown to LateX-formatted PDF via Pandoc. R
 
 • `output_pdf` (optional): Path to the output PDF file. If omitted, a default name is derived from the source file, and the working directory is assumed to be the path.
 
+• `-` as the source file: Read Markdown from stdin and write the PDF to stdout, e.g. `generate_report | md2ltx - --template report > report.pdf`. Nothing but the PDF is written to stdout; only the TeX working files touch the disk, in a single scratch directory on tmpfs (`/dev/shm`) when available, or in `$MD2LTX_SCRATCH_DIR`.
+
 • `--open`: Open the resulting PDF in the system’s default viewer.
 
 • `--test`: Evaluates embedded python and prints the pre-pandoc processed string for the purposes of debugging.
 
-• `--template template_name`: Specify a built-in templates by name. Available templates: "one-column-article", "two-column-article", "report", "slides", "letter").
+• `--watch`: Keep running and rebuild whenever the source file (or a template file passed to `--template`) changes. Only the code blocks that changed, and the blocks using names they define, are re-run, and pandoc/pdflatex are skipped when the evaluated Markdown is identical to the last build.
+
+• `--timings`: Print the wall-clock and CPU time spent in each build stage (read, evaluate, pandoc, every TeX pass, move), and the scratch space (bytes and inodes) reclaimed afterwards. Every build works in its own scratch directory, reused from a small pool on tmpfs (or `$MD2LTX_SCRATCH_DIR`) and emptied when the build succeeds, fails or is terminated; `md2ltx serve` reports the same figures under `GET /stats`.
+
+• `--profile PATH`: Write a Chrome trace of the build to PATH (open it in https://ui.perfetto.dev) with a span for every stage, code-block execution, EMBED call, DataFrame render and TeX pass, plus a compact summary (time per stage and category, slowest spans) to PATH.summary.json. Works for single builds, `-` and `--batch`; `--jobs` render workers show up as one fan-out span.
+
+• `--cache`: Reuse a previously built PDF when the evaluated Markdown, template and toolchain are unchanged. Use `--cache_dir` to choose the cache location, `--cache_size_mb` to cap its size (least recently used PDFs are evicted first) and `--cache_stats` to print hit/miss statistics.
+
+• `--block_cache`: Split the evaluated Markdown at its headings and only send sections that changed since an earlier build through pandoc. Documents with footnotes or reference-style links are always converted as a whole.
+
+• `--format_cache`: Dump the static part of the chosen template’s preamble (`\documentclass` and `\usepackage` lines) into a precompiled LaTeX format once, and load it with `-fmt` on every TeX pass instead of re-reading the packages. The format is rebuilt automatically when the template or the TeX installation changes.
+
+• `--build_dirs`: Keep each document's TeX auxiliary files (.aux, .toc, ...) in a persistent build directory under the cache directory, one per source path and template, so a rebuild whose labels and headings did not change settles in a single TeX pass. Pays off most with `--watch` and `serve` (where a document is identified by its `output` path). A failed build resets its directory, a build that finds its document's directory in use (in any process) builds in scratch space instead, and the least recently used directories are removed once together they exceed 256 MB.
+
+• `--engine NAME`: Build with another TeX engine: `pdflatex` (the default), `xelatex`, `lualatex`, `latexmk` or `tectonic`. A template file can choose its own engine with a `% ENGINE::xelatex` line, and `md2ltx serve` also accepts `&engine=NAME` per request. `--engine auto` records the TeX time of every build per template and engine: each template is tried once with every installed engine, then always built with the fastest one that worked. An engine that fails falls back to pdflatex and is not picked for that template again. Use `--engine_stats` to print the recorded times.
+
+• `--embed_cache` / `--embed_ttl NAME=DURATION`: Reuse the result of an EMBED function across builds while it is younger than its TTL (e.g. `--embed_ttl fetch_data=15m`, or `--embed_ttl "*=1h"` for every function). See section 3.7.
+
+• `--embed_deadline NAME=DURATION` / `--document_deadline DURATION`: Stop waiting for a slow EMBED function after its deadline (or once the whole document's budget is spent), use its last result and refresh it in the background. Implies `--embed_cache`. See section 3.7.
+
+• `--jobs N`: Evaluate up to N distinct EMBED functions concurrently. The code blocks are executed once and the worker processes are forked from that environment, so functions must not rely on side effects in the main process (functions marked `# IMPURE::` always run in the main process). With `--batch`, every document's functions are spread over N workers of their own. Requires a platform with `fork` (Linux, macOS).
+
+• `--max_rows N`: Show at most N rows of each embedded DataFrame (default 10, 0 for all). A `# ROWS::function_name=N` line in a code block overrides it for one function.
+
+• `--table_format {pipe,longtable}`: Render embedded DataFrames as Markdown pipe tables (default) or as raw LaTeX longtables that bypass pandoc's table parsing. A `# TABLE::function_name=longtable` line in a code block overrides it for one function.
+
+• `--sandbox`: Evaluate embedded Python in pre-forked worker processes that already have pandas and numpy imported, instead of in md2ltx itself. A document whose code runs longer than `--sandbox_timeout SECONDS` (default 300, 0 for no limit) fails with an error and its worker is killed and replaced. `--sandbox_memory_mb MB` caps each worker's address space (RLIMIT_AS, including the preloaded libraries), `--sandbox_cpu_seconds SECONDS` caps the CPU time of one document (RLIMIT_CPU), and workers are replaced after `--sandbox_recycle_after N` documents (default 50). A replaced worker is stopped in the background, giving EMBED refreshes still running in it a few seconds to finish. Any of these options implies `--sandbox`. `md2ltx serve` runs `--max_concurrent` workers and `--batch` runs `--workers`. Not available with `--watch`; requires `fork` (Linux, macOS).
+
+• `--batch SOURCE [SOURCE ...]`: Compile many Markdown files (paths or glob patterns such as `"statements/*.md"`) in one process. Embedded Python for one document is evaluated while another document is in pandoc/pdflatex. Use `--workers N` to bound concurrency, `--output_dir DIR` for the PDFs and `--summary summary.json` for a per-file report.
+
+• `md2ltx serve [--host 127.0.0.1] [--port 8765] [--socket PATH] [--max_concurrent N]`: Run a long-lived compile server that keeps pandas, numpy and the templates loaded. POST Markdown to `/compile?template=NAME` and receive the PDF bytes, or add `&output=/path/to/file.pdf` to have the PDF written there and its path returned as JSON. `GET /health` and `GET /stats` are also available. For example: `curl --data-binary @doc.md "http://127.0.0.1:8765/compile?template=report" -o doc.pdf`, or with `--socket`: `curl --unix-socket /tmp/md2ltx.sock --data-binary @doc.md http://localhost/compile -o doc.pdf`.
+
+• `--template template_name`: Specify a built-in templates by name. Available templates: "one-column-article", "two-column-article", "report", "slides", "letter"). A path to your own LaTeX template file is also accepted.
 
 • `--help`: Access documentation.
 
@@ -204,6 +238,10 @@ You can also return a DataFrame—maybe you fetch data from `rgwfuncs.load_data_
 
 If `fetch_data()` returns a DataFrame (e.g. 20 rows × N columns), md2ltx converts it to a Markdown pipe table. The final output appears as a table, truncated if there are more than 10 rows.
 
+Longer tables show their first and last five rows around a row of `...`. Change the limit for every table with `--max_rows N` (0 shows every row), or for one function with a directive in a code block, e.g. `# ROWS::fetch_data=50`. Missing values are rendered as empty cells and `|` characters in text columns are escaped so they cannot break the table.
+
+For long listings, `--table_format longtable` (or `# TABLE::fetch_data=longtable` for one function) renders DataFrames straight to a LaTeX `longtable` that pandoc passes through untouched, which is much faster for tables with thousands of rows and lets them break across pages. Numeric columns are right-aligned, boolean columns centred and all others left-aligned. Combine it with `# ROWS::fetch_data=0` to include every row.
+
 ### 3.5. Multiple Blocks, Many Functions
 
 It’s perfectly valid to define multiple functions in one code block, or spread them among several:
@@ -229,7 +267,33 @@ All three functions (foo, bar, baz) become available, and you embed them by writ
 
 ### 3.6. Error Handling
 
-If your code has a Python syntax error or cannot be executed, md2ltx prints an “[Error executing combined code: …]” message in the logs and all the affected functions remain undefined. Any placeholders referencing them become “[Error: No function named 'xyz' has been defined in the code blocks]”.
+Blocks run one after another in document order, sharing one namespace. If a block has a Python syntax error or cannot be executed, md2ltx prints an “[Error executing code block: …]” message in the logs, ending with the line of your Markdown file the error was raised from, and the functions that block would have defined remain undefined; the other blocks still run. Any placeholders referencing them become “[Error: No function named 'xyz' has been defined in the code blocks]”.
+
+In `--watch` mode a block that hasn’t changed keeps the values it left behind, so code that modifies another block’s object in place (`rows.append(...)`) belongs in the same block as the object.
+
+### 3.7. Caching EMBED Results
+
+Functions that query a database or crunch large DataFrames can have their results reused across builds. Declare a time-to-live for a function anywhere in a code block:
+
+    [START]#########################################################################
+        # CACHE::fetch_data=15m
+        def fetch_data() -> pd.DataFrame:
+            return load_data_from_query("mydb", "SELECT * FROM mytable")
+    [END]###########################################################################
+
+and build with `--embed_cache`. Durations accept `s`, `m`, `h` and `d` suffixes. `--embed_ttl NAME=DURATION` sets or overrides a TTL from the command line. Cached results are stored under the cache directory and are invalidated whenever the function or the code block defining it changes. Once the stored results pass 64 MB, the least recently used ones (such as those left behind by edited code) are evicted.
+
+To keep a slow query from delaying the whole document, give a function a deadline with `# DEADLINE::fetch_data=5s` (or `--embed_deadline fetch_data=5s`), or give all the functions of a document a shared budget with `--document_deadline 30s`. A function that misses its deadline is replaced by its last successful result, however old, while the call finishes in the background and stores a fresh result for the next build (a one-off build writes the PDF first, then waits for the refresh before exiting). The names of these stale functions are printed and listed in the build summary (`stale_embeds` in `--summary` files, the `X-Md2ltx-Stale-Embeds` header from `md2ltx serve`). A function that has never completed has no earlier result, so md2ltx waits for it. Functions with a deadline are always evaluated in the main process, even with `--jobs`.
+
+### 3.8. Repeated Placeholders
+
+A function referenced by several placeholders is called only once per build and its output is reused everywhere it appears. If a function is deliberately impure (e.g. it returns a counter or a random sample) and should run again for every occurrence, mark it in a code block:
+
+    [START]#########################################################################
+        # IMPURE::next_figure_number
+        def next_figure_number() -> str:
+            ...
+    [END]###########################################################################
 
 --------------------------------------------------------------------------------
 
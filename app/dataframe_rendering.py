@@ -0,0 +1,189 @@
+import re
+import typing
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Tables longer than this are shown as their first and last rows around an ellipsis row
+DEFAULT_MAX_ROWS = 10
+
+# Declared inside a [START]...[END] block, e.g. `# ROWS::fetch_data=50` (0 shows every row)
+ROWS_DIRECTIVE_PATTERN = re.compile(r"^\s*#\s*ROWS::(\w+)\s*=\s*(\d+)\s*$", re.MULTILINE)
+
+# Declared inside a [START]...[END] block, e.g. `# TABLE::transactions=longtable`
+TABLE_DIRECTIVE_PATTERN = re.compile(r"^\s*#\s*TABLE::(\w+)\s*=\s*(\w+)\s*$", re.MULTILINE)
+TABLE_FORMATS = ("pipe", "longtable")
+DEFAULT_TABLE_FORMAT = "pipe"
+
+# Raw LaTeX tables the evaluated Markdown may carry, which pandoc can't see as tables itself
+LONGTABLE_PATTERN = re.compile(r"^\\begin\{longtable\}", re.MULTILINE)
+
+# Characters that would break out of a pipe-table cell
+_CELL_ESCAPES = str.maketrans({"|": "\\|", "\n": " ", "\r": " "})
+
+# Characters with a special meaning in LaTeX text; backticks are escaped too so a cell
+# can never close the raw block fence
+_LATEX_ESCAPES = str.maketrans({
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+    "`": r"\textasciigrave{}",
+    "\n": " ",
+    "\r": " ",
+})
+
+# dtype kinds (bool, numbers, datetimes, timedeltas) whose text never needs escaping
+_UNESCAPED_KINDS = "biufcmM"
+
+
+def parse_rows_directives(code: str) -> typing.Dict[str, int]:
+    """Collect `# ROWS::func_name=N` lines from code block source."""
+    return {fn_name: int(rows) for fn_name, rows in ROWS_DIRECTIVE_PATTERN.findall(code)}
+
+
+def parse_table_directives(code: str) -> typing.Dict[str, str]:
+    """Collect `# TABLE::func_name=FORMAT` lines from code block source."""
+    return dict(TABLE_DIRECTIVE_PATTERN.findall(code))
+
+
+def escape_cell(text: str) -> str:
+    return text.translate(_CELL_ESCAPES)
+
+
+def escape_latex(text: str) -> str:
+    return text.translate(_LATEX_ESCAPES)
+
+
+def format_column(
+    column: "pd.Series",
+    na_rep: str = "",
+    missing: typing.Optional["np.ndarray"] = None,
+    escapes: typing.Dict[int, str] = _CELL_ESCAPES
+) -> typing.List[str]:
+    """
+    Format a whole column to strings at once, based on its dtype.
+
+    Missing values become `na_rep` (pass `missing` when the mask is already known);
+    only text columns are escaped (with a `str.maketrans` table, pipe-table escaping by
+    default), since numbers, booleans and dates never contain special characters.
+    """
+    kind = column.dtype.kind
+    if kind in "mM":
+        # pandas formats a whole datetime column much faster than str() on each Timestamp
+        cells = column.astype(str).tolist()
+    else:
+        cells = [str(value) for value in column.tolist()]
+
+    if missing is None:
+        missing = column.isna().to_numpy()
+    if missing.any():
+        cells = [na_rep if is_missing else cell for cell, is_missing in zip(cells, missing)]
+
+    if kind in _UNESCAPED_KINDS:
+        return cells
+    return [cell.translate(escapes) for cell in cells]
+
+
+def format_shown_rows(
+    df: "pd.DataFrame",
+    max_rows: typing.Optional[int],
+    na_rep: str,
+    escapes: typing.Dict[int, str]
+) -> typing.Tuple[typing.List[typing.Tuple[str, ...]], typing.Optional[int]]:
+    """
+    Format the rows of `df` that a table of at most `max_rows` rows shows.
+
+    Returns the rows as tuples of cells and, when the frame is truncated, the index at
+    which an ellipsis row belongs (None otherwise).
+    """
+    truncated = bool(max_rows) and len(df) > max_rows
+    if truncated:
+        head_count = max_rows // 2
+        shown = df.iloc[list(range(head_count)) + list(range(len(df) - (max_rows - head_count), len(df)))]
+    else:
+        shown = df
+
+    # One missing-value mask for the whole frame is far cheaper than one per column
+    missing = shown.isna().to_numpy()
+    columns = [format_column(column, na_rep, missing[:, i], escapes) for i, (_, column) in enumerate(shown.items())]
+    return list(zip(*columns)), head_count if truncated else None
+
+
+def dataframe_to_pandoc_pipe(df: "pd.DataFrame", max_rows: typing.Optional[int] = DEFAULT_MAX_ROWS, na_rep: str = "") -> str:
+    """
+    Render a DataFrame as a Markdown pipe table.
+
+    Frames with more than `max_rows` rows show the first and last `max_rows // 2` rows
+    around an ellipsis row; `max_rows` of None or 0 shows every row. Cells are formatted
+    column by column rather than row by row, and only the rows actually shown are touched.
+    """
+    header = "| " + " | ".join(escape_cell(str(col)) for col in df.columns) + " |"
+    separator = "|" + "|".join("---" for _ in df.columns) + "|"
+
+    shown_rows, ellipsis_at = format_shown_rows(df, max_rows, na_rep, _CELL_ESCAPES)
+    rows = ["| " + " | ".join(cells) + " |" for cells in shown_rows]
+    if ellipsis_at is not None:
+        rows.insert(ellipsis_at, "| " + " | ".join("..." for _ in df.columns) + " |")
+    return "\n".join([header, separator] + rows)
+
+
+def column_alignment(dtype: typing.Any) -> str:
+    """Numbers are right-aligned, booleans centred and everything else left-aligned."""
+    if dtype.kind == "b":
+        return "c"
+    if dtype.kind in "iufc":
+        return "r"
+    return "l"
+
+
+def dataframe_to_latex_longtable(df: "pd.DataFrame", max_rows: typing.Optional[int] = DEFAULT_MAX_ROWS, na_rep: str = "") -> str:
+    """
+    Render a DataFrame as a booktabs `longtable` inside a raw LaTeX block.
+
+    pandoc passes the block through untouched, so large tables skip pandoc's table parser
+    entirely and can break across pages. Row limits work as in `dataframe_to_pandoc_pipe`.
+    The block ends with a newline so text following the placeholder can't end up on the
+    closing fence line.
+    """
+    alignment = "".join(column_alignment(dtype) for dtype in df.dtypes)
+    header = " & ".join(escape_latex(str(col)) for col in df.columns) + r" \\"
+
+    shown_rows, ellipsis_at = format_shown_rows(df, max_rows, na_rep, _LATEX_ESCAPES)
+    rows = [" & ".join(cells) + r" \\" for cells in shown_rows]
+    if ellipsis_at is not None:
+        rows.insert(ellipsis_at, " & ".join(r"\ldots" for _ in df.columns) + r" \\")
+
+    return "\n".join(
+        ["```{=latex}", f"\\begin{{longtable}}{{{alignment}}}", r"\toprule", header, r"\midrule", r"\endhead"]
+        + rows
+        + [r"\bottomrule", r"\end{longtable}", "```", ""]
+    )
+
+
+def render_dataframe(
+    df: "pd.DataFrame",
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    max_rows: typing.Optional[int] = DEFAULT_MAX_ROWS
+) -> str:
+    """Render a DataFrame in one of TABLE_FORMATS."""
+    if table_format == "pipe":
+        return dataframe_to_pandoc_pipe(df, max_rows=max_rows)
+    if table_format == "longtable":
+        return dataframe_to_latex_longtable(df, max_rows=max_rows)
+    raise ValueError(f"Unknown table format '{table_format}' (expected one of: {', '.join(TABLE_FORMATS)})")
+
+
+def pandoc_table_args(markdown: str) -> typing.List[str]:
+    """
+    pandoc only loads the table packages in its default template when it sees a table
+    itself; raw longtables need them switched on explicitly.
+    """
+    return ["-V", "tables=true"] if LONGTABLE_PATTERN.search(markdown) else []
@@ -0,0 +1,107 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Union
+
+# The two kinds of token the evaluator cares about. They are scanned for separately within
+# one left-to-right pass (code blocks first, then placeholders in the text between them):
+# a single regex alternation of the two can't use a literal-prefix search and is ~10x slower.
+BLOCK_MARKER = "[START]"
+BLOCK_PATTERN = re.compile(r"\[START\]#{3,}\s*(.*?)\s*\[END\]#{3,}", re.DOTALL)
+PLACEHOLDER_PATTERN = re.compile(r"`EMBED::(\w+)`")
+
+
+@dataclass(slots=True)
+class TextSpan:
+    """Markdown passed through unchanged: `source[start:end]`."""
+    start: int
+    end: int
+
+
+@dataclass(slots=True)
+class CodeBlock:
+    """A [START]...[END] block; `code` is its content and `line` the source line it starts on."""
+    start: int
+    end: int
+    code: str
+    line: int
+
+
+@dataclass(slots=True)
+class Placeholder:
+    """An `EMBED::fn_name` placeholder at `source[start:end]`."""
+    start: int
+    end: int
+    fn_name: str
+
+
+Segment = Union[TextSpan, CodeBlock, Placeholder]
+
+
+@dataclass(slots=True)
+class MarkdownDocument:
+    """
+    A Markdown source split into text spans, code blocks and placeholders, in document order.
+
+    Built by a single scan (`parse_markdown`) and reused for code extraction (each block
+    becomes a cell, see cells.py), placeholder substitution and error reporting.
+    """
+    source: str
+    segments: List[Segment] = field(default_factory=list)
+
+    @property
+    def code_blocks(self) -> List[CodeBlock]:
+        return [segment for segment in self.segments if isinstance(segment, CodeBlock)]
+
+    @property
+    def placeholders(self) -> List[Placeholder]:
+        return [segment for segment in self.segments if isinstance(segment, Placeholder)]
+
+    def render(self, replace: Callable[[Placeholder], str]) -> str:
+        """Rebuild the Markdown without its code blocks, with each placeholder replaced."""
+        source = self.source
+        parts = []
+        for segment in self.segments:
+            kind = type(segment)
+            if kind is TextSpan:
+                parts.append(source[segment.start:segment.end])
+            elif kind is Placeholder:
+                parts.append(replace(segment))
+        return "".join(parts)
+
+def parse_markdown(source: str) -> MarkdownDocument:
+    """
+    Scan `source` once, left to right, into a MarkdownDocument. Placeholders inside code
+    blocks belong to the block, not the text.
+    """
+    document = MarkdownDocument(source)
+    segments = document.segments
+    line, counted_to = 1, 0
+
+    def scan_text(start: int, end: int) -> None:
+        # Placeholders between two code blocks, found by the regex engine in one sweep
+        position = start
+        for match in PLACEHOLDER_PATTERN.finditer(source, start, end):
+            if match.start() > position:
+                segments.append(TextSpan(position, match.start()))
+            segments.append(Placeholder(match.start(), match.end(), match.group(1)))
+            position = match.end()
+        if end > position:
+            segments.append(TextSpan(position, end))
+
+    position = 0
+    next_block = source.find(BLOCK_MARKER)
+    while next_block != -1:
+        match = BLOCK_PATTERN.match(source, next_block)
+        if match is None:
+            # An unterminated [START] is ordinary text
+            next_block = source.find(BLOCK_MARKER, next_block + 1)
+            continue
+        scan_text(position, next_block)
+        # Line numbers are counted incrementally, from one block to the next
+        line += source.count("\n", counted_to, match.start(1))
+        counted_to = match.start(1)
+        segments.append(CodeBlock(next_block, match.end(), match.group(1), line))
+        position = match.end()
+        next_block = source.find(BLOCK_MARKER, position)
+    scan_text(position, len(source))
+    return document
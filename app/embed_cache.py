@@ -0,0 +1,147 @@
+import os
+import re
+import math
+import time
+import pickle
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+from .build_cache import atomic_write, default_cache_dir, evict_lru
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Declared inside a [START]...[END] block, e.g. `# CACHE::fetch_data=15m`
+TTL_DIRECTIVE_PATTERN = re.compile(r"^\s*#\s*CACHE::(\w+)\s*=\s*(\S+)\s*$", re.MULTILINE)
+# Declared inside a [START]...[END] block, e.g. `# DEADLINE::fetch_data=5s`
+DEADLINE_DIRECTIVE_PATTERN = re.compile(r"^\s*#\s*DEADLINE::(\w+)\s*=\s*(\S+)\s*$", re.MULTILINE)
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Key in a TTL mapping that applies to every function without its own TTL
+DEFAULT_TTL_KEY = '*'
+
+
+def parse_duration(value: str) -> float:
+    """Parse '90', '90s', '15m', '2h' or '1d' into seconds."""
+    match = DURATION_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{value}': expected a number followed by s, m, h or d")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def _parse_duration_directives(pattern: re.Pattern, code: str, kind: str) -> Dict[str, float]:
+    durations = {}
+    for fn_name, duration in pattern.findall(code):
+        try:
+            durations[fn_name] = parse_duration(duration)
+        except ValueError as exc:
+            print(f"[Ignoring {kind} directive for '{fn_name}': {exc}]")
+    return durations
+
+
+def parse_ttl_directives(code: str) -> Dict[str, float]:
+    """Collect `# CACHE::func_name=<duration>` lines from code block source."""
+    return _parse_duration_directives(TTL_DIRECTIVE_PATTERN, code, 'cache')
+
+
+def parse_deadline_directives(code: str) -> Dict[str, float]:
+    """Collect `# DEADLINE::func_name=<duration>` lines from code block source."""
+    return _parse_duration_directives(DEADLINE_DIRECTIVE_PATTERN, code, 'deadline')
+
+
+def parse_ttl_option(option: str, kind: str = 'TTL') -> Tuple[str, float]:
+    """Parse a CLI value such as 'fetch_data=15m' or '*=1h'."""
+    fn_name, sep, duration = option.partition('=')
+    if not sep or not fn_name:
+        raise ValueError(f"Invalid {kind} '{option}': expected NAME=DURATION")
+    return fn_name.strip(), parse_duration(duration)
+
+
+class EmbedCache:
+    """
+    Opt-in, on-disk cache of EMBED function return values.
+
+    A value is reused only while it is younger than the function's TTL. TTLs come from
+    `# CACHE::func_name=15m` directives in the code blocks or from `ttls` (which wins),
+    where the '*' entry is a default for every function. Functions with no TTL are never
+    cached. Keys hash the function's own source together with the code block that
+    defines it, so editing that code invalidates its entries.
+
+    Deadlines (stale-while-revalidate) work the same way, from `# DEADLINE::func_name=5s`
+    directives or `deadlines`, plus an optional `document_deadline` shared by all the
+    functions of a document: a function that misses its deadline is replaced by its last
+    stored result, whatever its age, while the call finishes in the background and stores
+    a fresh one for the next build. Results of functions with a deadline are always stored.
+
+    Entries written for code that has since been edited are never read again, so like the
+    PDF cache, least recently used entries are evicted once the directory exceeds `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        ttls: Optional[Dict[str, float]] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+        document_deadline: Optional[float] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = os.path.join(directory or default_cache_dir(), 'embed')
+        self.max_bytes = max_bytes
+        self.ttls = dict(ttls or {})
+        self.deadlines = dict(deadlines or {})
+        self.document_deadline = document_deadline
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _lookup(configured: Dict[str, float], fn_name: str, declared: Dict[str, float]) -> Optional[float]:
+        if fn_name in configured:
+            return configured[fn_name]
+        if fn_name in declared:
+            return declared[fn_name]
+        return configured.get(DEFAULT_TTL_KEY)
+
+    def ttl_for(self, fn_name: str, declared: Dict[str, float]) -> Optional[float]:
+        return self._lookup(self.ttls, fn_name, declared)
+
+    def deadline_for(self, fn_name: str, declared: Dict[str, float]) -> Optional[float]:
+        """The function's own deadline, not counting the document deadline."""
+        return self._lookup(self.deadlines, fn_name, declared)
+
+    def has_deadline(self, fn_name: str, declared: Dict[str, float]) -> bool:
+        return self.document_deadline is not None or self.deadline_for(fn_name, declared) is not None
+
+    def key(self, fn_name: str, function_source: str, block_source: str) -> str:
+        sha = hashlib.sha256()
+        for part in (fn_name, function_source, hashlib.sha256(block_source.encode('utf-8')).hexdigest()):
+            sha.update(part.encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str, ttl: float = math.inf) -> Tuple[bool, Any]:
+        """Return (True, value) for an entry younger than `ttl` (any entry by default), otherwise (False, None)."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError):
+            return False, None
+        if time.time() - stored_at > ttl:
+            return False, None
+        os.utime(path, None)
+        return True, value
+
+    def put(self, key: str, value: Any) -> bool:
+        """Store a value; results that can't be pickled are simply not cached."""
+        try:
+            data = pickle.dumps((time.time(), value))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        atomic_write(self._entry_path(key), data)
+        self.evict()
+        return True
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in `max_bytes`; returns bytes freed."""
+        return evict_lru(self.directory, self.max_bytes, '.pkl')
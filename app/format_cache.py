@@ -0,0 +1,137 @@
+import os
+import shutil
+import contextlib
+import hashlib
+import tempfile
+import subprocess
+from functools import lru_cache
+from typing import Dict, Optional
+from .build_cache import default_cache_dir, tool_version
+
+
+@lru_cache(maxsize=None)
+def base_format_stamp(engine: str = 'pdflatex') -> str:
+    """Identify the installed base format (path, size, mtime) so a TeX update invalidates dumped formats."""
+    try:
+        completed = subprocess.run(
+            ['kpsewhich', f'{engine}.fmt'],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+        path = completed.stdout.strip()
+        st = os.stat(path)
+        return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def static_preamble(template_content: str) -> str:
+    """
+    The leading part of a template's preamble that doesn't depend on the document:
+    every line before `\\begin{document}` up to the first one using a `$variable$`.
+    """
+    head = template_content.split('\\begin{document}', 1)[0].lstrip('\n')
+    static = []
+    for line in head.splitlines(keepends=True):
+        if '$' in line:
+            break
+        static.append(line)
+    return ''.join(static)
+
+
+class FormatCache:
+    """
+    Precompiled LaTeX formats, one per template preamble.
+
+    The static part of a template's preamble (\\documentclass and the \\usepackage lines) is
+    dumped once with `pdflatex -ini` and reused through `-fmt`, so every TeX pass skips
+    loading those packages. Formats are keyed by the preamble text, the engine version
+    and the installed base format, so editing a template or updating TeX rebuilds them.
+    A preamble that can't be dumped, or whose format doesn't load back, is remembered and
+    compiled normally from then on.
+    """
+
+    def __init__(self, directory: Optional[str] = None, engine: str = 'pdflatex'):
+        self.directory = os.path.join(directory or default_cache_dir(), 'formats')
+        self.engine = engine
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """Environment for TeX runs, with the cache directory on the format search path."""
+        env = dict(os.environ)
+        env['TEXFORMATS'] = self.directory + os.pathsep + env.get('TEXFORMATS', '')
+        return env
+
+    def key(self, preamble: str, engine: Optional[str] = None) -> str:
+        engine = engine or self.engine
+        sha = hashlib.sha256()
+        for part in (preamble, engine, tool_version(engine), base_format_stamp(engine)):
+            sha.update(part.encode('utf-8'))
+            sha.update(b'\0')
+        return f"md2ltx-{sha.hexdigest()[:32]}"
+
+    def format_for(self, preamble: str, engine: Optional[str] = None) -> Optional[str]:
+        """Return the name of a format with `preamble` preloaded, dumping it on first use."""
+        engine = engine or self.engine
+        name = self.key(preamble, engine)
+        fmt_path = os.path.join(self.directory, f"{name}.fmt")
+        failed_path = os.path.join(self.directory, f"{name}.failed")
+        if os.path.exists(fmt_path):
+            return name
+        if os.path.exists(failed_path):
+            return None
+
+        with tempfile.TemporaryDirectory(dir=self.directory) as work_dir:
+            with open(os.path.join(work_dir, f"{name}.tex"), 'w', encoding='utf-8') as f:
+                f.write(preamble)
+                f.write('\n\\dump\n')
+            completed = subprocess.run(
+                [engine, '-ini', '-interaction=nonstopmode', f'-jobname={name}', f'&{engine}', f'{name}.tex'],
+                cwd=work_dir,
+                capture_output=True,
+                text=True
+            )
+            dumped = os.path.join(work_dir, f"{name}.fmt")
+            if completed.returncode != 0 or not os.path.exists(dumped):
+                self.mark_failed(name, completed.stdout[-4000:])
+                return None
+            # Rename into place so concurrent builds never load a half-written format
+            os.replace(dumped, fmt_path)
+        return name
+
+    def mark_failed(self, name: str, log: str = '') -> None:
+        """Stop using a format: its preamble is compiled normally from now on."""
+        with open(os.path.join(self.directory, f"{name}.failed"), 'w', encoding='utf-8') as f:
+            f.write(log)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.directory, f"{name}.fmt"))
+
+    def apply(self, tex_path: str, template_content: Optional[str], engine: Optional[str] = None) -> Optional[str]:
+        """
+        Strip the template's static preamble from a generated .tex file and return the
+        format that provides it, or None (leaving the file untouched) if that isn't possible.
+        `engine` is the TeX engine the format is for (the cache's own by default).
+        """
+        if not template_content:
+            return None
+        preamble = static_preamble(template_content)
+        if '\\documentclass' not in preamble:
+            return None
+
+        with open(tex_path, 'r', encoding='utf-8') as f:
+            tex_source = f.read().lstrip('\n')
+        if not tex_source.startswith(preamble):
+            return None
+
+        name = self.format_for(preamble, engine)
+        if name is None:
+            return None
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(tex_source[len(preamble):])
+        return name
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
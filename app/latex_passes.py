@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import hashlib
+import subprocess
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+from .compile_result import CompileResult
+from .format_cache import FormatCache
+from .tex_engines import AUTO_ENGINE, DEFAULT_ENGINE, ENGINES, EngineTimings, TexEngine, get_engine, requested_engine
+
+# Auxiliary files whose contents feed back into the next TeX pass
+AUX_EXTENSIONS = ('.aux', '.toc', '.lof', '.lot', '.out', '.nav', '.snm', '.bbl')
+
+# Log messages LaTeX and common packages print when another pass is required
+RERUN_PATTERN = re.compile(
+    r"(Rerun to get|Label\(s\) may have changed|Please rerun LaTeX|Rerun LaTeX)"
+)
+
+# Constructs that leave forward references in the .aux/.toc on the first pass
+CROSS_REFERENCE_PATTERN = re.compile(
+    r"\\(label|ref|pageref|eqref|autoref|cref|Cref|cite|tableofcontents|listoffigures|"
+    r"listoftables|begin\{longtable\}|documentclass(\[[^\]]*\])?\{beamer\})"
+)
+
+MAX_PASSES = 5
+
+
+def needs_cross_references(tex_source: str) -> bool:
+    """Return True if the LaTeX source uses constructs that need more than one pass to settle."""
+    return CROSS_REFERENCE_PATTERN.search(tex_source) is not None
+
+
+def aux_digest(output_dir: str, base_name: str) -> Optional[str]:
+    """Hash every auxiliary file for a job, or return None if none exist yet."""
+    sha = hashlib.sha256()
+    found = False
+    for ext in AUX_EXTENSIONS:
+        path = os.path.join(output_dir, base_name + ext)
+        if os.path.exists(path):
+            found = True
+            sha.update(ext.encode('utf-8'))
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+    return sha.hexdigest() if found else None
+
+
+def log_requests_rerun(output_dir: str, base_name: str) -> bool:
+    """Check the TeX log for messages asking for another pass."""
+    log_path = os.path.join(output_dir, base_name + '.log')
+    if not os.path.exists(log_path):
+        return False
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        return RERUN_PATTERN.search(f.read()) is not None
+
+
+def plan_latex_passes(
+    tex_file: str,
+    output_dir: str,
+    max_passes: int = MAX_PASSES,
+    format_name: Optional[str] = None,
+    engine: TexEngine = ENGINES[DEFAULT_ENGINE],
+    tex_source: Optional[str] = None
+) -> Iterator[List[str]]:
+    """
+    Yield the TeX command for each pass the document needs; the caller runs each
+    command before asking for the next.
+
+    1) If the source uses cross-references and there is no .aux from an earlier build,
+       the first pass runs in -draftmode (no PDF is written) to collect labels.
+    2) Every later pass writes the PDF.
+    3) Another pass is scheduled while the log asks for a rerun or the auxiliary
+       files changed, up to `max_passes`.
+
+    `format_name` runs every pass on a precompiled format (see format_cache); pass the
+    document's full `tex_source` then, since the file itself no longer has the preamble
+    (e.g. a beamer \\documentclass) to judge cross-references by. Engines that handle
+    reruns themselves (latexmk, tectonic) get a single command.
+    """
+    if not engine.drive_passes:
+        yield engine.build_command(tex_file, output_dir)
+        return
+
+    base_name = os.path.splitext(os.path.basename(tex_file))[0]
+
+    if tex_source is None:
+        with open(tex_file, 'r', encoding='utf-8', errors='replace') as f:
+            tex_source = f.read()
+
+    previous_digest = aux_digest(output_dir, base_name)
+    draft = max_passes > 1 and previous_digest is None and needs_cross_references(tex_source)
+
+    for _ in range(max_passes):
+        yield engine.pass_command(tex_file, output_dir, draft, format_name)
+
+        current_digest = aux_digest(output_dir, base_name)
+        settled = (
+            not log_requests_rerun(output_dir, base_name)
+            and (previous_digest is None or current_digest == previous_digest)
+        )
+        # A draft pass never produces the PDF, so it can't be the last one
+        if settled and not draft:
+            return
+        previous_digest = current_digest
+        draft = False
+
+
+def pdf_path_for(tex_file: str, output_dir: str) -> str:
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(tex_file))[0] + ".pdf")
+
+
+def run_latex_passes(
+    tex_file: str,
+    output_dir: str,
+    max_passes: int = MAX_PASSES,
+    result: Optional[CompileResult] = None,
+    format_name: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    engine: TexEngine = ENGINES[DEFAULT_ENGINE],
+    tex_source: Optional[str] = None
+) -> Tuple[str, str, int]:
+    """
+    Run TeX only as many times as the document needs (see `plan_latex_passes`).
+
+    Each pass is recorded as a `tex_pass_N` stage when a CompileResult is given.
+    Returns the PDF path, the stderr of the last pass and the number of passes run.
+    """
+    passes = 0
+    stderr = ""
+    for command in plan_latex_passes(tex_file, output_dir, max_passes, format_name, engine, tex_source):
+        timer = result.stage(f"tex_pass_{passes + 1}") if result is not None else nullcontext()
+        with timer:
+            completed = subprocess.run(
+                command,
+                check=True,
+                capture_output=True,
+                text=True,
+                env=env
+            )
+        passes += 1
+        stderr = completed.stderr
+
+    return pdf_path_for(tex_file, output_dir), stderr, passes
+
+
+def engine_candidates(
+    engine: Optional[str],
+    template_content: Optional[str],
+    engine_timings: Optional[EngineTimings] = None
+) -> Tuple[List[TexEngine], Optional[EngineTimings]]:
+    """
+    The engines to try, in order, for a build that asked for `engine` (see
+    `requested_engine`), and the timings to record into. With 'auto' that is the engine
+    `engine_timings` picks, then pdflatex to fall back on if it fails.
+    """
+    name = requested_engine(engine, template_content)
+    if name != AUTO_ENGINE:
+        return [get_engine(name)], None
+    timings = engine_timings or EngineTimings()
+    chosen = get_engine(timings.choose(timings.key(template_content)))
+    if chosen.name == DEFAULT_ENGINE:
+        return [chosen], timings
+    return [chosen, ENGINES[DEFAULT_ENGINE]], timings
+
+
+def discard_attempt(tex_file: str, output_dir: str, tex_source: str) -> None:
+    """Undo a failed engine's traces (format stripping, auxiliary files) before the next one runs."""
+    with open(tex_file, 'w', encoding='utf-8') as f:
+        f.write(tex_source)
+    base_name = os.path.splitext(os.path.basename(tex_file))[0]
+    for ext in AUX_EXTENSIONS + ('.log', '.pdf', '.fls', '.fdb_latexmk', '.xdv'):
+        path = os.path.join(output_dir, base_name + ext)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _typeset_with_format(
+    tex_file: str,
+    output_dir: str,
+    tex_source: str,
+    template_content: Optional[str],
+    result: CompileResult,
+    engine: TexEngine,
+    format_cache: Optional[FormatCache],
+    max_passes: int
+) -> Tuple[str, str, int]:
+    # One engine's build, on the template's precompiled format where there is one
+    format_name = None
+    if format_cache is not None and engine.formats:
+        with result.stage("format"):
+            format_name = format_cache.apply(tex_file, template_content, engine.name)
+    try:
+        return _run_checked(
+            tex_file, output_dir, max_passes, result, format_name,
+            format_cache.env if format_name else None, engine, tex_source
+        )
+    except (OSError, subprocess.CalledProcessError):
+        if format_name is None:
+            raise
+    # The dumped preamble didn't load back: build the full .tex, and drop the format if that works
+    discard_attempt(tex_file, output_dir, tex_source)
+    built = _run_checked(tex_file, output_dir, max_passes, result, None, None, engine, tex_source)
+    format_cache.mark_failed(format_name)
+    return built
+
+
+def _run_checked(
+    tex_file: str,
+    output_dir: str,
+    max_passes: int,
+    result: CompileResult,
+    format_name: Optional[str],
+    env: Optional[Dict[str, str]],
+    engine: TexEngine,
+    tex_source: str
+) -> Tuple[str, str, int]:
+    pdf_path, stderr, passes = run_latex_passes(
+        tex_file, output_dir, max_passes, result=result, format_name=format_name, env=env,
+        engine=engine, tex_source=tex_source
+    )
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF was not generated at: {pdf_path}")
+    return pdf_path, stderr, passes
+
+
+def typeset(
+    tex_file: str,
+    output_dir: str,
+    template_content: Optional[str] = None,
+    result: Optional[CompileResult] = None,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None,
+    format_cache: Optional[FormatCache] = None,
+    max_passes: int = MAX_PASSES
+) -> Tuple[str, str, int]:
+    """
+    Build the PDF for a .tex file generated from `template_content` with the engine the
+    build asked for, loading the template's preamble from `format_cache` where the engine
+    supports formats (and building without it if the format fails). With engine 'auto', the TeX time is recorded in `engine_timings`
+    and an engine that fails is retried as pdflatex.
+
+    Returns the PDF path, the stderr of the last pass and the number of passes run.
+    """
+    if result is None:
+        result = CompileResult()
+    candidates, timings = engine_candidates(engine, template_content, engine_timings)
+    with open(tex_file, 'r', encoding='utf-8') as f:
+        tex_source = f.read()
+
+    for attempt, tex_engine in enumerate(candidates):
+        if attempt:
+            discard_attempt(tex_file, output_dir, tex_source)
+        started = time.perf_counter()
+        try:
+            pdf_path, stderr, passes = _typeset_with_format(
+                tex_file, output_dir, tex_source, template_content, result, tex_engine, format_cache, max_passes
+            )
+        except (OSError, subprocess.CalledProcessError):
+            if timings is None:
+                raise
+            timings.record_failure(timings.key(template_content), tex_engine.name)
+            if attempt == len(candidates) - 1:
+                raise
+            continue
+        if timings is not None:
+            timings.record(timings.key(template_content), tex_engine.name, time.perf_counter() - started)
+        result.engine = tex_engine.name
+        return pdf_path, stderr, passes
@@ -1,21 +1,64 @@
 import sys
 import subprocess
 import os
-import tempfile
-import time
 import argparse
+import contextlib
 import shutil
-from typing import Optional, Union, Tuple
+from typing import List, Optional, Tuple
 from .constants import logo_string, help_string, templates
-from .python_evaluation import evaluate_python_in_markdown_string
-
-def preprocess_markdown_file(source_file: str, test: bool = False) -> str:
-    """Preprocess a Markdown file by evaluating embedded Python and saving it as a temporary file."""
-    with open(source_file, 'r', encoding='utf-8') as f:
-        markdown_content = f.read()
+from .python_evaluation import evaluate_python_in_markdown_string, wait_for_background_calls
+from .dataframe_rendering import DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT, TABLE_FORMATS, pandoc_table_args
+from .latex_passes import typeset
+from .compile_result import CompileResult
+from .profiling import format_profile_summary, summary_path, write_profile
+from .build_cache import BuildCache, DEFAULT_MAX_BYTES
+from .embed_cache import EmbedCache, parse_duration, parse_ttl_option
+from .format_cache import FormatCache
+from .tex_engines import ENGINE_CHOICES, EngineTimings, requested_engine
+from .workspace import Workspace, default_workspace_pool, exit_on_sigterm
+from .build_dirs import BuildDirectories
+from .pandoc_blocks import PandocBlockCache, convert_markdown_to_latex_by_blocks
+from .sandbox import DEFAULT_RECYCLE_AFTER, DEFAULT_TIMEOUT, SandboxError, SandboxLimits, SandboxPool
+
+def resolve_template(template: Optional[str]) -> Optional[str]:
+    """Return the LaTeX for a built-in template name or a path to a template file."""
+    if template is None:
+        return None
+    if template in templates:
+        return templates[template]
+    if os.path.isfile(template):
+        with open(template, 'r', encoding='utf-8') as f:
+            return f.read()
+    return None
+
+def evaluate_markdown_file(
+    source_file: str,
+    test: bool = False,
+    result: Optional[CompileResult] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None
+) -> str:
+    """
+    Read a Markdown file and evaluate its embedded Python, returning the evaluated Markdown.
+    With a `sandbox`, the Python runs on one of its worker processes instead of in this one.
+    """
+    if result is None:
+        result = CompileResult()
+
+    with result.stage("read"):
+        with open(source_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
 
     # Evaluate Python code within the Markdown
-    evaluated_content = evaluate_python_in_markdown_string(markdown_content)
+    with result.stage("evaluate"):
+        evaluate = sandbox.evaluate if sandbox is not None else evaluate_python_in_markdown_string
+        evaluated_content = evaluate(
+            markdown_content, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows, table_format=table_format,
+            result=result
+        )
     if test:
         print()
         print("#################################################################")
@@ -24,12 +67,53 @@ def preprocess_markdown_file(source_file: str, test: bool = False) -> str:
         print(evaluated_content)
         print("=================================================================")
         print("#################################################################")
+    return evaluated_content
+
+def write_markdown(workspace: Workspace, evaluated_content: str) -> str:
+    """Save evaluated Markdown as the workspace's document.md, returning its path."""
+    md_path = workspace.file("document.md")
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(evaluated_content)
+    return md_path
+
+def preprocess_markdown_file(
+    source_file: str,
+    test: bool = False,
+    result: Optional[CompileResult] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    workspace: Optional[Workspace] = None
+) -> str:
+    """
+    Preprocess a Markdown file by evaluating embedded Python and saving it as a temporary file.
+    With a `sandbox`, the Python runs on one of its worker processes instead of in this one.
+    The file is written into `workspace` when one is given (and removed with it). Otherwise
+    it goes in a workspace of the default pool that `compile_markdown_to_pdf` takes over
+    and empties once the PDF is built.
+    """
+    if result is None:
+        result = CompileResult()
+
+    evaluated_content = evaluate_markdown_file(
+        source_file, test, result=result, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows,
+        table_format=table_format, sandbox=sandbox
+    )
 
     # Create a temporary Markdown file with the evaluated content
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".md", mode='w', encoding='utf-8') as temp_md_file:
-        temp_md_file.write(evaluated_content)
-        temp_md_path = temp_md_file.name
-
+    with result.stage("write_markdown"):
+        if workspace is not None:
+            return write_markdown(workspace, evaluated_content)
+        pool = default_workspace_pool()
+        workspace = pool.acquire()
+        try:
+            temp_md_path = write_markdown(workspace, evaluated_content)
+        except BaseException:
+            pool.release(workspace)
+            raise
+        pool.hand_off(workspace)
     return temp_md_path
 
 def compile_markdown_to_pdf(
@@ -38,55 +122,60 @@ def compile_markdown_to_pdf(
     template_content: Optional[str] = None,
     output_pdf: Optional[str] = None,
     open_file: bool = False,
-    return_binary: bool = False
-) -> Union[str, Tuple[bytes, str]]:
-    """Compiles a Markdown file to a PDF using pdflatex, optionally returning the PDF binary."""
-    def convert_markdown_to_latex(md_path: str, tex_path: str, template_content: Optional[str] = None) -> str:
+    return_binary: bool = False,
+    result: Optional[CompileResult] = None,
+    cache: Optional[BuildCache] = None,
+    block_cache: Optional[PandocBlockCache] = None,
+    format_cache: Optional[FormatCache] = None,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None,
+    build_dirs: Optional[BuildDirectories] = None,
+    workspace: Optional[Workspace] = None
+) -> CompileResult:
+    """
+    Compiles a Markdown file to a PDF using pdflatex (or another TeX `engine`, see
+    tex_engines), optionally returning the PDF binary (in `result.pdf_bytes`, with no
+    `result.pdf_path`).
+
+    Each stage hands off to the next as soon as the previous process exits. Timings are
+    appended to `result` when one is passed in (e.g. from `preprocess_markdown_file`).
+    With a `cache`, a previous build of identical content and template is returned
+    without running pandoc or pdflatex. With a `block_cache`, pandoc only converts the
+    top-level blocks (sections) that aren't already cached. With a `format_cache`, the
+    template's static preamble is loaded from a precompiled format instead of on every pass.
+    `engine` may be 'auto' to build with the fastest engine recorded in `engine_timings`.
+    Intermediate files go in `workspace`, or in one from the default pool that is emptied
+    once the build is over (along with `preprocessed_source_file`, if it came from
+    `preprocess_markdown_file` without a workspace). With `build_dirs`, TeX works in a
+    persistent directory for the source file and template instead, keeping its .aux/.toc
+    state for the next build.
+    """
+    def convert_markdown_to_latex(md_path: str, tex_path: str, template_path: Optional[str] = None) -> Tuple[str, str]:
         pandoc_cmd = [
             'pandoc', md_path,
             '-s',
             '-o', tex_path,
             '--pdf-engine-opt=--quiet'
         ]
-
-        if template_content:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".tex") as tf:
-                tf.write(template_content.encode('utf-8'))
-                tf.flush()
-                pandoc_cmd.append(f'--template={tf.name}')
-
-        result = subprocess.run(
+        if template_path:
+            pandoc_cmd.append(f'--template={template_path}')
+
+        # Only re-convert the blocks that changed since an earlier build
+        if block_cache is not None:
+            with open(md_path, 'r', encoding='utf-8') as f:
+                stderr = convert_markdown_to_latex_by_blocks(f.read(), tex_path, block_cache, template_path)
+            if stderr is not None:
+                return tex_path, stderr
+
+        with open(md_path, 'r', encoding='utf-8') as f:
+            pandoc_cmd += pandoc_table_args(f.read())
+        completed = subprocess.run(
             pandoc_cmd,
             check=True,
             capture_output=True,
             text=True
         )
-        return tex_path, result.stderr
-
-    def run_pdflatex(tex_file: str, output_dir: str) -> Tuple[str, str]:
-        pdflatex_command = [
-            'pdflatex',
-            '-interaction=nonstopmode',
-            '-output-directory', output_dir,
-            tex_file
-        ]
-        result = subprocess.run(
-            pdflatex_command,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        # Run pdflatex twice to resolve references
-        result = subprocess.run(
-            pdflatex_command,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-
-        base_name = os.path.splitext(os.path.basename(tex_file))[0]
-        pdf_path = os.path.join(output_dir, f"{base_name}.pdf")
-        return pdf_path, result.stderr
+        return tex_path, completed.stderr
 
     def open_pdf(pdf_path: str) -> None:
         try:
@@ -99,57 +188,180 @@ def compile_markdown_to_pdf(
         except Exception as e:
             print(f"Unable to open PDF automatically: {str(e)}")
 
+    def deliver_pdf(pdf_path: str, keep_source: bool = False) -> CompileResult:
+        # Hand the PDF back as bytes, or place it at its final destination. Bytes come with
+        # no path: `pdf_path` is a cache entry or scratch file the caller doesn't own
+        if return_binary:
+            with result.stage("return"):
+                with open(pdf_path, 'rb') as pdf_file:
+                    result.pdf_bytes = pdf_file.read()
+            result.output_size = len(result.pdf_bytes)
+            return result
+
+        with result.stage("move"):
+            if output_pdf is None:
+                pdf_basename = os.path.splitext(os.path.basename(source_file_name_without_extension))[0] + ".pdf"
+                final_pdf_path = os.path.join(os.getcwd(), pdf_basename)
+            else:
+                final_pdf_path = output_pdf
+
+            if os.path.exists(final_pdf_path):
+                os.remove(final_pdf_path)
+            if keep_source:
+                shutil.copyfile(pdf_path, final_pdf_path)
+            else:
+                shutil.move(pdf_path, final_pdf_path)
+
+        result.pdf_path = final_pdf_path
+        result.output_size = os.path.getsize(final_pdf_path)
+
+        if open_file:
+            open_pdf(final_pdf_path)
+
+        return result
+
     if not preprocessed_source_file.endswith('.md'):
         raise ValueError("The source file must be a Markdown (.md) file.")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".tex") as temp_tex_file:
-        temp_tex_path = temp_tex_file.name
+    if result is None:
+        result = CompileResult()
 
-    temp_dir = None
-    final_pdf_path = None
-    pandoc_stderr = ""
-    pdflatex_stderr = ""
+    # Every file of the build goes in one workspace, cleaned up whether or not it succeeds;
+    # that's the one holding the evaluated Markdown if `preprocess_markdown_file` made it
+    scratch = (
+        contextlib.nullcontext(workspace) if workspace is not None
+        else default_workspace_pool().workspace(handed_off_file=preprocessed_source_file)
+    )
+    with scratch as build_space:
+        # A cache hit skips pandoc and TeX entirely
+        cache_key = None
+        if cache is not None:
+            with result.stage("cache_lookup"):
+                with open(preprocessed_source_file, 'r', encoding='utf-8') as f:
+                    cache_key = cache.key(f.read(), template_content, requested_engine(engine, template_content))
+                cached_pdf = cache.get(cache_key)
+            if cached_pdf is not None:
+                result.cache_hit = True
+                return deliver_pdf(cached_pdf, keep_source=True)
+
+        template_path = None
+        if template_content:
+            template_path = build_space.file("template.latex")
+            with open(template_path, 'w', encoding='utf-8') as f:
+                f.write(template_content)
 
-    try:
         # Convert markdown to LaTeX
-        temp_tex_path, pandoc_stderr = convert_markdown_to_latex(preprocessed_source_file, temp_tex_path, template_content)
-        time.sleep(1)
-
-        # Create temporary directory for pdflatex output
-        temp_dir = tempfile.mkdtemp()
-        pdf_path, pdflatex_stderr = run_pdflatex(temp_tex_path, temp_dir)
-        time.sleep(1)
+        with result.stage("pandoc"):
+            tex_path, result.stderr['pandoc'] = convert_markdown_to_latex(
+                preprocessed_source_file, build_space.file("document.tex"), template_path
+            )
+
+        persistent = (
+            build_dirs.use(source_file_name_without_extension, template_content)
+            if build_dirs is not None else contextlib.nullcontext()
+        )
+        with persistent as build_dir:
+            pdf_path, result.stderr['pdflatex'], result.tex_passes = typeset(
+                tex_path, build_dir or build_space.path, template_content, result=result,
+                engine=engine, engine_timings=engine_timings, format_cache=format_cache
+            )
+
+            if cache is not None:
+                with result.stage("cache_store"):
+                    cache.put(cache_key, pdf_path)
+
+            return deliver_pdf(pdf_path)
+
+def compile_markdown_string(
+    markdown_content: str,
+    template: Optional[str] = None,
+    result: Optional[CompileResult] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    jobs: int = 1,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox: Optional[SandboxPool] = None,
+    cache: Optional[BuildCache] = None,
+    block_cache: Optional[PandocBlockCache] = None,
+    format_cache: Optional[FormatCache] = None,
+    engine: Optional[str] = None,
+    engine_timings: Optional[EngineTimings] = None
+) -> bytes:
+    """
+    Compile a Markdown string (with embedded Python) straight to PDF bytes.
+
+    The Markdown is evaluated in memory and piped through pandoc's stdin/stdout. The only
+    files written are the ones TeX can't do without (the template, .tex, .aux, .log and
+    .pdf), all inside a single workspace on tmpfs where available, which is emptied
+    afterwards (see workspace.py). `template` is a built-in template name or a template file path.
+    With a `sandbox`, the Python runs on one of its worker processes. `engine` picks the TeX
+    engine, as for `compile_markdown_to_pdf`.
+    """
+    if result is None:
+        result = CompileResult()
+
+    with result.stage("evaluate"):
+        evaluate = sandbox.evaluate if sandbox is not None else evaluate_python_in_markdown_string
+        evaluated_content = evaluate(
+            markdown_content, embed_cache=embed_cache, jobs=jobs, max_rows=max_rows, table_format=table_format,
+            result=result
+        )
+    template_content = resolve_template(template)
+
+    cache_key = None
+    if cache is not None:
+        with result.stage("cache_lookup"):
+            cache_key = cache.key(evaluated_content, template_content, requested_engine(engine, template_content))
+            cached_pdf = cache.get(cache_key)
+        if cached_pdf is not None:
+            result.cache_hit = True
+            with result.stage("return"):
+                with open(cached_pdf, 'rb') as pdf_file:
+                    result.pdf_bytes = pdf_file.read()
+            result.output_size = len(result.pdf_bytes)
+            return result.pdf_bytes
+
+    with default_workspace_pool().workspace() as scratch:
+        tex_path = scratch.file("document.tex")
+        template_path = None
+        if template_content:
+            template_path = scratch.file("template.latex")
+            with open(template_path, 'w', encoding='utf-8') as f:
+                f.write(template_content)
+
+        with result.stage("pandoc"):
+            stderr = None
+            if block_cache is not None:
+                stderr = convert_markdown_to_latex_by_blocks(evaluated_content, tex_path, block_cache, template_path)
+            if stderr is None:
+                pandoc_cmd = ['pandoc', '-f', 'markdown', '-t', 'latex', '-s', '-o', tex_path]
+                if template_path:
+                    pandoc_cmd.append(f'--template={template_path}')
+                pandoc_cmd += pandoc_table_args(evaluated_content)
+                completed = subprocess.run(
+                    pandoc_cmd,
+                    input=evaluated_content,
+                    check=True,
+                    capture_output=True,
+                    text=True
+                )
+                stderr = completed.stderr
+            result.stderr['pandoc'] = stderr
+
+        pdf_path, result.stderr['pdflatex'], result.tex_passes = typeset(
+            tex_path, scratch.path, template_content, result=result,
+            engine=engine, engine_timings=engine_timings, format_cache=format_cache
+        )
 
-        if not os.path.exists(pdf_path):
-            raise FileNotFoundError(f"PDF was not generated at: {pdf_path}")
+        if cache is not None:
+            with result.stage("cache_store"):
+                cache.put(cache_key, pdf_path)
 
-        if return_binary:
+        with result.stage("return"):
             with open(pdf_path, 'rb') as pdf_file:
-                pdf_data = pdf_file.read()
-            return pdf_data, f"PDF generated at: {pdf_path}\nPandoc stderr: {pandoc_stderr}\nPdflatex stderr: {pdflatex_stderr}"
-
-        # Move PDF to final destination
-        if output_pdf is None:
-            pdf_basename = os.path.splitext(os.path.basename(source_file_name_without_extension))[0] + ".pdf"
-            final_pdf_path = os.path.join(os.getcwd(), pdf_basename)
-        else:
-            final_pdf_path = output_pdf
-
-        if os.path.exists(final_pdf_path):
-            os.remove(final_pdf_path)
-        os.rename(pdf_path, final_pdf_path)
-
-        if open_file:
-            open_pdf(final_pdf_path)
-
-        return f"PDF generated at: {final_pdf_path}\nPandoc stderr: {pandoc_stderr}\nPdflatex stderr: {pdflatex_stderr}"
-
-    finally:
-        # Clean up temporary files
-        if os.path.exists(temp_tex_path):
-            os.remove(temp_tex_path)
-        if temp_dir and os.path.isdir(temp_dir):
-            shutil.rmtree(temp_dir)
+                result.pdf_bytes = pdf_file.read()
+        result.output_size = len(result.pdf_bytes)
+        return result.pdf_bytes
 
 def install_pandoc_and_latex():
     """Install pandoc and a minimal set of TeX Live packages."""
@@ -169,8 +381,6 @@ def install_pandoc_and_latex():
         raise RuntimeError(f"Installation failed: {e.stderr}")
 
 def main():
-    print(logo_string)
-
     parser = argparse.ArgumentParser(
         description="Compile a Markdown (.md) file to PDF using pandoc and pdflatex.",
         add_help=False
@@ -189,7 +399,7 @@ def main():
     parser.add_argument(
         "source_file",
         nargs="?",
-        help="Path to the input Markdown file."
+        help="Path to the input Markdown file, or '-' to read Markdown from stdin and write the PDF to stdout."
     )
     parser.add_argument(
         "output_pdf",
@@ -205,15 +415,207 @@ def main():
     parser.add_argument(
         "--template",
         default=None,
-        help="Name of a built-in template to use (e.g. 'two-column')."
+        help="Name of a built-in template to use (e.g. 'two-column-article'), or a path to a LaTeX template file."
     )
     parser.add_argument(
         "--test",
         action="store_true",
         help="Evaluates the python code in the Markdown, and prints the string just before it is sent for Pandoc processing."
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse a previously built PDF when the evaluated content and template are unchanged."
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory for the build cache (defaults to ~/.cache/md2ltx)."
+    )
+    parser.add_argument(
+        "--cache_size_mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Maximum size of the PDF cache in megabytes; least recently used PDFs are evicted first."
+    )
+    parser.add_argument(
+        "--block_cache",
+        action="store_true",
+        help="Convert the document section by section, re-running pandoc only on sections that changed."
+    )
+    parser.add_argument(
+        "--format_cache",
+        action="store_true",
+        help="Precompile each template's preamble into a LaTeX format and reuse it on every TeX pass."
+    )
+    parser.add_argument(
+        "--build_dirs",
+        action="store_true",
+        help="Keep each document's TeX auxiliary files (.aux, .toc, ...) in a persistent build directory, so unchanged rebuilds need a single pass."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINE_CHOICES,
+        default=None,
+        help="TeX engine to build with (default: the template's `%% ENGINE::name` line, else pdflatex); 'auto' picks the fastest one measured for the template."
+    )
+    parser.add_argument(
+        "--engine_stats",
+        action="store_true",
+        help="Print the TeX times recorded per template and engine by --engine auto and exit."
+    )
+    parser.add_argument(
+        "--embed_cache",
+        action="store_true",
+        help="Reuse EMBED function results across builds for functions with a TTL (see --embed_ttl)."
+    )
+    parser.add_argument(
+        "--embed_ttl",
+        action="append",
+        default=[],
+        metavar="NAME=DURATION",
+        help="Cache the result of EMBED function NAME for DURATION (e.g. 90s, 15m, 2h); NAME '*' sets a default. Implies --embed_cache."
+    )
+    parser.add_argument(
+        "--embed_deadline",
+        action="append",
+        default=[],
+        metavar="NAME=DURATION",
+        help="Wait at most DURATION for EMBED function NAME, then use its last result and refresh it in the background; NAME '*' sets a default. Implies --embed_cache."
+    )
+    parser.add_argument(
+        "--document_deadline",
+        default=None,
+        metavar="DURATION",
+        help="Deadline shared by all EMBED functions of a document, counted from the start of evaluation (see --embed_deadline). Implies --embed_cache."
+    )
+    parser.add_argument(
+        "--cache_stats",
+        action="store_true",
+        help="Print build cache hit/miss statistics and exit."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Evaluate up to N distinct EMBED functions concurrently in forked worker processes."
+    )
+    parser.add_argument(
+        "--max_rows",
+        type=int,
+        default=DEFAULT_MAX_ROWS,
+        metavar="N",
+        help=f"Show at most N rows of each embedded DataFrame, 0 for all (default: {DEFAULT_MAX_ROWS})."
+    )
+    parser.add_argument(
+        "--table_format",
+        choices=TABLE_FORMATS,
+        default=DEFAULT_TABLE_FORMAT,
+        help="How embedded DataFrames are rendered: Markdown pipe tables or raw LaTeX longtables (default: pipe)."
+    )
+    parser.add_argument(
+        "--sandbox",
+        action="store_true",
+        help="Evaluate embedded Python on pre-forked worker processes with pandas preloaded, under the limits below."
+    )
+    parser.add_argument(
+        "--sandbox_timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=f"Kill a document's embedded code after SECONDS of wall-clock time, 0 for no limit (default: {DEFAULT_TIMEOUT:g}). Implies --sandbox."
+    )
+    parser.add_argument(
+        "--sandbox_memory_mb",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Cap each sandbox worker's address space at MB megabytes (RLIMIT_AS). Implies --sandbox."
+    )
+    parser.add_argument(
+        "--sandbox_cpu_seconds",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="Cap the CPU time of one document's embedded code (RLIMIT_CPU). Implies --sandbox."
+    )
+    parser.add_argument(
+        "--sandbox_recycle_after",
+        type=int,
+        default=None,
+        metavar="N",
+        help=f"Replace each sandbox worker after it has evaluated N documents (default: {DEFAULT_RECYCLE_AFTER}). Implies --sandbox."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and rebuild the PDF whenever the source file or template file changes."
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address `md2ltx serve` listens on (default: 127.0.0.1)."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port `md2ltx serve` listens on (default: 8765)."
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Serve over this Unix domain socket instead of TCP."
+    )
+    parser.add_argument(
+        "--max_concurrent",
+        type=int,
+        default=None,
+        help="Maximum number of builds `md2ltx serve` runs at once (defaults to the number of CPUs)."
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        default=None,
+        metavar="SOURCE",
+        help="Compile many Markdown files (paths or glob patterns) concurrently."
+    )
+    parser.add_argument(
+        "--output_dir",
+        default=None,
+        help="Directory for the PDFs written by --batch (defaults to the working directory)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of documents --batch processes at once (defaults to the number of CPUs)."
+    )
+    parser.add_argument(
+        "--summary",
+        default=None,
+        help="Write a per-file JSON summary of a --batch run to this path."
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print wall-clock and CPU time for each build stage."
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="PATH",
+        help="Write a Chrome trace of the build (stages, code blocks, EMBED calls, DataFrame rendering) to PATH, plus a JSON summary next to it."
+    )
 
     args = parser.parse_args()
+    # So a terminated build still removes its scratch files
+    exit_on_sigterm()
+
+    # With `-` stdout carries the PDF, so nothing else may be printed there
+    if args.source_file != "-":
+        print(logo_string)
 
     if args.help:
         print(help_string)
@@ -224,6 +626,148 @@ def main():
         print("\nDependencies installed. Re-run without --install_dependencies to compile documents.")
         sys.exit(0)
 
+    build_cache = None
+    if args.cache or args.cache_stats:
+        build_cache = BuildCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+    if args.cache_stats:
+        for name, value in build_cache.stats().items():
+            print(f"{name}: {value}")
+        sys.exit(0)
+
+    if args.engine_stats:
+        print(EngineTimings(args.cache_dir).stats())
+        sys.exit(0)
+
+    embed_cache = None
+    if args.embed_cache or args.embed_ttl or args.embed_deadline or args.document_deadline:
+        try:
+            ttls = dict(parse_ttl_option(option) for option in args.embed_ttl)
+            deadlines = dict(parse_ttl_option(option, 'deadline') for option in args.embed_deadline)
+            document_deadline = parse_duration(args.document_deadline) if args.document_deadline else None
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        embed_cache = EmbedCache(args.cache_dir, ttls=ttls, deadlines=deadlines, document_deadline=document_deadline)
+
+    # Shared by every build mode below and passed through to compile_markdown_to_pdf
+    compile_options = {
+        'cache': build_cache,
+        'block_cache': PandocBlockCache(args.cache_dir) if args.block_cache else None,
+        'format_cache': FormatCache(args.cache_dir) if args.format_cache else None,
+        'engine': args.engine,
+        'engine_timings': EngineTimings(args.cache_dir) if args.engine == 'auto' else None,
+        'build_dirs': BuildDirectories(args.cache_dir) if args.build_dirs else None,
+    }
+
+    def save_profile(results: List[Tuple[str, CompileResult]]) -> None:
+        summary = write_profile(args.profile, results)
+        print(format_profile_summary(summary))
+        print(f"Trace written to {args.profile} (open it in https://ui.perfetto.dev), summary to {summary_path(args.profile)}")
+
+    if args.profile and (args.watch or (args.source_file == "serve" and not os.path.exists(args.source_file))):
+        print("Error: --profile records single builds and --batch runs, not --watch or serve.")
+        sys.exit(1)
+
+    # Any sandbox option turns the sandbox on; each build mode below sizes its own pool
+    sandbox_limits = None
+    sandbox_options = (args.sandbox_timeout, args.sandbox_memory_mb, args.sandbox_cpu_seconds, args.sandbox_recycle_after)
+    if args.sandbox or any(option is not None for option in sandbox_options):
+        if args.watch:
+            print("Error: --watch keeps its evaluation state in-process and can't be combined with the sandbox options.")
+            sys.exit(1)
+        sandbox_limits = SandboxLimits(
+            timeout=(DEFAULT_TIMEOUT if args.sandbox_timeout is None else args.sandbox_timeout) or None,
+            memory_mb=args.sandbox_memory_mb,
+            cpu_seconds=args.sandbox_cpu_seconds,
+            recycle_after=args.sandbox_recycle_after or DEFAULT_RECYCLE_AFTER
+        )
+
+    if args.batch:
+        # Imported here, as batch, server and watch import this module
+        from .batch import compile_markdown_files, format_summary, write_summary
+        sandbox = None
+        if sandbox_limits is not None:
+            sandbox = SandboxPool(max(1, args.workers or os.cpu_count() or 1), sandbox_limits)
+        try:
+            items = compile_markdown_files(
+                args.batch,
+                output_dir=args.output_dir,
+                template_content=resolve_template(args.template),
+                workers=args.workers,
+                embed_cache=embed_cache,
+                jobs=args.jobs,
+                max_rows=args.max_rows,
+                table_format=args.table_format,
+                sandbox=sandbox,
+                **compile_options
+            )
+        finally:
+            if sandbox is not None:
+                sandbox.close()
+        print(format_summary(items))
+        if args.timings:
+            print(default_workspace_pool().reclaimed)
+        if args.summary:
+            write_summary(items, args.summary)
+        if args.profile:
+            save_profile([(item.source_file, item.result) for item in items])
+        sys.exit(0 if all(item.ok for item in items) else 1)
+
+    if args.source_file == "serve" and not os.path.exists(args.source_file):
+        from .server import serve
+        serve(
+            host=args.host,
+            port=args.port,
+            socket_path=args.socket,
+            max_concurrent=args.max_concurrent,
+            embed_cache=embed_cache,
+            max_rows=args.max_rows,
+            table_format=args.table_format,
+            sandbox_limits=sandbox_limits,
+            **compile_options
+        )
+        sys.exit(0)
+
+    # A single build evaluates one document, so one sandbox worker is enough
+    def single_build_sandbox() -> Optional[SandboxPool]:
+        return SandboxPool(1, sandbox_limits) if sandbox_limits is not None else None
+
+    if args.source_file == "-":
+        markdown_content = sys.stdin.read()
+        pdf_stream = sys.stdout.buffer
+        # Diagnostics from embedded code go to stderr so they can't corrupt the PDF
+        string_result = CompileResult()
+        # A string has no source path to key a persistent build directory by
+        compile_options.pop('build_dirs')
+        with contextlib.redirect_stdout(sys.stderr):
+            sandbox = single_build_sandbox()
+            try:
+                pdf_bytes = compile_markdown_string(
+                    markdown_content,
+                    template=args.template,
+                    result=string_result,
+                    embed_cache=embed_cache,
+                    jobs=args.jobs,
+                    max_rows=args.max_rows,
+                    table_format=args.table_format,
+                    sandbox=sandbox,
+                    **compile_options
+                )
+            except SandboxError as exc:
+                print(f"Error: {exc}")
+                sys.exit(1)
+            finally:
+                if sandbox is not None:
+                    sandbox.close()
+            if args.profile:
+                save_profile([("stdin", string_result)])
+            pdf_stream.write(pdf_bytes)
+            pdf_stream.flush()
+            # EMBED refreshes still running in the background print to stderr as well
+            wait_for_background_calls()
+        sys.exit(0)
+
     if not args.source_file:
         print("A source markdown file is required. Try --help for usage.")
         sys.exit(1)
@@ -232,23 +776,65 @@ def main():
         print(f"Error: No such file: {args.source_file}")
         sys.exit(1)
 
-    # Preprocess the markdown file
-    expanded_md_path = preprocess_markdown_file(args.source_file, args.test)
+    if args.watch:
+        from .watch import DocumentWatcher
+        DocumentWatcher(
+            args.source_file,
+            output_pdf=args.output_pdf,
+            template=args.template,
+            open_file=args.open,
+            embed_cache=embed_cache,
+            jobs=args.jobs,
+            max_rows=args.max_rows,
+            table_format=args.table_format,
+            **compile_options
+        ).run()
+        sys.exit(0)
 
-    # Get the base name of the file
-    base_name = os.path.basename(args.source_file)
-    source_file_name_without_extension = os.path.splitext(base_name)[0]
+    # Collects per-stage timings across preprocessing and compilation
+    build_result = CompileResult()
 
-    if not args.test:
-        # Compile to PDF
-        result = compile_markdown_to_pdf(
-            source_file_name_without_extension=source_file_name_without_extension,
-            preprocessed_source_file=expanded_md_path,
-            output_pdf=args.output_pdf,
-            template_content=templates.get(args.template),
-            open_file=args.open
-        )
-        print(result)
+    # Every intermediate file of the build goes in one workspace, emptied when it's over
+    with default_workspace_pool().workspace() as workspace:
+        # Preprocess the markdown file
+        sandbox = single_build_sandbox()
+        try:
+            expanded_md_path = preprocess_markdown_file(
+                args.source_file, args.test, result=build_result, embed_cache=embed_cache, jobs=args.jobs,
+                max_rows=args.max_rows, table_format=args.table_format, sandbox=sandbox,
+                workspace=workspace
+            )
+        except SandboxError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        finally:
+            if sandbox is not None:
+                sandbox.close()
+
+        # The PDF is named after the file; the full path also keys its build directory
+        source_file_name_without_extension = os.path.splitext(args.source_file)[0]
+
+        if not args.test:
+            # Compile to PDF
+            result = compile_markdown_to_pdf(
+                source_file_name_without_extension=source_file_name_without_extension,
+                preprocessed_source_file=expanded_md_path,
+                output_pdf=args.output_pdf,
+                template_content=resolve_template(args.template),
+                open_file=args.open,
+                result=build_result,
+                workspace=workspace,
+                **compile_options
+            )
+            print(result)
+            if args.timings:
+                print(result.timings())
+
+        if args.profile:
+            save_profile([(args.source_file, build_result)])
+
+    if args.timings:
+        print(default_workspace_pool().reclaimed)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,251 @@
+import os
+import re
+import hashlib
+import tempfile
+import subprocess
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from .build_cache import atomic_write, default_cache_dir, evict_lru, tool_version
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Raw LaTeX passes through pandoc untouched, so it survives as a marker between blocks
+BOUNDARY = "%% md2ltx-block-boundary"
+BOUNDARY_BLOCK = f"\n\n```{{=latex}}\n{BOUNDARY}\n```\n\n"
+BOUNDARY_PATTERN = re.compile(rf"^{re.escape(BOUNDARY)}$", re.MULTILINE)
+
+HEADING_PATTERN = re.compile(r"^#{1,6}(\s|$)")
+FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+
+# Footnotes and reference-style link definitions are resolved across the whole
+# document, so a file using them can't be converted one block at a time
+GLOBAL_DEFINITION_PATTERN = re.compile(r"^\s{0,3}\[[^\]]+\]:", re.MULTILINE)
+
+# Pieces of heading text that don't make it into pandoc's automatic identifiers
+SETEXT_UNDERLINE_PATTERN = re.compile(r"^\s{0,3}(=+|-+)\s*$")
+EXPLICIT_ID_PATTERN = re.compile(r"\{[^}]*#([\w.:-]+)[^}]*\}\s*$")
+ATTRIBUTES_PATTERN = re.compile(r"\{[^}]*\}\s*$")
+LINK_TARGET_PATTERN = re.compile(r"\]\([^)]*\)")
+
+# Template variables pandoc derives from the body; the template pass only sees raw LaTeX
+FEATURE_VARIABLES = {
+    'tables': re.compile(r"\\begin\{longtable\}"),
+    'graphics': re.compile(r"\\includegraphics"),
+    'strikeout': re.compile(r"\\sout\{"),
+}
+HIGHLIGHTING_PATTERN = re.compile(r"\\begin\{Shaded\}")
+
+
+def split_front_matter(markdown: str) -> Tuple[str, str]:
+    """Separate a leading YAML metadata block from the rest of the document."""
+    lines = markdown.splitlines(keepends=True)
+    if not lines or lines[0].strip() != '---':
+        return "", markdown
+    for i in range(1, len(lines)):
+        if lines[i].strip() in ('---', '...'):
+            return "".join(lines[:i + 1]), "".join(lines[i + 1:])
+    return "", markdown
+
+
+def split_blocks(body: str) -> List[str]:
+    """Split Markdown into top-level blocks, starting a new block at every ATX heading outside a code fence."""
+    blocks: List[str] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+
+    for line in body.splitlines(keepends=True):
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None and HEADING_PATTERN.match(line) and current:
+            blocks.append("".join(current))
+            current = []
+        current.append(line)
+
+    if current:
+        blocks.append("".join(current))
+    return blocks
+
+
+def heading_identifier(text: str) -> str:
+    """
+    A coarser version of the identifier pandoc gives a heading: `{#id}` if set, else the
+    text without link targets or punctuation, lowercased. Headings pandoc would give the
+    same identifier always get the same one here.
+    """
+    explicit = EXPLICIT_ID_PATTERN.search(text)
+    if explicit:
+        text = explicit.group(1)
+    text = LINK_TARGET_PATTERN.sub("]", ATTRIBUTES_PATTERN.sub("", text))
+    identifier = "".join(ch for ch in text.lower() if ch.isalnum()).lstrip("0123456789")
+    return identifier or "section"
+
+
+def heading_texts(body: str) -> List[str]:
+    """The text of every ATX and setext heading outside a code fence."""
+    texts: List[str] = []
+    fence: Optional[str] = None
+    previous = ""
+    for line in body.splitlines():
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None:
+            if HEADING_PATTERN.match(line):
+                texts.append(line.strip().strip("#"))
+            elif SETEXT_UNDERLINE_PATTERN.match(line) and previous.strip():
+                texts.append(previous)
+        previous = line if fence is None else ""
+    return texts
+
+
+def can_split(markdown: str) -> bool:
+    """
+    Whether blocks convert the same on their own as within the whole document. Besides
+    global definitions, that rules out headings sharing an identifier: pandoc numbers the
+    repeats (`intro-1`, ...) based on the rest of the document.
+    """
+    if GLOBAL_DEFINITION_PATTERN.search(markdown) is not None:
+        return False
+    identifiers = [heading_identifier(text) for text in heading_texts(markdown)]
+    return len(identifiers) == len(set(identifiers))
+
+
+class PandocBlockCache:
+    """
+    On-disk cache of Markdown blocks already converted to LaTeX by pandoc.
+
+    Each entry is keyed by the block text and the pandoc version. Like the PDF cache,
+    least recently used entries are evicted once the directory exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = os.path.join(directory or default_cache_dir(), 'pandoc-blocks')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, block: str) -> str:
+        sha = hashlib.sha256()
+        sha.update(tool_version('pandoc').encode('utf-8'))
+        sha.update(b'\0')
+        sha.update(block.encode('utf-8'))
+        return sha.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.tex")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                latex = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path, None)
+        self.hits += 1
+        return latex
+
+    def put(self, key: str, latex: str) -> None:
+        atomic_write(self._entry_path(key), latex.encode('utf-8'))
+
+    def evict(self) -> int:
+        return evict_lru(self.directory, self.max_bytes, '.tex')
+
+
+def _run_pandoc(args: List[str], stdin: str) -> Tuple[str, str]:
+    completed = subprocess.run(
+        ['pandoc'] + args,
+        input=stdin,
+        check=True,
+        capture_output=True,
+        text=True
+    )
+    return completed.stdout, completed.stderr
+
+
+@lru_cache(maxsize=None)
+def highlighting_macros() -> str:
+    """The Shaded/Highlighting macro definitions pandoc emits when a document has highlighted code."""
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = os.path.join(tmp, 'macros.latex')
+        with open(template_path, 'w', encoding='utf-8') as f:
+            f.write("$highlighting-macros$\n")
+        macros, _ = _run_pandoc(
+            ['-f', 'markdown', '-t', 'latex', '-s', f'--template={template_path}'],
+            "```python\nx = 1\n```\n"
+        )
+    return macros.strip()
+
+
+def _longest_backtick_run(text: str) -> int:
+    runs = re.findall(r"`+", text)
+    return max((len(r) for r in runs), default=0)
+
+
+def convert_markdown_to_latex_by_blocks(
+    markdown: str,
+    tex_path: str,
+    cache: PandocBlockCache,
+    template_path: Optional[str] = None
+) -> Optional[str]:
+    """
+    Convert Markdown to a standalone LaTeX file, re-running pandoc only on blocks not already cached.
+
+    1) Split off the YAML metadata and cut the rest into blocks at each heading.
+    2) Convert every uncached block in a single pandoc call, separated by raw LaTeX markers.
+    3) Wrap the assembled body in a raw LaTeX block and let pandoc apply the template and metadata.
+
+    Returns pandoc's stderr, or None if the document can't be split safely and should be
+    converted as a whole.
+    """
+    front_matter, body = split_front_matter(markdown)
+    if not can_split(body):
+        return None
+
+    blocks = split_blocks(body)
+    keys = [cache.key(block) for block in blocks]
+    converted: List[Optional[str]] = [cache.get(key) for key in keys]
+    stderr_parts: List[str] = []
+
+    missing = [i for i, latex in enumerate(converted) if latex is None]
+    if missing:
+        joined = BOUNDARY_BLOCK.join(blocks[i] for i in missing)
+        output, stderr = _run_pandoc(['-f', 'markdown', '-t', 'latex'], joined)
+        stderr_parts.append(stderr)
+        parts = BOUNDARY_PATTERN.split(output)
+        if len(parts) != len(missing):
+            # A block swallowed a boundary marker; don't trust the split
+            return None
+        for i, part in zip(missing, parts):
+            converted[i] = part.strip("\n")
+            cache.put(keys[i], converted[i])
+        cache.evict()
+
+    body_latex = "\n\n".join(latex for latex in converted if latex)
+
+    fence = "`" * max(3, _longest_backtick_run(body_latex) + 1)
+    document = f"{front_matter}\n{fence}{{=latex}}\n{body_latex}\n{fence}\n"
+
+    args = ['-f', 'markdown', '-t', 'latex', '-s', '-o', tex_path]
+    if template_path:
+        args.append(f'--template={template_path}')
+    for variable, pattern in FEATURE_VARIABLES.items():
+        if pattern.search(body_latex):
+            args += ['-V', f'{variable}=true']
+    if HIGHLIGHTING_PATTERN.search(body_latex):
+        args += ['-V', f'highlighting-macros={highlighting_macros()}']
+
+    _, stderr = _run_pandoc(args, document)
+    stderr_parts.append(stderr)
+    return "".join(stderr_parts)
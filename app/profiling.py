@@ -0,0 +1,107 @@
+import os
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+from .compile_result import CompileResult, Span
+
+# Span categories, in the order the summary lists them
+CATEGORIES = ("stage", "exec", "embed", "dataframe")
+
+
+def summary_path(profile_path: str) -> str:
+    """`report.json` -> `report.summary.json`."""
+    root, ext = os.path.splitext(profile_path)
+    return f"{root}.summary{ext or '.json'}"
+
+
+def _all_spans(results: Sequence[Tuple[str, CompileResult]]) -> List[Tuple[str, Span]]:
+    return [(label, span) for label, result in results for span in result.spans]
+
+
+def trace_events(results: Sequence[Tuple[str, CompileResult]]) -> List[Dict[str, Any]]:
+    """
+    Chrome trace events ("X" complete events, microseconds) for the spans of each
+    labelled result, with threads named after the document they worked on. The output
+    loads in Perfetto (ui.perfetto.dev) or chrome://tracing.
+    """
+    spans = _all_spans(results)
+    if not spans:
+        return []
+    origin = min(span.start for _, span in spans)
+
+    events: List[Dict[str, Any]] = []
+    thread_ids: Dict[Tuple[int, int], int] = {}
+    for label, span in spans:
+        # Thread idents are huge and reused across processes; number them per process
+        key = (span.pid, span.tid)
+        if key not in thread_ids:
+            thread_ids[key] = len(thread_ids) + 1
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": span.pid, "tid": thread_ids[key],
+                "args": {"name": f"{label} ({span.pid})"},
+            })
+        events.append({
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": round((span.start - origin) * 1e6, 1),
+            "dur": round(span.duration * 1e6, 1),
+            "pid": span.pid,
+            "tid": thread_ids[key],
+            "args": dict(span.args, document=label),
+        })
+    return events
+
+
+def profile_summary(results: Sequence[Tuple[str, CompileResult]], top: int = 10) -> Dict[str, Any]:
+    """
+    The compact view: wall time, seconds per stage and per span category, and the slowest
+    individual code blocks, EMBED calls and DataFrame renders.
+    """
+    spans = _all_spans(results)
+    stages: Dict[str, float] = {}
+    categories: Dict[str, Dict[str, Any]] = {}
+    for _, span in spans:
+        if span.category == "stage":
+            stages[span.name] = round(stages.get(span.name, 0.0) + span.duration, 4)
+        totals = categories.setdefault(span.category, {"count": 0, "seconds": 0.0})
+        totals["count"] += 1
+        totals["seconds"] = round(totals["seconds"] + span.duration, 4)
+
+    slowest = sorted((pair for pair in spans if pair[1].category != "stage"), key=lambda pair: -pair[1].duration)
+    return {
+        "wall_time": round(sum(result.wall_time for _, result in results), 4),
+        "stages": stages,
+        "categories": {name: categories[name] for name in sorted(categories, key=_category_order)},
+        "slowest": [
+            {"document": label, "name": span.name, "category": span.category, "seconds": round(span.duration, 4)}
+            for label, span in slowest[:top]
+        ],
+    }
+
+
+def _category_order(name: str) -> Tuple[int, str]:
+    return (CATEGORIES.index(name) if name in CATEGORIES else len(CATEGORIES), name)
+
+
+def format_profile_summary(summary: Dict[str, Any]) -> str:
+    """A few lines for the terminal: where the time went, and the slowest spans."""
+    lines = [f"Profile: {summary['wall_time']:.3f}s in stages"]
+    for name, totals in summary["categories"].items():
+        if name != "stage":
+            lines.append(f"  {name:<10} {totals['seconds']:8.3f}s over {totals['count']} spans")
+    for item in summary["slowest"][:5]:
+        lines.append(f"  slowest: {item['name']} ({item['category']}) {item['seconds']:.3f}s")
+    return "\n".join(lines)
+
+
+def write_profile(path: str, results: Sequence[Tuple[str, CompileResult]]) -> Dict[str, Any]:
+    """
+    Write the Chrome trace to `path` and the summary next to it (see `summary_path`);
+    returns the summary.
+    """
+    summary = profile_summary(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace_events(results), "displayTimeUnit": "ms"}, f)
+    with open(summary_path(path), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
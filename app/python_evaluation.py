@@ -1,54 +1,213 @@
 import re
-import math
+import ast
+import atexit
 import os
-import pandas as pd
-import numpy as np
-import rgwfuncs
+import sys
+import time
 import typing
-from datetime import datetime, timedelta
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from .embed_cache import EmbedCache, parse_deadline_directives, parse_ttl_directives
+from .compile_result import CompileResult
+from .document_model import Placeholder, parse_markdown
+from .cells import Cell, CellId, execute_cells, make_cell, stale_names
+from .dataframe_rendering import (
+    DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT, parse_rows_directives, parse_table_directives, render_dataframe
+)
 
 
-def evaluate_python_in_markdown_string(markdown_content: str) -> str:
+def preload_document_libraries() -> None:
     """
-    1) Search for [START] ... [END] code blocks.
+    Import the heavy libraries documents typically use in their code blocks.
+
+    Nothing in md2ltx needs them at import time, so one-off builds only pay for them when a
+    code block imports them. Long-lived processes (the server, batch builds) call this once
+    before forking workers so every worker starts with them already loaded.
+    """
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import rgwfuncs  # noqa: F401
+
+
+def is_dataframe(value: typing.Any) -> bool:
+    """True for a pandas DataFrame, without importing pandas if the document never did."""
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(value, pandas.DataFrame)
+
+# Set in each forked worker by the pool's initializer, so children inherit the executed
+# code-block environment of their own document; only function names and rendered strings
+# cross the process boundary
+_forked_render: typing.Optional[typing.Callable[[str], str]] = None
+
+
+def _init_render_worker(render: typing.Callable[[str], str]) -> None:
+    global _forked_render
+    _forked_render = render
+
+
+def _render_in_worker(fn_name: str) -> str:
+    return _forked_render(fn_name)
+
+
+def render_in_parallel(render: typing.Callable[[str], str], fn_names: typing.List[str], jobs: int) -> typing.Dict[str, str]:
+    """
+    Render EMBED functions on a pool of forked processes, returning results keyed by name.
+
+    Safe to call from several threads at once: each pool's workers get their `render`
+    through the pool initializer (fork passes it without pickling). Falls back to
+    rendering in this process when fork isn't available (e.g. Windows).
+    """
+    if jobs <= 1 or len(fn_names) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return {fn_name: render(fn_name) for fn_name in fn_names}
+
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes=min(jobs, len(fn_names)), initializer=_init_render_worker, initargs=(render,)) as pool:
+        results = pool.map(_render_in_worker, fn_names, chunksize=1)
+    return dict(zip(fn_names, results))
+
+
+# Background calls still running, waited for at exit (see `wait_for_background_calls`)
+_background_calls: typing.Set[threading.Thread] = set()
+_background_calls_lock = threading.Lock()
+
+
+def call_in_background(fn: typing.Callable[[], typing.Any], name: str) -> Future:
+    """
+    Call `fn` on a new thread, returning a Future for its result. The thread is a daemon,
+    but the process waits for it at exit: a call that outlives its deadline still finishes
+    (and is stored) before a one-off build exits, while a sandbox worker that is being
+    stopped only waits a bounded time.
+    """
+    with _background_calls_lock:
+        return _start_background_call(fn, name)
+
+
+def _start_background_call(fn: typing.Callable[[], typing.Any], name: str) -> Future:
+    # `call_in_background`, with `_background_calls_lock` already held
+    future: Future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with _background_calls_lock:
+                _background_calls.discard(threading.current_thread())
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    _background_calls.add(thread)
+    thread.start()
+    return future
+
+
+# Refreshes of deadline functions still running, by cache file
+_refreshes: typing.Dict[str, Future] = {}
+
+
+def refresh_in_background(key: str, fn: typing.Callable[[], typing.Any], name: str) -> Future:
+    """
+    `call_in_background` for the refresh of one cached result: while a refresh of `key` is
+    still running, later builds wait on that one instead of starting another call.
+    """
+    with _background_calls_lock:
+        future = _refreshes.get(key)
+        if future is not None:
+            return future
+        future = _start_background_call(fn, name)
+        _refreshes[key] = future
+
+    def forget(done: Future) -> None:
+        with _background_calls_lock:
+            if _refreshes.get(key) is done:
+                del _refreshes[key]
+
+    future.add_done_callback(forget)
+    return future
+
+
+def wait_for_background_calls(timeout: typing.Optional[float] = None) -> None:
+    """Wait until every call started by `call_in_background` has finished, or `timeout` seconds have passed."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _background_calls_lock:
+        threads = list(_background_calls)
+    for thread in threads:
+        thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+
+atexit.register(wait_for_background_calls)
+
+
+class EvaluationSession:
+    """
+    State carried between evaluations of the same document, e.g. by watch mode.
+
+    Each code block is a cell (see cells.py). The shared namespace is kept between
+    evaluations and only cells that changed, or that depend on a name a re-run cell binds,
+    are executed again; compiled cells are kept by content hash. The rendered output of a
+    pure EMBED function is reused until a name it (transitively) depends on is re-bound,
+    so edits to the prose alone don't re-run any embedded code.
+    """
+
+    def __init__(self):
+        self.env: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self.cells: typing.List[Cell] = []
+        self.compiled: typing.Dict[str, Cell] = {}
+        self.executed_cells: typing.Set[CellId] = set()
+        self.rendered: typing.Dict[str, str] = {}
+
+    @property
+    def executed(self) -> bool:
+        return self.env is not None
+
+
+def evaluate_python_in_markdown_string(
+    markdown_content: str,
+    embed_cache: typing.Optional[EmbedCache] = None,
+    jobs: int = 1,
+    session: typing.Optional[EvaluationSession] = None,
+    max_rows: typing.Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    result: typing.Optional[CompileResult] = None
+) -> str:
+    """
+    1) Scan the document once for [START] ... [END] code blocks and `EMBED::` placeholders.
     2) Concatenate them into a single big string.
     3) Remove exactly 4 leading spaces (if present) from each line (to fix "one-level" indentation).
-    4) Execute in a shared environment (so any function can appear in any block).
+    4) Execute block by block in a shared environment (so any function can appear in any block).
     5) Replace placeholders `EMBED::func_name` in the Markdown with the result of calling func_name().
+       Each distinct function is called once per document unless marked `# IMPURE::func_name`.
+       With an `embed_cache`, functions that have a TTL reuse a stored result while it is fresh,
+       and functions that miss their deadline are replaced by their last stored result (listed
+       in `result.stale_embeds`) while the call finishes in the background.
+       With `jobs` > 1, distinct pure functions run concurrently in forked worker processes.
+       With a `session`, only blocks that changed (and blocks depending on them) are executed again.
+    6) DataFrame results are shown as tables of at most `max_rows` rows (None or 0 for all), as
+       Markdown pipe tables or raw LaTeX longtables depending on `table_format`. Both can be
+       overridden per function with `# ROWS::func_name=N` and `# TABLE::func_name=FORMAT`.
     """
 
-    # Helper: Convert a pandas.DataFrame to Markdown pipe table
-    def dataframe_to_pandoc_pipe(df: pd.DataFrame) -> str:
-        header = "| " + " | ".join(df.columns) + " |"
-        separator = "|" + "|".join("---" for _ in df.columns) + "|"
-
-        def row_to_pipe(row_values):
-            return "| " + " | ".join(str(x) for x in row_values) + " |"
-
-        if len(df) <= 10:
-            rows = [row_to_pipe(df.iloc[i]) for i in range(len(df))]
-            return "\n".join([header, separator] + rows)
-        else:
-            head_data = df.head(5)
-            tail_data = df.tail(5)
-            head_rows = [row_to_pipe(head_data.iloc[i]) for i in range(len(head_data))]
-            tail_rows = [row_to_pipe(tail_data.iloc[i]) for i in range(len(tail_data))]
-            ellipsis_row = "| " + " | ".join("..." for _ in df.columns) + " |"
-            return "\n".join([header, separator] + head_rows + [ellipsis_row] + tail_rows)
-
-    # Replace placeholders like `EMBED::func_name`
-    def embed_replacer(match: re.Match) -> str:
-        fn_name = match.group(1)
+    # Render the output for a placeholder like `EMBED::func_name`
+    def render_function(fn_name: str) -> str:
         if fn_name not in defined_functions:
             return f"[Error: No function named '{fn_name}' has been defined in the code blocks]"
         try:
-            result_val = defined_functions[fn_name]()
-            # If the result is a DataFrame, convert it to a Markdown pipe table
-            if isinstance(result_val, pd.DataFrame):
+            with span(f"embed {fn_name}", "embed", function=fn_name):
+                result_val = call_function(fn_name)
+            # If the result is a DataFrame, convert it to a pipe table or a raw LaTeX longtable
+            if is_dataframe(result_val):
                 row_count, column_count = result_val.shape
                 # column_names = list(result_val.columns)
                 column_names = ", ".join(f"*{col}*" for col in result_val.columns)
-                md_table = dataframe_to_pandoc_pipe(result_val)
+                fn_table_format = declared_tables.get(fn_name, table_format)
+                with span(f"render {fn_name}", "dataframe", rows=row_count, columns=column_count, format=fn_table_format):
+                    md_table = render_dataframe(
+                        result_val,
+                        table_format=fn_table_format,
+                        max_rows=declared_rows.get(fn_name, max_rows)
+                    )
                 return (
                     f"Dataframe (dimensions: {row_count} × {column_count}), "
                     f"with columns: {column_names}\n\n{md_table}"
@@ -58,6 +217,72 @@ def evaluate_python_in_markdown_string(markdown_content: str) -> str:
         except Exception as e:
             return f"[Error calling '{fn_name}': {e}]"
 
+    # Reuse the rendered output of a pure function for every occurrence of its placeholder
+    def embed_replacer(placeholder: Placeholder) -> str:
+        fn_name = placeholder.fn_name
+        if fn_name in impure_functions:
+            return render_function(fn_name)
+        return rendered[fn_name]
+
+    # Call an EMBED function, going through the result cache when it has a TTL or a deadline
+    def call_function(fn_name: str) -> typing.Any:
+        cache_key = None
+        if embed_cache is not None and fn_name in function_sources:
+            ttl = embed_cache.ttl_for(fn_name, declared_ttls)
+            if ttl is not None or fn_name in deadline_functions:
+                cache_key = embed_cache.key(fn_name, *function_sources[fn_name])
+            if ttl is not None:
+                hit, cached_val = embed_cache.get(cache_key, ttl)
+                if hit:
+                    return cached_val
+        if fn_name in deadline_functions:
+            return call_with_deadline(fn_name, cache_key)
+        result_val = defined_functions[fn_name]()
+        if cache_key is not None:
+            embed_cache.put(cache_key, result_val)
+        return result_val
+
+    # Wait for a function until its deadline, then fall back to its last stored result
+    def call_with_deadline(fn_name: str, cache_key: str) -> typing.Any:
+        def call_and_store() -> typing.Any:
+            result_val = defined_functions[fn_name]()
+            embed_cache.put(cache_key, result_val)
+            return result_val
+
+        hit, last_result = embed_cache.get(cache_key)
+        if not hit:
+            # Nothing to fall back on yet: wait for the function like any other
+            return call_and_store()
+
+        deadline = embed_cache.deadline_for(fn_name, declared_deadlines)
+        if embed_cache.document_deadline is not None:
+            remaining = max(0.0, embed_cache.document_deadline - (time.perf_counter() - started))
+            deadline = remaining if deadline is None else min(deadline, remaining)
+
+        future = refresh_in_background(
+            os.path.join(embed_cache.directory, cache_key), call_and_store, name=f"md2ltx-refresh-{fn_name}"
+        )
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeoutError:
+            if fn_name not in stale_functions:
+                stale_functions.append(fn_name)
+            print(f"[EMBED function '{fn_name}' missed its {deadline:.3g}s deadline: using its last result, refreshing it in the background]")
+            return last_result
+
+    # Map each top-level function to its own source and the source of the block defining it
+    def collect_function_sources(blocks: typing.List[str]) -> typing.Dict[str, typing.Tuple[str, str]]:
+        sources = {}
+        for block in blocks:
+            try:
+                tree = ast.parse(block)
+            except SyntaxError:
+                continue
+            for node in tree.body:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    sources[node.name] = (ast.get_source_segment(block, node) or "", block)
+        return sources
+
     # Remove exactly 4 leading spaces from each line
     def remove_4_spaces(line: str) -> str:
         if len(line) >= 4 and line[:4] == "    ":
@@ -65,37 +290,88 @@ def evaluate_python_in_markdown_string(markdown_content: str) -> str:
         else:
             return line.lstrip()
 
-    # Later used to look up and call user-defined functions
-    defined_functions = {}
+    # Document deadlines count from the start of the evaluation
+    started = time.perf_counter()
+
+    # Profiling spans (code block exec, EMBED calls, DataFrame rendering) go on `result`
+    def span(name: str, category: str, **args: typing.Any) -> typing.ContextManager:
+        return result.span(name, category, **args) if result is not None else nullcontext()
 
-    # Regex: capture all blocks between [START] and [END]
-    import_pattern = re.compile(r"\[START\]#{3,}\s*(.*?)\s*\[END\]#{3,}", re.DOTALL)
-    found_blocks = import_pattern.findall(markdown_content)
+    # Split the document into text, code blocks and placeholders in a single pass
+    document = parse_markdown(markdown_content)
 
-    # Combine all code from all blocks
-    combined_code = "\n".join(found_blocks)
+    # Dedent each block, then combine all code from all blocks
+    processed_blocks = ["\n".join(remove_4_spaces(ln) for ln in block.code.splitlines()) for block in document.code_blocks]
+    final_code = "\n".join(processed_blocks)
 
-    processed_lines = [remove_4_spaces(ln) for ln in combined_code.splitlines()]
-    final_code = "\n".join(processed_lines)
+    # Cache keys and TTLs are only needed when the EMBED result cache is enabled
+    function_sources = collect_function_sources(processed_blocks) if embed_cache is not None else {}
+    declared_ttls = parse_ttl_directives(final_code) if embed_cache is not None else {}
+    declared_deadlines = parse_deadline_directives(final_code) if embed_cache is not None else {}
+    deadline_functions = {
+        fn_name for fn_name in function_sources if embed_cache.has_deadline(fn_name, declared_deadlines)
+    }
+    stale_functions: typing.List[str] = result.stale_embeds if result is not None else []
 
-    # Provide a minimal environment so all imports have to appear within the code blocks themselves
-    env = {"__builtins__": __builtins__}
+    # Each block is a cell; a session remembers compiled cells by content hash
+    compiled = session.compiled if session is not None else None
+    cells = [make_cell(source, block.line, compiled) for source, block in zip(processed_blocks, document.code_blocks)]
 
-    # Execute the combined code in a shared environment
-    try:
-        exec(final_code, env, env)
-    except Exception as exc:
-        print("############ PRINTING CODE BLOCK TO HELP YOU DIAGNOSE LINE-SPECIFIC ERROR ###############\n\n", final_code)
-        print(f"[Error executing combined code: {exc}]")
+    if session is not None and session.env is not None:
+        # Continue from the previous evaluation's environment, re-running only affected cells
+        env = session.env
+        ran, errors = execute_cells(cells, env, session.cells, session.executed_cells, result=result)
+        stale = stale_names(cells, ran, session.cells)
+        previously_rendered = {name: text for name, text in session.rendered.items() if name not in stale}
+    else:
+        # Provide a minimal environment so all imports have to appear within the code blocks themselves
+        env = {"__builtins__": __builtins__}
+        executed_cells: typing.Set[CellId] = set()
+        ran, errors = execute_cells(cells, env, executed=executed_cells, result=result)
+        previously_rendered = {}
+
+    for error in errors:
+        print("############ PRINTING CODE BLOCK TO HELP YOU DIAGNOSE LINE-SPECIFIC ERROR ###############\n\n", error.cell.source)
+        location = f" (Markdown line {error.source_line})" if error.source_line else ""
+        print(f"[Error executing code block: {error}{location}]")
 
     # Gather any callable objects that were defined by the user’s code blocks
     defined_functions = {k: v for k, v in env.items() if callable(v)}
 
-    # Remove code blocks from the final Markdown
-    content_no_blocks = import_pattern.sub("", markdown_content)
+    # Functions marked `# IMPURE::func_name` are called again for every placeholder
+    impure_pattern = re.compile(r"^\s*#\s*IMPURE::(\w+)\s*$", re.MULTILINE)
+    impure_functions = set(impure_pattern.findall(final_code))
+
+    # Per-function table settings, e.g. `# ROWS::func_name=50` or `# TABLE::func_name=longtable`
+    declared_rows = parse_rows_directives(final_code)
+    declared_tables = parse_table_directives(final_code)
+
+    # Collect placeholders first, then evaluate each distinct function once, in document order
+    pure_names = list(dict.fromkeys(
+        placeholder.fn_name for placeholder in document.placeholders if placeholder.fn_name not in impure_functions
+    ))
+    rendered = dict(previously_rendered)
+    to_render = [fn_name for fn_name in pure_names if fn_name not in rendered]
+    parallel_names = [fn_name for fn_name in to_render if fn_name not in deadline_functions]
+    # Spans recorded inside forked workers are lost, so time the whole fan-out instead
+    fan_out = jobs > 1 and len(parallel_names) > 1
+    timer = span(f"embed {len(parallel_names)} functions on {jobs} workers", "embed") if fan_out else nullcontext()
+    with timer:
+        rendered.update(render_in_parallel(render_function, parallel_names, jobs))
+    # Deadlines are kept in this process, where the background refresh can outlive the render
+    for fn_name in to_render:
+        if fn_name in deadline_functions:
+            rendered[fn_name] = render_function(fn_name)
+
+    if session is not None:
+        if session.env is None:
+            session.env, session.executed_cells = env, executed_cells
+        session.cells = cells
+        session.compiled = {cell.digest: cell for cell in cells}
+        # Stale output must not outlive the refresh running in the background
+        session.rendered = {fn_name: text for fn_name, text in rendered.items() if fn_name not in stale_functions}
 
-    # Replace placeholders `EMBED::func_name` with the function's result
-    placeholder_pattern = re.compile(r"`EMBED::(\w+)`")
-    final_content = placeholder_pattern.sub(embed_replacer, content_no_blocks)
+    # Drop the code blocks and replace placeholders `EMBED::func_name` with the function's result
+    final_content = document.render(embed_replacer)
 
     return final_content
@@ -0,0 +1,235 @@
+import io
+import sys
+import math
+import queue
+import atexit
+import signal
+import threading
+import contextlib
+import multiprocessing
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+from .compile_result import CompileResult, Span
+from .python_evaluation import evaluate_python_in_markdown_string, preload_document_libraries, wait_for_background_calls
+
+# Wall-clock budget for evaluating one document, and jobs a worker runs before it's replaced
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_RECYCLE_AFTER = 50
+
+# Seconds a stopping worker gives background EMBED refreshes to finish before exiting, and
+# seconds the parent waits for it before terminating (then killing) it
+REFRESH_GRACE = 4.0
+STOP_GRACE = 5.0
+
+
+class SandboxError(RuntimeError):
+    """Evaluating a document in a sandbox worker failed as a whole (the worker died or raised)."""
+
+
+class EvaluationTimeout(SandboxError):
+    """A document's embedded code ran past the wall-clock timeout; its worker was killed."""
+
+
+@dataclass
+class SandboxLimits:
+    """
+    Bounds on the embedded code of one document.
+
+    `timeout` is wall-clock seconds per document, `memory_mb` caps each worker's address
+    space (RLIMIT_AS, which includes the preloaded libraries) and `cpu_seconds` the CPU time
+    of one document (RLIMIT_CPU). None means unlimited. Workers are replaced after
+    `recycle_after` documents, so leaks and state left behind by one report can't build up.
+    """
+    timeout: Optional[float] = DEFAULT_TIMEOUT
+    memory_mb: Optional[int] = None
+    cpu_seconds: Optional[int] = None
+    recycle_after: int = DEFAULT_RECYCLE_AFTER
+
+
+def _set_limit(limit: int, soft: int) -> None:
+    import resource
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(limit, (soft, hard))
+
+
+def _cpu_time_used() -> float:
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_main(conn: Any, limits: SandboxLimits) -> None:
+    # Runs in the forked worker: evaluate documents sent over `conn` until told to stop
+    import resource
+    # Ctrl+C is the parent's to handle; it kills the workers when it shuts down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Output outside a job (e.g. from a background EMBED refresh) must never reach the
+    # parent's stdout, which may be carrying a PDF
+    sys.stdout = sys.stderr
+    if limits.memory_mb:
+        _set_limit(resource.RLIMIT_AS, limits.memory_mb * 1024 * 1024)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        markdown_content, options = job
+        if limits.cpu_seconds:
+            # RLIMIT_CPU counts the whole process lifetime, so move it along for each job
+            _set_limit(resource.RLIMIT_CPU, math.ceil(_cpu_time_used() + limits.cpu_seconds))
+
+        # Diagnostics, stale EMBED names and profiling spans are sent back for the parent
+        output = io.StringIO()
+        result = CompileResult()
+        try:
+            with contextlib.redirect_stdout(output):
+                evaluated_content = evaluate_python_in_markdown_string(markdown_content, result=result, **options)
+            reply = (evaluated_content, None, output.getvalue(), result.stale_embeds, result.spans)
+        except BaseException as exc:
+            reply = (None, f"{type(exc).__name__}: {exc}", output.getvalue(), result.stale_embeds, result.spans)
+        try:
+            conn.send(reply)
+        except (BrokenPipeError, EOFError):
+            break
+    conn.close()
+    wait_for_background_calls(REFRESH_GRACE)
+
+
+class _Worker:
+    def __init__(self, context: Any, limits: SandboxLimits):
+        self.conn, child_conn = context.Pipe()
+        # Not a daemon, so `jobs` > 1 can still fork render workers of its own
+        self.process = context.Process(target=_worker_main, args=(child_conn, limits), daemon=False)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if not kill:
+            with contextlib.suppress(OSError, ValueError):
+                self.conn.send(None)
+            # Background EMBED refreshes get a few seconds to finish
+            self.process.join(STOP_GRACE)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _describe_exit(exitcode: Optional[int]) -> str:
+    if exitcode is not None and exitcode < 0:
+        try:
+            return f"was killed by {signal.Signals(-exitcode).name}"
+        except ValueError:
+            return f"was killed by signal {-exitcode}"
+    return f"exited with code {exitcode}"
+
+
+class SandboxPool:
+    """
+    Pre-forked worker processes that evaluate the embedded Python of whole documents.
+
+    The workers are forked after pandas & friends are imported, so no job pays for the
+    imports, and each runs under `limits` (see SandboxLimits). A document that overruns its
+    timeout has its worker killed and replaced, so one runaway EMBED function fails its own
+    build instead of stalling every build queued behind it. At most `workers` documents are
+    evaluated at once; further callers wait for a free worker.
+    """
+
+    def __init__(self, workers: int = 1, limits: Optional[SandboxLimits] = None):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("The evaluation sandbox needs the 'fork' start method (Linux or macOS).")
+        self.limits = limits or SandboxLimits()
+        self.workers = max(1, workers)
+        self._context = multiprocessing.get_context("fork")
+        preload_document_libraries()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(self.workers):
+            self._idle.put(_Worker(self._context, self.limits))
+        self._retiring: List[threading.Thread] = []
+        self._retiring_lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def evaluate(self, markdown_content: str, result: Optional[CompileResult] = None, **options: Any) -> str:
+        """
+        Evaluate a Markdown string on a free worker; takes the same keyword arguments as
+        `evaluate_python_in_markdown_string` (except `session`, whose state lives in-process).
+        """
+        worker = self._idle.get()
+        replace = False
+        try:
+            evaluated_content, error, output, stale_embeds, spans = self._run(worker, markdown_content, options)
+        except SandboxError:
+            replace = True
+            raise
+        finally:
+            if replace or worker.jobs >= self.limits.recycle_after:
+                self._retire(worker, kill=replace)
+                worker = _Worker(self._context, self.limits)
+            self._idle.put(worker)
+
+        if output:
+            print(output, end="")
+        if result is not None:
+            result.stale_embeds.extend(stale_embeds)
+            result.spans.extend(spans)
+        if error is not None:
+            raise SandboxError(f"Evaluating the document failed: {error}")
+        return evaluated_content
+
+    def _run(
+        self, worker: _Worker, markdown_content: str, options: dict
+    ) -> Tuple[Optional[str], Optional[str], str, List[str], List[Span]]:
+        try:
+            worker.conn.send((markdown_content, options))
+            if not worker.conn.poll(self.limits.timeout):
+                raise EvaluationTimeout(
+                    f"Embedded code did not finish within {self.limits.timeout:g}s; its worker was killed."
+                )
+            reply = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(1)
+            raise SandboxError(
+                f"The sandbox worker {_describe_exit(worker.process.exitcode)} while evaluating the document."
+            )
+        worker.jobs += 1
+        return reply
+
+    def _retire(self, worker: _Worker, kill: bool = False) -> None:
+        # Stop a replaced worker on a thread of its own, off the request path
+        reaper = threading.Thread(target=worker.stop, args=(kill,), name="md2ltx-sandbox-reaper", daemon=True)
+        with self._retiring_lock:
+            self._retiring = [thread for thread in self._retiring if thread.is_alive()] + [reaper]
+        reaper.start()
+
+    def close(self) -> None:
+        """Stop every idle worker and wait for replaced ones to exit. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+        with self._retiring_lock:
+            reapers = list(self._retiring)
+        for reaper in reapers:
+            reaper.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "SandboxPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,259 @@
+import os
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from .main import compile_markdown_to_pdf, compile_markdown_string, resolve_template
+from .compile_result import CompileResult
+from .embed_cache import EmbedCache
+from .dataframe_rendering import DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT
+from .python_evaluation import evaluate_python_in_markdown_string, preload_document_libraries
+from .sandbox import SandboxLimits, SandboxPool
+from .workspace import default_workspace_pool
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix domain socket, one thread per connection."""
+    daemon_threads = True
+
+
+class CompileRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+
+    - POST /compile?template=NAME[&output=PATH][&engine=ENGINE] with Markdown as the request
+      body. Returns the PDF bytes (application/pdf), or JSON with the path when `output` is given.
+    - GET /health returns "ok".
+    - GET /stats returns request counters and scratch space reclaimed as JSON.
+    """
+
+    server_version = "md2ltx"
+
+    def address_string(self) -> str:
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        self._send(status, json.dumps(payload).encode('utf-8'), "application/json")
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, b"ok", "text/plain")
+        elif path == "/stats":
+            self._send_json(200, self.server.compile_service.stats())
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/compile":
+            self._send_json(404, {"error": f"Unknown endpoint {url.path}"})
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError(f"negative Content-Length {length}")
+            markdown_content = self.rfile.read(length).decode('utf-8')
+        except ValueError as exc:
+            # A malformed Content-Length, or a body that isn't UTF-8
+            self._send_json(400, {"error": f"Bad request: {exc}"})
+            return
+
+        try:
+            result = self.server.compile_service.compile(
+                markdown_content, template=params.get("template"), output_pdf=params.get("output"),
+                engine=params.get("engine")
+            )
+        except Exception as exc:
+            self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+
+        headers = {
+            "X-Md2ltx-Wall-Time": f"{result.wall_time:.4f}",
+            "X-Md2ltx-Tex-Passes": str(result.tex_passes),
+            "X-Md2ltx-Tex-Engine": result.engine or "",
+            "X-Md2ltx-Cache-Hit": "1" if result.cache_hit else "0",
+            "X-Md2ltx-Stale-Embeds": ",".join(result.stale_embeds),
+        }
+        if result.pdf_bytes is not None:
+            self._send(200, result.pdf_bytes, "application/pdf", headers)
+        else:
+            self._send_json(200, {
+                "pdf_path": result.pdf_path,
+                "output_size": result.output_size,
+                "stale_embeds": result.stale_embeds,
+                "stages": {s.name: s.wall_time for s in result.stages},
+            })
+
+    def log_message(self, format: str, *args) -> None:
+        print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}")
+
+
+class CompileService:
+    """
+    The compile pipeline behind the server, with the heavy imports already loaded and
+    at most `max_concurrent` builds running at once (further requests wait their turn).
+    With a `sandbox`, embedded Python runs on its pre-forked, resource-limited workers.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        embed_cache: Optional[EmbedCache] = None,
+        max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+        table_format: str = DEFAULT_TABLE_FORMAT,
+        sandbox: Optional[SandboxPool] = None,
+        **compile_options: Any
+    ):
+        self.max_concurrent = max(1, max_concurrent or os.cpu_count() or 1)
+        self.embed_cache = embed_cache
+        self.max_rows = max_rows
+        self.table_format = table_format
+        self.sandbox = sandbox
+        self.compile_options = compile_options
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "active": 0, "failures": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters, max_concurrent=self.max_concurrent)
+        # Scratch space handed out and reclaimed, shared by every build in this process
+        return dict(counters, workspaces=default_workspace_pool().stats())
+
+    def _count(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += delta
+
+    def compile(
+        self,
+        markdown_content: str,
+        template: Optional[str] = None,
+        output_pdf: Optional[str] = None,
+        engine: Optional[str] = None
+    ) -> CompileResult:
+        """
+        Evaluate and compile a Markdown string; returns PDF bytes unless `output_pdf` is given.
+        `engine` overrides the service's TeX engine for this build.
+        """
+        self._count("requests")
+        with self._slots:
+            self._count("active")
+            try:
+                return self._compile(markdown_content, template, output_pdf, engine)
+            except Exception:
+                self._count("failures")
+                raise
+            finally:
+                self._count("active", -1)
+
+    def _compile(
+        self, markdown_content: str, template: Optional[str], output_pdf: Optional[str], engine: Optional[str]
+    ) -> CompileResult:
+        result = CompileResult()
+        compile_options = dict(self.compile_options)
+        if engine:
+            compile_options['engine'] = engine
+        if output_pdf is None:
+            # Nothing needs to land on disk: keep the whole build in memory and scratch space
+            compile_options.pop('build_dirs', None)
+            compile_markdown_string(
+                markdown_content, template=template, result=result, embed_cache=self.embed_cache,
+                max_rows=self.max_rows, table_format=self.table_format, sandbox=self.sandbox, **compile_options
+            )
+            return result
+
+        with result.stage("evaluate"):
+            evaluate = self.sandbox.evaluate if self.sandbox is not None else evaluate_python_in_markdown_string
+            evaluated_content = evaluate(
+                markdown_content, embed_cache=self.embed_cache, max_rows=self.max_rows, table_format=self.table_format,
+                result=result
+            )
+
+        with default_workspace_pool().workspace() as workspace:
+            with result.stage("write_markdown"):
+                temp_md_path = workspace.file("document.md")
+                with open(temp_md_path, 'w', encoding='utf-8') as f:
+                    f.write(evaluated_content)
+
+            # The output path is the document's identity, e.g. for its persistent build directory
+            return compile_markdown_to_pdf(
+                source_file_name_without_extension=os.path.splitext(output_pdf)[0],
+                preprocessed_source_file=temp_md_path,
+                template_content=resolve_template(template),
+                output_pdf=output_pdf,
+                result=result,
+                workspace=workspace,
+                **compile_options
+            )
+
+
+def make_server(
+    service: CompileService,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None
+) -> Tuple[socketserver.BaseServer, str]:
+    """Create (but don't start) an HTTP server on localhost or a Unix socket; returns it and its address."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, CompileRequestHandler)
+        address = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), CompileRequestHandler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.compile_service = service  # type: ignore[attr-defined]
+    return server, address
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None,
+    max_concurrent: Optional[int] = None,
+    embed_cache: Optional[EmbedCache] = None,
+    max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    sandbox_limits: Optional[SandboxLimits] = None,
+    **compile_options: Any
+) -> None:
+    """
+    Run the compile server until interrupted. With `sandbox_limits`, embedded Python runs
+    on a pool of `max_concurrent` sandbox workers under those limits.
+    """
+    preload_document_libraries()
+    service = CompileService(
+        max_concurrent, embed_cache=embed_cache, max_rows=max_rows, table_format=table_format, **compile_options
+    )
+    if sandbox_limits is not None:
+        service.sandbox = SandboxPool(service.max_concurrent, sandbox_limits)
+    server, address = make_server(service, host, port, socket_path)
+    print(f"md2ltx serving on {address} (max {service.max_concurrent} concurrent builds, Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        if service.sandbox is not None:
+            service.sandbox.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from .build_cache import atomic_write, default_cache_dir
+
+DEFAULT_ENGINE = 'pdflatex'
+# Pick the fastest engine that has built the template successfully (see EngineTimings)
+AUTO_ENGINE = 'auto'
+
+# A template can name the engine it wants, e.g. `% ENGINE::xelatex`
+ENGINE_DIRECTIVE_PATTERN = re.compile(r"^%\s*ENGINE::([\w-]+)\s*$", re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class TexEngine:
+    """
+    How to run one TeX engine. Engines that `drive_passes` run once per pass, with
+    md2ltx deciding how many passes are needed (see latex_passes); the others (latexmk,
+    tectonic) rerun TeX themselves and are invoked once. `draft_option` skips writing the
+    PDF on a pass that only collects labels; `formats` engines can load a precompiled
+    format with -fmt (see format_cache).
+    """
+    name: str
+    executable: str
+    drive_passes: bool = True
+    draft_option: Optional[str] = None
+    formats: bool = False
+
+    def pass_command(self, tex_file: str, output_dir: str, draft: bool = False, format_name: Optional[str] = None) -> List[str]:
+        """The command for one pass of a pass-driven engine."""
+        command = [self.executable, '-interaction=nonstopmode']
+        if draft and self.draft_option:
+            command.append(self.draft_option)
+        if format_name and self.formats:
+            command.append(f'-fmt={format_name}')
+        return command + ['-output-directory', output_dir, tex_file]
+
+    def build_command(self, tex_file: str, output_dir: str) -> List[str]:
+        """The single command for an engine that takes care of reruns itself."""
+        if self.name == 'tectonic':
+            return [self.executable, '--keep-logs', '--outdir', output_dir, tex_file]
+        return [self.executable, '-pdf', '-interaction=nonstopmode', '-halt-on-error', f'-outdir={output_dir}', tex_file]
+
+    @property
+    def available(self) -> bool:
+        return _on_path(self.executable)
+
+
+ENGINES = {
+    'pdflatex': TexEngine('pdflatex', 'pdflatex', draft_option='-draftmode', formats=True),
+    'xelatex': TexEngine('xelatex', 'xelatex', draft_option='-no-pdf', formats=True),
+    'lualatex': TexEngine('lualatex', 'lualatex', draft_option='-draftmode'),
+    'latexmk': TexEngine('latexmk', 'latexmk', drive_passes=False),
+    'tectonic': TexEngine('tectonic', 'tectonic', drive_passes=False),
+}
+
+ENGINE_CHOICES = list(ENGINES) + [AUTO_ENGINE]
+
+
+@lru_cache(maxsize=None)
+def _on_path(executable: str) -> bool:
+    return shutil.which(executable) is not None
+
+
+def get_engine(name: str) -> TexEngine:
+    """The engine called `name`; raises ValueError for unknown names."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TeX engine '{name}' (choose from {', '.join(ENGINE_CHOICES)}).")
+    return ENGINES[name]
+
+
+def template_engine(template_content: Optional[str]) -> Optional[str]:
+    """The engine a template asks for with an `% ENGINE::name` line, if any."""
+    if not template_content:
+        return None
+    match = ENGINE_DIRECTIVE_PATTERN.search(template_content)
+    return match.group(1) if match else None
+
+
+def requested_engine(engine: Optional[str], template_content: Optional[str]) -> str:
+    """The engine name (or 'auto') a build asked for: the build's own choice, else the template's, else pdflatex."""
+    return engine or template_engine(template_content) or DEFAULT_ENGINE
+
+
+class EngineTimings:
+    """
+    Measured TeX times per template and engine, kept in `engine_timings.json` in the cache
+    directory, behind `--engine auto`.
+
+    Each template is built once with every installed engine it hasn't been tried with yet;
+    after that it is built with the engine that was fastest on average. An engine that fails
+    on a template is never picked for it again (the build falls back to pdflatex).
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        directory = directory or default_cache_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'engine_timings.json')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(template_content: Optional[str]) -> str:
+        if not template_content:
+            return 'default'
+        return hashlib.sha256(template_content.encode('utf-8')).hexdigest()[:32]
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, template_key: str, engine: str, **changes: float) -> None:
+        with self._lock:
+            timings = self._load()
+            entry = timings.setdefault(template_key, {}).setdefault(engine, {"builds": 0, "seconds": 0.0, "failures": 0})
+            for field, delta in changes.items():
+                entry[field] += delta
+            atomic_write(self.path, json.dumps(timings, indent=2, sort_keys=True).encode('utf-8'))
+
+    def record(self, template_key: str, engine: str, seconds: float) -> None:
+        self._update(template_key, engine, builds=1, seconds=seconds)
+
+    def record_failure(self, template_key: str, engine: str) -> None:
+        self._update(template_key, engine, failures=1)
+
+    def choose(self, template_key: str) -> str:
+        """The engine to build `template_key` with next."""
+        with self._lock:
+            measured = self._load().get(template_key, {})
+        candidates = [engine for engine in ENGINES.values() if engine.available]
+        for engine in candidates:
+            if engine.name not in measured:
+                return engine.name
+        working = {
+            engine.name: measured[engine.name]["seconds"] / measured[engine.name]["builds"]
+            for engine in candidates
+            if not measured[engine.name]["failures"] and measured[engine.name]["builds"]
+        }
+        return min(working, key=working.get) if working else DEFAULT_ENGINE
+
+    def stats(self) -> str:
+        """Mean TeX time per template and engine, for `--engine_stats`."""
+        lines = []
+        for template_key, engines in sorted(self._load().items()):
+            lines.append(f"template {template_key}:")
+            for name, entry in sorted(engines.items()):
+                mean = f"{entry['seconds'] / entry['builds']:.3f}s mean over {entry['builds']} builds" if entry['builds'] else "no builds"
+                failed = f", {entry['failures']} failed" if entry['failures'] else ""
+                lines.append(f"  {name:<10} {mean}{failed}")
+        return "\n".join(lines) if lines else "No engine timings recorded yet."
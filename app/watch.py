@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+from typing import Any, Dict, List, Optional
+from .main import compile_markdown_to_pdf, resolve_template
+from .compile_result import CompileResult
+from .embed_cache import EmbedCache
+from .dataframe_rendering import DEFAULT_MAX_ROWS, DEFAULT_TABLE_FORMAT
+from .python_evaluation import evaluate_python_in_markdown_string, EvaluationSession
+from .workspace import default_workspace_pool
+
+
+def _snapshot(paths: List[str]) -> Dict[str, Optional[int]]:
+    snapshot = {}
+    for path in paths:
+        try:
+            snapshot[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            snapshot[path] = None
+    return snapshot
+
+
+class DocumentWatcher:
+    """
+    Rebuilds one document whenever it (or a template file) changes, doing only the work
+    whose inputs changed:
+
+    - only the code blocks that changed, and those depending on them, are run again
+      (see EvaluationSession), so edits to the prose alone don't run any Python;
+    - if the evaluated Markdown and template are unchanged, pandoc and TeX are skipped.
+    """
+
+    def __init__(
+        self,
+        source_file: str,
+        output_pdf: Optional[str] = None,
+        template: Optional[str] = None,
+        open_file: bool = False,
+        embed_cache: Optional[EmbedCache] = None,
+        jobs: int = 1,
+        max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+        table_format: str = DEFAULT_TABLE_FORMAT,
+        **compile_options: Any
+    ):
+        self.source_file = source_file
+        self.output_pdf = output_pdf
+        self.template = template
+        self.open_file = open_file
+        self.compile_options = compile_options
+        self.embed_cache = embed_cache
+        self.jobs = jobs
+        self.max_rows = max_rows
+        self.table_format = table_format
+        self.session = EvaluationSession()
+        self._last_build_key: Optional[str] = None
+
+    def watched_paths(self) -> List[str]:
+        paths = [self.source_file]
+        if self.template and os.path.isfile(self.template):
+            paths.append(self.template)
+        return paths
+
+    def build(self) -> Optional[CompileResult]:
+        """Run one incremental build; returns None when the PDF is already up to date."""
+        result = CompileResult()
+        with result.stage("read"):
+            with open(self.source_file, 'r', encoding='utf-8') as f:
+                markdown_content = f.read()
+            template_content = resolve_template(self.template)
+
+        with result.stage("evaluate"):
+            evaluated_content = evaluate_python_in_markdown_string(
+                markdown_content, embed_cache=self.embed_cache, jobs=self.jobs, session=self.session,
+                max_rows=self.max_rows, table_format=self.table_format, result=result
+            )
+
+        build_key = hashlib.sha256(
+            (evaluated_content + "\0" + (template_content or "")).encode('utf-8')
+        ).hexdigest()
+        if build_key == self._last_build_key:
+            return None
+
+        with default_workspace_pool().workspace() as workspace:
+            with result.stage("write_markdown"):
+                temp_md_path = workspace.file("document.md")
+                with open(temp_md_path, 'w', encoding='utf-8') as f:
+                    f.write(evaluated_content)
+
+            compile_markdown_to_pdf(
+                source_file_name_without_extension=os.path.splitext(self.source_file)[0],
+                preprocessed_source_file=temp_md_path,
+                template_content=template_content,
+                output_pdf=self.output_pdf,
+                open_file=self.open_file,
+                result=result,
+                workspace=workspace,
+                **self.compile_options
+            )
+
+        # Only open the viewer on the first build; it refreshes itself afterwards
+        self.open_file = False
+        self._last_build_key = build_key
+        return result
+
+    def run(self, interval: float = 0.5, max_builds: Optional[int] = None) -> None:
+        """Poll the watched files and rebuild on every change until interrupted."""
+        builds = 0
+        last_snapshot: Optional[Dict[str, Optional[int]]] = None
+        print(f"Watching {', '.join(self.watched_paths())} (Ctrl+C to stop)")
+        try:
+            while max_builds is None or builds < max_builds:
+                snapshot = _snapshot(self.watched_paths())
+                if snapshot != last_snapshot and snapshot[self.source_file] is not None:
+                    last_snapshot = snapshot
+                    builds += 1
+                    try:
+                        result = self.build()
+                    except Exception as exc:
+                        print(f"Build failed: {exc}")
+                    else:
+                        if result is None:
+                            print("Evaluated output unchanged; skipped pandoc and TeX.")
+                        else:
+                            print(f"Rebuilt {result.pdf_path} in {result.wall_time:.2f}s")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
@@ -0,0 +1,221 @@
+import os
+import sys
+import atexit
+import signal
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# Emptied workspaces kept for reuse; any beyond this are removed when released
+DEFAULT_MAX_IDLE = 8
+
+
+def scratch_parent() -> Optional[str]:
+    """Where to create scratch directories: $MD2LTX_SCRATCH_DIR, else tmpfs (/dev/shm) when available."""
+    if os.environ.get('MD2LTX_SCRATCH_DIR'):
+        return os.environ['MD2LTX_SCRATCH_DIR']
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+def remove_tree(path: str, keep_root: bool = False) -> Tuple[int, int, int]:
+    """
+    Delete everything under `path`, and `path` itself unless `keep_root`. Returns the
+    number of files and directories removed and the bytes they held.
+    """
+    files = directories = size = 0
+    for root, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(root, d))]:
+            file_path = os.path.join(root, name)
+            try:
+                file_size = os.lstat(file_path).st_size
+                os.remove(file_path)
+            except OSError:
+                continue
+            files += 1
+            size += file_size
+        for name in dirnames:
+            try:
+                os.rmdir(os.path.join(root, name))
+            except OSError:
+                continue
+            directories += 1
+    if not keep_root:
+        try:
+            os.rmdir(path)
+            directories += 1
+        except OSError:
+            pass
+    return files, directories, size
+
+
+class Workspace:
+    """
+    The scratch directory of one build. Everything the build writes goes inside `path`
+    (see `file`); files it has to create elsewhere are registered with `track`. All of it
+    is deleted when the workspace goes back to its pool.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tracked: List[str] = []
+
+    def file(self, name: str) -> str:
+        """Path of a file called `name` inside the workspace."""
+        return os.path.join(self.path, name)
+
+    def track(self, path: str) -> str:
+        """Have a file outside the workspace deleted along with it; returns `path`."""
+        self.tracked.append(path)
+        return path
+
+
+@dataclass
+class ReclaimStats:
+    """What a WorkspacePool has handed out and cleaned up so far."""
+    builds: int = 0
+    workspaces_created: int = 0
+    files: int = 0
+    directories: int = 0
+    bytes: int = 0
+
+    def add(self, files: int, directories: int, size: int) -> None:
+        self.files += files
+        self.directories += directories
+        self.bytes += size
+
+    def __str__(self) -> str:
+        return (
+            f"Scratch space reclaimed: {self.bytes} bytes in {self.files + self.directories} inodes "
+            f"({self.files} files, {self.directories} directories) over {self.builds} builds, "
+            f"{self.workspaces_created} workspaces created"
+        )
+
+
+class WorkspacePool:
+    """
+    Scratch directories for builds, created under `parent` (by default tmpfs where
+    available, see `scratch_parent`) and reused: a released workspace is emptied and kept
+    for the next build, up to `max_idle` of them.
+
+    Workspaces are cleaned up whether the build succeeded or failed, and every directory
+    still around is removed when the pool is closed, which happens at interpreter exit too
+    (see `exit_on_sigterm` for termination by signal).
+    """
+
+    def __init__(self, parent: Optional[str] = None, max_idle: int = DEFAULT_MAX_IDLE):
+        self.parent = parent or scratch_parent()
+        self.max_idle = max_idle
+        self.reclaimed = ReclaimStats()
+        self._idle: List[str] = []
+        self._active: Set[str] = set()
+        self._handed_off: Dict[str, Workspace] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # A forked child inherits the pool but must never clean up the parent's directories
+        self._pid = os.getpid()
+        atexit.register(self.close)
+
+    def acquire(self) -> Workspace:
+        """An empty workspace; hand it back with `release`."""
+        with self._lock:
+            self.reclaimed.builds += 1
+            path = self._idle.pop() if self._idle else None
+            if path is None or not os.path.isdir(path):
+                path = tempfile.mkdtemp(prefix="md2ltx-", dir=self.parent)
+                self.reclaimed.workspaces_created += 1
+            self._active.add(path)
+        return Workspace(path)
+
+    def release(self, workspace: Workspace) -> None:
+        """Delete everything the workspace's build left behind and keep it for reuse."""
+        freed = ReclaimStats()
+        freed.add(*remove_tree(workspace.path, keep_root=True))
+        for path in workspace.tracked:
+            freed.add(*_remove_file(path))
+        with self._lock:
+            self._active.discard(workspace.path)
+            if self._closed or len(self._idle) >= self.max_idle:
+                freed.add(*remove_tree(workspace.path))
+            else:
+                self._idle.append(workspace.path)
+            self.reclaimed.add(freed.files, freed.directories, freed.bytes)
+
+    @contextmanager
+    def workspace(self, handed_off_file: Optional[str] = None) -> Iterator[Workspace]:
+        """
+        A workspace for the duration of the `with` block: the one `handed_off_file` was
+        handed off in (see `hand_off`), if any, else a fresh one.
+        """
+        workspace = (self.claim(handed_off_file) if handed_off_file else None) or self.acquire()
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def hand_off(self, workspace: Workspace) -> None:
+        """
+        Leave an acquired workspace for the next step of the build to `claim` by a file
+        inside it, e.g. the evaluated Markdown `preprocess_markdown_file` returns.
+        """
+        with self._lock:
+            self._handed_off[workspace.path] = workspace
+
+    def claim(self, path: str) -> Optional[Workspace]:
+        """The handed-off workspace holding the file `path`, now the caller's to release; None if there is none."""
+        with self._lock:
+            return self._handed_off.pop(os.path.dirname(os.path.abspath(path)), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                asdict(self.reclaimed), idle=len(self._idle), active=len(self._active), handed_off=len(self._handed_off)
+            )
+
+    def close(self) -> None:
+        """Remove every workspace, including those handed off and never claimed. Safe to call more than once."""
+        with self._lock:
+            if self._closed or os.getpid() != self._pid:
+                return
+            self._closed = True
+            paths, self._idle, self._active = self._idle + list(self._active), [], set()
+            self._handed_off = {}
+        freed = ReclaimStats()
+        for path in paths:
+            freed.add(*remove_tree(path))
+        with self._lock:
+            self.reclaimed.add(freed.files, freed.directories, freed.bytes)
+        atexit.unregister(self.close)
+
+
+def _remove_file(path: str) -> Tuple[int, int, int]:
+    try:
+        size = os.lstat(path).st_size
+        os.remove(path)
+    except OSError:
+        return 0, 0, 0
+    return 1, 0, size
+
+
+_default_pool: Optional[WorkspacePool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_workspace_pool() -> WorkspacePool:
+    """The process-wide pool the compile functions use when they aren't given a workspace."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None or _default_pool._pid != os.getpid():
+            _default_pool = WorkspacePool()
+        return _default_pool
+
+
+def exit_on_sigterm() -> None:
+    """
+    Turn SIGTERM into a normal interpreter exit, so `finally` blocks and the pools' exit
+    handlers still clean up scratch space. Call from the main thread.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
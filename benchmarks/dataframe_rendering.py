@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Rendering benchmark: time DataFrame to table rendering on large and wide DataFrames.
+
+Each frame mixes integer, float (with NaN), boolean, datetime and text columns. Every
+case is rendered both truncated (the default 10 rows) and in full (`max_rows=0`), next
+to the previous row-by-row implementation for reference (full renders of more than
+--legacy-cells cells are skipped for it, as they take minutes).
+
+    python benchmarks/dataframe_rendering.py [--rows 10000 100000 1000000] [--wide-columns 200] [--repeat 3]
+                                             [--table-format pipe|longtable]
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from app.dataframe_rendering import TABLE_FORMATS, render_dataframe  # noqa: E402
+
+
+def make_frame(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    """A frame of `rows` x `columns`, cycling through the common column dtypes."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(columns):
+        kind = i % 5
+        if kind == 0:
+            data[f"id_{i}"] = np.arange(rows, dtype=np.int64)
+        elif kind == 1:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.05] = np.nan
+            data[f"value_{i}"] = values
+        elif kind == 2:
+            data[f"flag_{i}"] = rng.random(rows) < 0.5
+        elif kind == 3:
+            data[f"date_{i}"] = pd.date_range("2020-01-01", periods=rows, freq="min")
+        else:
+            data[f"label_{i}"] = rng.choice(["alpha", "beta|gamma", "delta", None], size=rows)
+    return pd.DataFrame(data)
+
+
+def legacy_dataframe_to_pandoc_pipe(df: pd.DataFrame, max_rows: Optional[int] = 10) -> str:
+    """The previous implementation: one `iloc` lookup and str() call per row."""
+    header = "| " + " | ".join(str(col) for col in df.columns) + " |"
+    separator = "|" + "|".join("---" for _ in df.columns) + "|"
+
+    def row_to_pipe(row_values):
+        return "| " + " | ".join(str(x) for x in row_values) + " |"
+
+    if not max_rows or len(df) <= max_rows:
+        rows = [row_to_pipe(df.iloc[i]) for i in range(len(df))]
+        return "\n".join([header, separator] + rows)
+    head_data = df.head(max_rows // 2)
+    tail_data = df.tail(max_rows - max_rows // 2)
+    head_rows = [row_to_pipe(head_data.iloc[i]) for i in range(len(head_data))]
+    tail_rows = [row_to_pipe(tail_data.iloc[i]) for i in range(len(tail_data))]
+    ellipsis_row = "| " + " | ".join("..." for _ in df.columns) + " |"
+    return "\n".join([header, separator] + head_rows + [ellipsis_row] + tail_rows)
+
+
+def best_time(render: Callable[[], str], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark DataFrame to pipe table rendering.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help="Row counts to render.")
+    parser.add_argument('--columns', type=int, default=10, help="Column count of the narrow frames.")
+    parser.add_argument('--wide-columns', type=int, default=200, help="Column count of the wide frames.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the fastest is reported.")
+    parser.add_argument('--table-format', choices=TABLE_FORMATS, default='pipe', help="Output format to render.")
+    parser.add_argument('--legacy-cells', type=int, default=1_000_000, help="Largest frame (rows x columns) rendered in full by the old implementation.")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'cols':>5} {'max_rows':>9} {'vectorized':>12} {'row loop':>12} {'speedup':>8}")
+    for columns in (args.columns, args.wide_columns):
+        for rows in args.rows:
+            df = make_frame(rows, columns)
+            for max_rows in (10, 0):
+                new = best_time(lambda: render_dataframe(df, args.table_format, max_rows=max_rows), args.repeat)
+                if max_rows or rows * columns <= args.legacy_cells:
+                    old = best_time(lambda: legacy_dataframe_to_pandoc_pipe(df, max_rows=max_rows), 1)
+                    old_text, speedup = f"{old:11.4f}s", f"{old / new:7.1f}x"
+                else:
+                    old_text, speedup = f"{'skipped':>12}", f"{'-':>8}"
+                print(f"{rows:>9} {columns:>5} {max_rows or 'all':>9} {new:11.4f}s {old_text} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: measure what `import app` costs using `python -X importtime`.
+
+Prints the slowest modules, fails (exit code 1) if the package's cumulative import time
+exceeds the budget, or if a heavy library (pandas, numpy, rgwfuncs) is imported eagerly.
+
+    python benchmarks/import_time.py [--budget-ms 150] [--top 15] [--repeat 5]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PACKAGE = 'app'
+HEAVY_MODULES = ('pandas', 'numpy', 'rgwfuncs')
+
+# Lines look like: "import time:       123 |       4567 |   package.module"
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure_once() -> Dict[str, Tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} for one cold `import app`."""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {PACKAGE}'],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Track the import-time cost of the md2ltx package.")
+    parser.add_argument('--budget-ms', type=float, default=150.0, help="Maximum cumulative import time of the package.")
+    parser.add_argument('--top', type=int, default=15, help="How many of the slowest modules to list.")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of cold imports; the fastest is reported.")
+    args = parser.parse_args()
+
+    runs: List[Dict[str, Tuple[int, int]]] = [measure_once() for _ in range(args.repeat)]
+    best = min(runs, key=lambda modules: modules[PACKAGE][1])
+    total_ms = best[PACKAGE][1] / 1000
+
+    print(f"import {PACKAGE}: {total_ms:.1f} ms cumulative (best of {args.repeat}, budget {args.budget_ms:.0f} ms)")
+    print(f"\nSlowest {args.top} modules by self time:")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.2f} ms self  {cumulative_us / 1000:8.2f} ms cumulative  {name}")
+
+    failures = []
+    eager = [name for name in HEAVY_MODULES if name in best]
+    if eager:
+        failures.append(f"heavy modules imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main()
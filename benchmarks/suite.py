@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: time evaluation, DataFrame rendering and whole builds on synthetic documents.
+
+Documents are generated from a seed, varying the amount of prose, the number of code
+blocks and EMBED placeholders and the shape of the DataFrames they embed. Three things are
+measured:
+
+    evaluate/<document>   evaluate_python_in_markdown_string on each document shape
+    dataframe/<shape>     dataframe_to_pandoc_pipe, truncated and in full
+    compile/<template>    preprocess_markdown_file + compile_markdown_to_pdf, once per
+                          built-in template (and without one)
+
+Builds use the stand-in pandoc and pdflatex from benchmarks/stub_toolchain by default, so
+the suite runs without TeX and what it measures is md2ltx's own overhead; pass
+`--toolchain system` to use the real tools on PATH.
+
+Results (best and median of --repeat runs, in seconds) are written as JSON to --output and
+compared with the baseline: a benchmark more than --tolerance slower than its baseline (and
+by at least --min-delta-ms) is a regression, and the exit code is 1. Refresh the baseline
+with --save-baseline on the machine releases are benchmarked on.
+
+    python benchmarks/suite.py [--repeat 5] [--filter compile/] [--output results.json]
+                               [--baseline benchmarks/baseline.json] [--save-baseline]
+                               [--tolerance 0.25] [--toolchain stub|system]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import statistics
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCHMARK_DIR, '..')))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from app.constants import templates  # noqa: E402
+from app.dataframe_rendering import dataframe_to_pandoc_pipe  # noqa: E402
+from app.python_evaluation import evaluate_python_in_markdown_string  # noqa: E402
+from app.main import compile_markdown_to_pdf, preprocess_markdown_file  # noqa: E402
+
+STUB_TOOLCHAIN_DIR = os.path.join(BENCHMARK_DIR, 'stub_toolchain')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+RESULTS_VERSION = 1
+
+WORDS = (
+    "revenue growth quarter region forecast margin customer churn cohort retention segment "
+    "pipeline variance baseline median percentile weekly monthly annual target actual"
+).split()
+
+
+@dataclass
+class DocumentShape:
+    """What a synthetic document contains; see `generate_document`."""
+    name: str
+    paragraphs: int = 10
+    code_blocks: int = 1
+    embeds: int = 2
+    frames: int = 0
+    frame_rows: int = 100
+    frame_columns: int = 5
+
+
+DOCUMENT_SHAPES = [
+    DocumentShape("small"),
+    DocumentShape("prose", paragraphs=2_000, embeds=1),
+    DocumentShape("code_blocks", code_blocks=200, embeds=200),
+    DocumentShape("embeds", embeds=1_000),
+    DocumentShape("frames", frames=20, frame_rows=10_000, frame_columns=10),
+    DocumentShape("wide_frames", frames=5, frame_rows=1_000, frame_columns=200),
+]
+
+# The document every template is built with
+COMPILE_SHAPE = DocumentShape("compile", paragraphs=200, code_blocks=10, embeds=20, frames=5, frame_rows=1_000)
+
+# (rows, columns) rendered on their own; full renders of the largest shape are skipped
+FRAME_SHAPES = [(1_000, 10), (100_000, 10), (1_000, 200)]
+FULL_RENDER_CELLS = 1_000_000
+
+
+def _paragraph(rng: random.Random, words: int = 60) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_document(shape: DocumentShape, seed: int = 0) -> str:
+    """
+    A Markdown report with `shape.paragraphs` paragraphs of prose under a few headings,
+    `shape.code_blocks` code blocks and `shape.embeds` scalar EMBED placeholders spread
+    over them, plus `shape.frames` embedded DataFrames of `frame_rows` x `frame_columns`.
+    The same shape and seed always give the same document.
+    """
+    rng = random.Random(seed)
+    blocks = max(1, shape.code_blocks)
+    sections: List[List[str]] = [[] for _ in range(blocks)]
+
+    # Every block defines its share of the scalar EMBED functions
+    for i in range(shape.embeds):
+        sections[i % blocks].append(f"    def metric_{i}():\n        return round(base_value * {rng.random():.4f}, 2)")
+    for i in range(shape.frames):
+        sections[i % blocks].append(
+            f"    def frame_{i}():\n"
+            f"        values = np.random.default_rng({i}).normal(size=({shape.frame_rows}, {shape.frame_columns}))\n"
+            f"        return pd.DataFrame(values, columns=[f\"col_{{c}}\" for c in range({shape.frame_columns})])"
+        )
+
+    lines = ["---", "title: Synthetic benchmark report", "author: md2ltx", "date: 2024-01-01", "---", ""]
+    paragraphs_per_block = max(1, shape.paragraphs // blocks)
+    written = 0
+    for block in range(blocks):
+        lines.append(f"# Section {block + 1}")
+        lines.append("")
+        lines.append("[START]####")
+        if block == 0:
+            lines.append("    import numpy as np\n    import pandas as pd\n    base_value = 1000")
+        lines.extend(sections[block] or ["    pass"])
+        lines.append("[END]####")
+        lines.append("")
+        while written < shape.paragraphs and written < paragraphs_per_block * (block + 1):
+            lines.append(_paragraph(rng))
+            lines.append("")
+            written += 1
+    while written < shape.paragraphs:
+        lines.append(_paragraph(rng))
+        lines.append("")
+        written += 1
+
+    # Placeholders go after the code, in the prose's own section
+    lines.append("# Results")
+    lines.append("")
+    for i in range(shape.embeds):
+        lines.append(f"Metric {i} came out at `EMBED::metric_{i}`.")
+    for i in range(shape.frames):
+        lines.append("")
+        lines.append(f"`EMBED::frame_{i}`")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def make_frame(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    """Numeric, text and NaN-bearing columns, as in a typical report table."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(columns):
+        if i % 3 == 0:
+            data[f"label_{i}"] = rng.choice(["north", "south", "east", "west"], size=rows)
+        else:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.05] = np.nan
+            data[f"value_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Run `fn` once to warm up, then `repeat` times; best and median wall time."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {"best": round(min(timings), 6), "median": round(statistics.median(timings), 6)}
+
+
+def compile_document(source_file: str, template: Optional[str], output_pdf: str) -> None:
+    """A whole build, as `md2ltx source.md output.pdf --template NAME` runs it."""
+    preprocessed = preprocess_markdown_file(source_file)
+    compile_markdown_to_pdf(
+        source_file, preprocessed, template_content=templates[template] if template else None,
+        output_pdf=output_pdf
+    )
+
+
+def benchmarks(workdir: str) -> Dict[str, Callable[[], Any]]:
+    """Every benchmark, by name, in the order they run."""
+    cases: Dict[str, Callable[[], Any]] = {}
+    for shape in DOCUMENT_SHAPES:
+        markdown = generate_document(shape)
+        cases[f"evaluate/{shape.name}"] = lambda markdown=markdown: evaluate_python_in_markdown_string(markdown)
+
+    for rows, columns in FRAME_SHAPES:
+        df = make_frame(rows, columns)
+        cases[f"dataframe/{rows}x{columns}"] = lambda df=df: dataframe_to_pandoc_pipe(df)
+        if rows * columns <= FULL_RENDER_CELLS:
+            cases[f"dataframe/{rows}x{columns}/full"] = lambda df=df: dataframe_to_pandoc_pipe(df, max_rows=0)
+
+    source_file = os.path.join(workdir, "report.md")
+    with open(source_file, 'w', encoding='utf-8') as f:
+        f.write(generate_document(COMPILE_SHAPE))
+    output_pdf = os.path.join(workdir, "report.pdf")
+    for template in [None] + list(templates):
+        cases[f"compile/{template or 'default'}"] = lambda template=template: compile_document(source_file, template, output_pdf)
+    return cases
+
+
+def run_suite(repeat: int, name_filter: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="md2ltx-bench-")
+    try:
+        for name, fn in benchmarks(workdir).items():
+            if name_filter and name_filter not in name:
+                continue
+            # Evaluation and builds print diagnostics; keep them out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = measure(fn, repeat)
+            print(f"  {name:<36} {results[name]['best']:10.4f}s best  {results[name]['median']:10.4f}s median", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float, min_delta: float) -> List[str]:
+    """Print each benchmark against its baseline; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, timing in results.items():
+        if name not in baseline:
+            print(f"{name:<36} {'-':>10} {timing['best']:9.4f}s {'new':>8}")
+            continue
+        before, after = baseline[name]["best"], timing["best"]
+        change = (after - before) / before if before else 0.0
+        regressed = change > tolerance and after - before > min_delta
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36} {before:9.4f}s {after:9.4f}s {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark md2ltx on synthetic documents and compare with a baseline.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark, after one warm-up run.")
+    parser.add_argument('--filter', help="Only run benchmarks whose name contains this text.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results to compare with.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline instead of comparing.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Slowdown over the baseline tolerated before failing (0.25 = 25%%).")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help="Slowdowns smaller than this are never regressions.")
+    parser.add_argument('--toolchain', choices=('stub', 'system'), default='stub', help="Build with the stand-in pandoc/pdflatex or the real ones.")
+    args = parser.parse_args()
+
+    if args.toolchain == 'stub':
+        os.environ['PATH'] = STUB_TOOLCHAIN_DIR + os.pathsep + os.environ.get('PATH', '')
+    missing = [tool for tool in ('pandoc', 'pdflatex') if shutil.which(tool) is None]
+    if missing:
+        sys.exit(f"Not found on PATH: {', '.join(missing)} (use --toolchain stub)")
+
+    print(f"md2ltx benchmarks ({args.toolchain} toolchain, best of {args.repeat}):")
+    report = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "toolchain": args.toolchain,
+        "repeat": args.repeat,
+        "results": run_suite(args.repeat, args.filter),
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get("toolchain") != args.toolchain:
+        print(f"\nNote: the baseline was measured with the {baseline.get('toolchain')} toolchain.")
+    regressions = compare(report["results"], baseline["results"], args.tolerance, args.min_delta_ms / 1000)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} benchmark(s) more than {args.tolerance:.0%} slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main()
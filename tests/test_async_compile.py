@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+import pytest
+
+from app.async_compile import compile_markdown_to_pdf_async, evaluate_markdown_async
+from app.build_cache import BuildCache
+from app.build_dirs import BuildDirectories
+from app.compile_result import CompileResult
+
+STUB_TOOLCHAIN = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "stub_toolchain")
+
+
+def off_the_loop(cls):
+    """A subclass of `cls` whose calls fail when made on a running event loop."""
+
+    def checked(method):
+        def call(self, *args, **kwargs):
+            with pytest.raises(RuntimeError):
+                asyncio.get_running_loop()
+            return method(self, *args, **kwargs)
+        return call
+
+    methods = {name: checked(getattr(cls, name)) for name in ("key", "get", "put", "path_for", "evict") if hasattr(cls, name)}
+    return type(f"OffTheLoop{cls.__name__}", (cls,), methods)
+
+
+def make_document(name):
+    return f"""
+First: `EMBED::first`. Second: `EMBED::second`.
+
+[START]#########################################################################
+    def first() -> str:
+        return "{name} first"
+
+    def second() -> str:
+        return "{name} second"
+[END]###########################################################################
+"""
+
+
+def test_concurrent_async_evaluations_with_jobs_render_their_own_document():
+    names = ["alpha", "beta", "gamma", "delta"]
+
+    async def evaluate_all():
+        return await asyncio.gather(*(
+            evaluate_markdown_async(make_document(name), CompileResult(), jobs=2) for name in names
+        ))
+
+    for name, output in zip(names, asyncio.run(evaluate_all())):
+        assert f"First: {name} first. Second: {name} second." in output
+
+
+def test_cache_and_build_directories_stay_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", os.path.abspath(STUB_TOOLCHAIN) + os.pathsep + os.environ.get("PATH", ""))
+    cache = off_the_loop(BuildCache)(str(tmp_path / "cache"))
+    build_dirs = off_the_loop(BuildDirectories)(str(tmp_path / "cache"))
+
+    for hit in (False, True):
+        source = tmp_path / "report.md"
+        source.write_text("# Report\n", encoding="utf-8")
+        result = asyncio.run(compile_markdown_to_pdf_async(
+            str(tmp_path / "report"), str(source), output_pdf=str(tmp_path / "report.pdf"),
+            cache=cache, build_dirs=build_dirs
+        ))
+        assert result.cache_hit == hit
+        assert os.path.exists(tmp_path / "report.pdf")
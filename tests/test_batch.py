@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from app.batch import compile_markdown_files
+
+STUB_TOOLCHAIN = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "stub_toolchain")
+
+DOCUMENT = """
+Forked: `EMBED::first` `EMBED::second`
+
+[START]#########################################################################
+    import os
+    evaluator = os.getpid()
+
+    def first() -> str:
+        return str(os.getpid() != evaluator)
+
+    def second() -> str:
+        return str(os.getpid() != evaluator)
+[END]###########################################################################
+"""
+
+
+@pytest.mark.parametrize("jobs, forked", [(1, b"Forked: False False"), (2, b"Forked: True True")])
+def test_batch_passes_jobs_on_to_each_document(tmp_path, monkeypatch, jobs, forked):
+    monkeypatch.setenv("PATH", os.path.abspath(STUB_TOOLCHAIN) + os.pathsep + os.environ.get("PATH", ""))
+    # Keep the heavy document libraries out of the test process
+    monkeypatch.setattr("app.batch.preload_document_libraries", lambda: None)
+    source = tmp_path / "report.md"
+    source.write_text(DOCUMENT, encoding="utf-8")
+    [item] = compile_markdown_files([str(source)], output_dir=str(tmp_path / "out"), workers=1, jobs=jobs)
+    assert item.ok, item.error
+    with open(item.output_pdf, "rb") as f:
+        assert forked in f.read()
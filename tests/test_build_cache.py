@@ -0,0 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.build_cache import BuildCache
+
+
+def test_concurrent_lookups_count_every_miss(tmp_path):
+    cache = BuildCache(str(tmp_path))
+
+    def look_up(index):
+        for _ in range(25):
+            cache.get(f"missing-{index}")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(look_up, range(8)))
+    assert cache.stats()["misses"] == 200
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+import pytest
+
+from app.build_dirs import BuildDirectories
+
+
+def hold_and_report(directory, source_file, ready, done):
+    with BuildDirectories(directory).use(source_file) as path:
+        ready.set()
+        done.wait(10)
+    assert path is not None
+
+
+def test_second_build_of_a_document_falls_back(tmp_path):
+    build_dirs = BuildDirectories(str(tmp_path))
+    with build_dirs.use("/docs/report.md") as first:
+        with build_dirs.use("/docs/report.md") as second:
+            assert first is not None
+            assert second is None
+        with build_dirs.use("/docs/other.md") as other:
+            assert other is not None
+    with build_dirs.use("/docs/report.md") as again:
+        assert again == first
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_build_in_another_process_holds_the_directory(tmp_path):
+    context = multiprocessing.get_context("fork")
+    ready, done = context.Event(), context.Event()
+    holder = context.Process(target=hold_and_report, args=(str(tmp_path), "/docs/report.md", ready, done))
+    holder.start()
+    try:
+        assert ready.wait(10)
+        with BuildDirectories(str(tmp_path)).use("/docs/report.md") as path:
+            assert path is None
+    finally:
+        done.set()
+        holder.join(10)
+    assert holder.exitcode == 0
+
+
+def test_failed_build_resets_aux_state(tmp_path):
+    build_dirs = BuildDirectories(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with build_dirs.use("/docs/report.md") as path:
+            for name in ("document.aux", "document.log", "document.pdf"):
+                with open(os.path.join(path, name), "w") as f:
+                    f.write("x")
+            raise RuntimeError("TeX failed")
+    assert sorted(name for name in os.listdir(path) if not name.startswith(".")) == ["document.pdf"]
+
+
+def test_least_recently_used_directories_are_evicted(tmp_path):
+    build_dirs = BuildDirectories(str(tmp_path), max_bytes=2500)
+    paths = []
+    for index in range(4):
+        with build_dirs.use(f"/docs/{index}.md") as path:
+            with open(os.path.join(path, "document.aux"), "wb") as f:
+                f.write(b"x" * 1000)
+            os.utime(path, (index, index))
+            paths.append(path)
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert not [name for name in os.listdir(build_dirs.directory) if name.startswith(".")]
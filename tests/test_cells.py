@@ -0,0 +1,159 @@
+from app.cells import cell_ids, cells_to_run, execute_cells, make_cell, stale_names
+from app.python_evaluation import EvaluationSession, evaluate_python_in_markdown_string
+
+
+def make_cells(*sources):
+    return [make_cell(source, line) for line, source in enumerate(sources, start=1)]
+
+
+def executed(cells):
+    return set(cell_ids(cells))
+
+
+def test_unchanged_cells_do_not_run():
+    previous = make_cells("x = 1", "y = x + 1")
+    cells = make_cells("x = 1", "y = x + 1")
+    ran = cells_to_run(cells, previous, executed(previous))
+    assert ran == [False, False]
+    assert stale_names(cells, ran, previous) == set()
+
+
+def test_identical_blocks_do_not_rerun():
+    previous = make_cells("import math", "x = 1", "import math", "y = x")
+    cells = make_cells("import math", "x = 1", "import math", "y = x")
+    ran = cells_to_run(cells, previous, executed(previous))
+    assert ran == [False, False, False, False]
+    assert stale_names(cells, ran, previous) == set()
+
+
+def test_removing_one_of_two_identical_blocks():
+    previous = make_cells("import math", "x = 1", "import math")
+    cells = make_cells("import math", "x = 1")
+    ran = cells_to_run(cells, previous, executed(previous))
+    # `math` now comes from the first block, so that one binds it again
+    assert ran == [True, False]
+
+
+def test_edit_reruns_dependent_cells_only():
+    previous = make_cells("x = 1", "y = x + 1", "z = 5")
+    cells = make_cells("x = 2", "y = x + 1", "z = 5")
+    ran = cells_to_run(cells, previous, executed(previous))
+    assert ran == [True, True, False]
+    assert stale_names(cells, ran, previous) == {"x", "y"}
+
+
+def test_function_reading_an_edited_name_goes_stale():
+    previous = make_cells("def helper():\n    return 1", "def report():\n    return helper() + 1", "def other():\n    return 0")
+    cells = make_cells("def helper():\n    return 2", "def report():\n    return helper() + 1", "def other():\n    return 0")
+    ran = cells_to_run(cells, previous, executed(previous))
+    assert ran == [True, True, False]
+    assert stale_names(cells, ran, previous) == {"helper", "report"}
+
+
+def test_earlier_cell_binding_a_rebound_name_runs_again():
+    # `df = df[...]` must never see its own previous output
+    previous = make_cells("df = [1, 2, 3]", "df = df[:2]")
+    cells = make_cells("df = [1, 2, 3]", "df = df[:1]")
+    assert cells_to_run(cells, previous, executed(previous)) == [True, True]
+
+
+def test_failed_cell_runs_again():
+    previous = make_cells("x = 1", "y = undefined_name")
+    cells = make_cells("x = 1", "y = undefined_name")
+    assert cells_to_run(cells, previous, {cell_ids(previous)[0]}) == [False, True]
+
+
+def test_deleted_name_leaves_the_namespace():
+    previous = make_cells("base = 10", "def value():\n    return base")
+    env = {"__builtins__": __builtins__}
+    done = set()
+    execute_cells(previous, env, executed=done)
+    assert env["value"]() == 10
+
+    cells = make_cells("def value():\n    return base")
+    ran, errors = execute_cells(cells, env, previous, done)
+    assert not errors
+    assert "base" not in env
+    assert ran == [True]
+    assert stale_names(cells, ran, previous) == {"base", "value"}
+
+
+DOCUMENT = """
+Value: `EMBED::value`. Other: `EMBED::other`. Tick: `EMBED::tick` `EMBED::tick`.
+
+[START]#########################################################################
+    base = 10
+[END]###########################################################################
+
+[START]#########################################################################
+    def value() -> str:
+        return str(base * 2)
+[END]###########################################################################
+
+[START]#########################################################################
+    import itertools
+    calls = itertools.count(1)
+
+    def other() -> str:
+        return f"other {next(calls)}"
+
+    # IMPURE::tick
+    def tick() -> str:
+        return f"tick {next(calls)}"
+[END]###########################################################################
+"""
+
+
+def test_session_reuses_pure_output_and_recalls_impure_functions():
+    session = EvaluationSession()
+    first = evaluate_python_in_markdown_string(DOCUMENT, session=session)
+    assert "Value: 20. Other: other 1. Tick: tick 2 tick 3." in first
+
+    # Nothing changed: `other` keeps its output, `tick` is called for every placeholder
+    second = evaluate_python_in_markdown_string(DOCUMENT, session=session)
+    assert "Value: 20. Other: other 1. Tick: tick 4 tick 5." in second
+
+
+def test_session_edit_rerenders_dependents_only():
+    session = EvaluationSession()
+    evaluate_python_in_markdown_string(DOCUMENT, session=session)
+    edited = evaluate_python_in_markdown_string(DOCUMENT.replace("base = 10", "base = 21"), session=session)
+    assert "Value: 42. Other: other 1. Tick: tick 4 tick 5." in edited
+
+
+def test_session_deleted_name_is_no_longer_defined():
+    session = EvaluationSession()
+    evaluate_python_in_markdown_string(DOCUMENT, session=session)
+    without_base = DOCUMENT.replace("    base = 10\n", "    pass\n")
+    output = evaluate_python_in_markdown_string(without_base, session=session)
+    assert "Value: [Error calling 'value': name 'base' is not defined]." in output
+    assert "Other: other 1." in output
+
+
+def test_session_with_identical_blocks_runs_each_cell_once(tmp_path):
+    log = tmp_path / "runs.log"
+    document = f"""
+`EMBED::report`
+
+[START]#########################################################################
+    import math
+[END]###########################################################################
+
+[START]#########################################################################
+    with open({str(log)!r}, "a") as f:
+        f.write(str(math.pi))
+[END]###########################################################################
+
+[START]#########################################################################
+    import math
+[END]###########################################################################
+
+[START]#########################################################################
+    def report() -> str:
+        return "done"
+[END]###########################################################################
+"""
+    session = EvaluationSession()
+    for _ in range(3):
+        assert "done" in evaluate_python_in_markdown_string(document, session=session)
+    assert log.read_text().count("3.14") == 1
@@ -0,0 +1,130 @@
+import os
+import subprocess
+
+import pytest
+
+from app.format_cache import FormatCache
+from app.latex_passes import plan_latex_passes, run_latex_passes, typeset
+
+STUB_TOOLCHAIN = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "stub_toolchain")
+
+WITH_LABELS = r"""\documentclass{article}
+\begin{document}
+\section{Intro}\label{intro}
+See section~\ref{intro}.
+\end{document}
+"""
+
+WITHOUT_LABELS = r"""\documentclass{article}
+\begin{document}
+Plain text.
+\end{document}
+"""
+
+BEAMER_TEMPLATE = r"""\documentclass{beamer}
+\begin{document}
+$body$
+\end{document}
+"""
+
+BEAMER = BEAMER_TEMPLATE.replace("$body$", r"\begin{frame}Hello\end{frame}")
+
+
+class VanishingFormats(FormatCache):
+    """Formats that dump but then can't be loaded by the TeX run."""
+
+    def apply(self, tex_path, template_content, engine=None):
+        name = super().apply(tex_path, template_content, engine)
+        os.remove(os.path.join(self.directory, f"{name}.fmt"))
+        return name
+
+
+@pytest.fixture(autouse=True)
+def stub_toolchain(monkeypatch):
+    monkeypatch.setenv("PATH", os.path.abspath(STUB_TOOLCHAIN) + os.pathsep + os.environ.get("PATH", ""))
+
+
+def write_tex(directory, source):
+    path = directory / "document.tex"
+    path.write_text(source, encoding="utf-8")
+    return str(path)
+
+
+def run_plan(tex_file, output_dir, max_passes=5):
+    """Run every pass the planner asks for, returning the commands in order."""
+    commands = []
+    for command in plan_latex_passes(tex_file, output_dir, max_passes):
+        subprocess.run(command, check=True, capture_output=True)
+        commands.append(command)
+    return commands
+
+
+def test_first_build_with_cross_references_starts_with_a_draft_pass(tmp_path):
+    tex_file = write_tex(tmp_path, WITH_LABELS)
+    commands = run_plan(tex_file, str(tmp_path))
+    assert len(commands) == 2
+    assert "-draftmode" in commands[0]
+    assert "-draftmode" not in commands[1]
+    assert (tmp_path / "document.pdf").exists()
+
+
+def test_rebuild_with_unchanged_aux_takes_one_pass(tmp_path):
+    tex_file = write_tex(tmp_path, WITH_LABELS)
+    run_plan(tex_file, str(tmp_path))
+    (tmp_path / "document.pdf").unlink()
+
+    commands = run_plan(tex_file, str(tmp_path))
+    assert len(commands) == 1
+    assert "-draftmode" not in commands[0]
+    assert (tmp_path / "document.pdf").exists()
+
+
+def test_rebuild_with_new_label_reruns(tmp_path):
+    tex_file = write_tex(tmp_path, WITH_LABELS)
+    run_plan(tex_file, str(tmp_path))
+    write_tex(tmp_path, WITH_LABELS.replace("Intro}\\label{intro}", "Intro}\\label{intro}\\label{start}"))
+
+    commands = run_plan(tex_file, str(tmp_path))
+    assert len(commands) == 2
+    assert not any("-draftmode" in command for command in commands)
+
+
+def test_document_without_cross_references_takes_one_pass(tmp_path):
+    tex_file = write_tex(tmp_path, WITHOUT_LABELS)
+    commands = run_plan(tex_file, str(tmp_path))
+    assert len(commands) == 1
+    assert "-draftmode" not in commands[0]
+
+
+def test_single_pass_limit_never_drafts(tmp_path):
+    tex_file = write_tex(tmp_path, WITH_LABELS)
+    commands = run_plan(tex_file, str(tmp_path), max_passes=1)
+    assert len(commands) == 1
+    assert "-draftmode" not in commands[0]
+
+
+def test_run_latex_passes_reports_passes(tmp_path):
+    tex_file = write_tex(tmp_path, WITH_LABELS)
+    pdf_path, _, passes = run_latex_passes(tex_file, str(tmp_path))
+    assert passes == 2
+    assert pdf_path == str(tmp_path / "document.pdf")
+    assert os.path.exists(pdf_path)
+
+    _, _, passes = run_latex_passes(tex_file, str(tmp_path))
+    assert passes == 1
+
+
+def test_beamer_on_a_format_starts_with_a_draft_pass(tmp_path):
+    tex_file = write_tex(tmp_path, BEAMER)
+    _, _, passes = typeset(tex_file, str(tmp_path), BEAMER_TEMPLATE, format_cache=FormatCache(str(tmp_path / "cache")))
+    assert passes == 2
+    assert "\\documentclass" not in (tmp_path / "document.tex").read_text(encoding="utf-8")
+
+
+def test_format_that_fails_to_load_falls_back_to_the_full_source(tmp_path):
+    format_cache = VanishingFormats(str(tmp_path / "cache"))
+    tex_file = write_tex(tmp_path, BEAMER)
+    pdf_path, _, _ = typeset(tex_file, str(tmp_path), BEAMER_TEMPLATE, format_cache=format_cache)
+    with open(pdf_path, "rb") as f:
+        assert b"\\documentclass{beamer}" in f.read()
+    assert format_cache.format_for(BEAMER_TEMPLATE.split("\\begin{document}")[0]) is None
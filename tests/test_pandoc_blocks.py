@@ -0,0 +1,99 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from app.pandoc_blocks import (
+    PandocBlockCache, can_split, convert_markdown_to_latex_by_blocks, heading_identifier, split_blocks, split_front_matter
+)
+
+
+def test_front_matter_is_split_off():
+    front_matter, body = split_front_matter('---\ntitle: "Report"\n---\n\n# Intro\n')
+    assert front_matter == '---\ntitle: "Report"\n---\n'
+    assert body == "\n# Intro\n"
+    assert split_front_matter("# Intro\n") == ("", "# Intro\n")
+
+
+def test_blocks_start_at_headings_outside_code_fences():
+    body = "Preface\n\n# One\n\n```\n# not a heading\n```\n\n## Two\n"
+    assert split_blocks(body) == ["Preface\n\n", "# One\n\n```\n# not a heading\n```\n\n", "## Two\n"]
+
+
+def test_footnotes_and_link_definitions_are_not_split():
+    assert can_split("# One\n\nSee [the docs](https://example.com).\n")
+    assert not can_split("# One\n\nA note.[^1]\n\n[^1]: The note.\n")
+    assert not can_split("# One\n\nSee [the docs][docs].\n\n[docs]: https://example.com\n")
+
+
+def test_block_cache_round_trip(tmp_path):
+    cache = PandocBlockCache(str(tmp_path))
+    key = cache.key("# One\n")
+    assert cache.get(key) is None
+    cache.put(key, "\\section{One}")
+    assert cache.get(key) == "\\section{One}"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+REPEATED_HEADINGS = """---
+title: "Report"
+---
+
+# North
+
+## Results
+
+Sales went up.
+
+# South
+
+## Results
+
+Sales went down, see [the north](#results).
+"""
+
+
+def test_repeated_headings_are_not_split():
+    assert not can_split(REPEATED_HEADINGS)
+    assert not can_split("Results\n=======\n\ntext\n\n# Results\n")
+    assert not can_split("# Overview {#results}\n\n# Results\n")
+
+
+def test_distinct_headings_are_split():
+    assert can_split("# North\n\n## North results\n\n# South\n\n## South results\n")
+    # A heading inside a code block is not a heading
+    assert can_split("# Results\n\n```\n# Results\n```\n")
+
+
+def test_heading_identifier_ignores_formatting_and_link_targets():
+    assert heading_identifier(" *Results* ") == heading_identifier("Results")
+    assert heading_identifier("[Results](https://example.com)") == "results"
+    assert heading_identifier("Results {#final .unnumbered}") == "final"
+    assert heading_identifier("2024") == "section"
+
+
+def test_repeated_headings_fall_back_to_whole_document(tmp_path):
+    cache = PandocBlockCache(str(tmp_path))
+    assert convert_markdown_to_latex_by_blocks(REPEATED_HEADINGS, str(tmp_path / "document.tex"), cache) is None
+    assert not (tmp_path / "document.tex").exists()
+
+
+@pytest.mark.skipif(shutil.which("pandoc") is None, reason="needs pandoc")
+def test_split_matches_whole_document(tmp_path):
+    def whole(markdown):
+        path = tmp_path / "whole.tex"
+        subprocess.run(["pandoc", "-f", "markdown", "-t", "latex", "-s", "-o", str(path)], input=markdown, text=True, check=True)
+        return path.read_text()
+
+    def split(markdown):
+        path = tmp_path / "split.tex"
+        stderr = convert_markdown_to_latex_by_blocks(markdown, str(path), PandocBlockCache(str(tmp_path / "cache")))
+        return whole(markdown) if stderr is None else path.read_text()
+
+    def labels(latex):
+        return re.findall(r"\\label\{([^}]*)\}", latex)
+
+    for markdown in (REPEATED_HEADINGS, REPEATED_HEADINGS.replace("## Results\n\nSales went down", "## Results south\n\nSales went down")):
+        assert labels(split(markdown)) == labels(whole(markdown))
+        assert len(set(labels(split(markdown)))) == len(labels(split(markdown)))
@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.embed_cache import EmbedCache
+from app.python_evaluation import evaluate_python_in_markdown_string, wait_for_background_calls
+
+
+def make_document(name):
+    return f"""
+# {name}
+
+First: `EMBED::first`. Second: `EMBED::second`.
+
+[START]#########################################################################
+    def first() -> str:
+        return "{name} first"
+
+    def second() -> str:
+        return "{name} second"
+[END]###########################################################################
+"""
+
+
+def test_concurrent_parallel_evaluations_render_their_own_document():
+    names = ["alpha", "beta", "gamma", "delta"]
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        outputs = list(executor.map(
+            lambda name: evaluate_python_in_markdown_string(make_document(name), jobs=2), names * 3
+        ))
+    for name, output in zip(names * 3, outputs):
+        assert f"First: {name} first. Second: {name} second." in output
+
+
+def test_missed_deadline_reuses_the_refresh_in_flight(tmp_path):
+    log, slow = tmp_path / "calls.log", tmp_path / "slow"
+    document = f"""
+Data: `EMBED::fetch`.
+
+[START]#########################################################################
+    # DEADLINE::fetch=0.05s
+    import os
+    import time
+
+    def fetch() -> str:
+        with open({str(log)!r}, "a") as f:
+            f.write("call\\n")
+        if os.path.exists({str(slow)!r}):
+            time.sleep(0.5)
+        return "fresh"
+[END]###########################################################################
+"""
+    embed_cache = EmbedCache(str(tmp_path / "cache"))
+    assert "Data: fresh." in evaluate_python_in_markdown_string(document, embed_cache=embed_cache)
+
+    slow.touch()
+    for _ in range(3):
+        assert "Data: fresh." in evaluate_python_in_markdown_string(document, embed_cache=embed_cache)
+    wait_for_background_calls(5)
+    assert log.read_text().count("call") == 2
+
+
+def test_embed_cache_evicts_least_recently_used_results(tmp_path):
+    embed_cache = EmbedCache(str(tmp_path), max_bytes=3500)
+    keys = [embed_cache.key(f"fetch_{index}", "def fetch(): ...", "") for index in range(4)]
+    for index, key in enumerate(keys[:3]):
+        embed_cache.put(key, "x" * 1000)
+        os.utime(os.path.join(embed_cache.directory, f"{key}.pkl"), (index, index))
+    assert embed_cache.get(keys[0])[0]
+
+    embed_cache.put(keys[3], "x" * 1000)
+    assert [embed_cache.get(key)[0] for key in keys] == [True, False, True, True]
@@ -0,0 +1,43 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from app.server import CompileService, make_server
+
+
+@pytest.fixture
+def server():
+    server, _ = make_server(CompileService(max_concurrent=1), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body, headers):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        connection.putrequest("POST", "/compile")
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_malformed_content_length_is_a_bad_request(server):
+    status, payload = post(server, b"# Title\n", {"Content-Length": "eight"})
+    assert status == 400
+    assert "eight" in payload["error"]
+
+
+def test_body_that_is_not_utf8_is_a_bad_request(server):
+    body = "# Café\n".encode("latin-1")
+    status, payload = post(server, body, {"Content-Length": str(len(body))})
+    assert status == 400
+    assert "utf-8" in payload["error"]